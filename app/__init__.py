@@ -1,23 +1,149 @@
 import os
-from flask import Flask, jsonify
+from flask import Flask, jsonify, redirect, request, url_for
 from .extensions import db, bcrypt, login_manager
+# Эти модули нужны при каждом запуске: их импортирует слой сервисов
+# (app/services.py), а включение функции решает конфиг внутри init_app.
+# Откладываются только редкие модули — transfer, jobs, prefork
+# (см. tests/test_startup.py).
+from . import attachments, bus, fragments, idempotency, ratelimit, routing, sessions, sharding, sla, tokens
 from .models import User
 
 
-def create_app(testing: bool = False) -> Flask:
+# Какие интерфейсы обслуживает приложение:
+#  - "api"  — только JSON-API (по умолчанию в тестах);
+#  - "web"  — только веб-интерфейс (по умолчанию в обычном режиме);
+#  - "both" — оба из одного процесса; JSON-API тогда доступен под /api,
+#             потому что адреса /tickets и /users есть у обоих.
+MODES = ("api", "web", "both")
+
+
+def create_app(testing: bool = False, mode: str = None) -> Flask:
     app = Flask(__name__)
 
+    mode = mode or os.getenv("APP_MODE") or ("api" if testing else "web")
+    if mode not in MODES:
+        raise ValueError(f"APP_MODE must be one of {MODES}, got {mode!r}")
+    app.config["APP_MODE"] = mode
+
     # Конфиг
     app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "test-secret")
     app.config["SQLALCHEMY_DATABASE_URI"] = (
-        "sqlite:///:memory:" if testing else "sqlite:///data.db"
+        "sqlite:///:memory:" if testing else os.getenv("DATABASE_URL", "sqlite:///data.db")
     )
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+    # Стоимость bcrypt (2^N раундов). В тестах — минимальная: хеш пароля
+    # считается при каждой регистрации и входе, а стойкость там не нужна.
+    app.config["BCRYPT_LOG_ROUNDS"] = int(os.getenv("BCRYPT_LOG_ROUNDS", 4 if testing else 12))
+
+    # Реплика только для чтения (app/routing.py). Если адрес не задан —
+    # всё работает с одной базой. REPLICA_RYW_SECONDS — сколько секунд
+    # после своей записи пользователь читает из основной базы.
+    app.config["REPLICA_DATABASE_URL"] = os.getenv("REPLICA_DATABASE_URL", "")
+    app.config["REPLICA_RYW_SECONDS"] = float(os.getenv("REPLICA_RYW_SECONDS", 5))
+
+    # Шардирование заявок по автору (app/sharding.py): адреса баз-шардов
+    # через запятую. Пусто — все заявки в основной базе.
+    app.config["TICKET_SHARDS"] = os.getenv("TICKET_SHARDS", "")
+
+    # Очередь фоновых задач (app/jobs.py):
+    # сколько попыток даём задаче, базовая пауза между повторами (сек)
+    # и сколько секунд задача закреплена за воркером.
+    app.config["JOBS_MAX_ATTEMPTS"] = int(os.getenv("JOBS_MAX_ATTEMPTS", 5))
+    app.config["JOBS_BACKOFF_BASE"] = float(os.getenv("JOBS_BACKOFF_BASE", 5))
+    app.config["JOBS_VISIBILITY_TIMEOUT"] = float(os.getenv("JOBS_VISIBILITY_TIMEOUT", 60))
+    # Периодические служебные задачи: как часто чистить выполненные задачи
+    # и файлы вложений без ссылок, и как часто воркер проверяет, что все
+    # периодические задачи стоят в очереди (цепочка могла оборваться,
+    # если задача исчерпала попытки).
+    app.config["JOBS_PRUNE_INTERVAL"] = float(os.getenv("JOBS_PRUNE_INTERVAL", 3600))
+    app.config["ATTACHMENTS_GC_INTERVAL"] = float(os.getenv("ATTACHMENTS_GC_INTERVAL", 3600))
+    app.config["JOBS_SCHEDULE_INTERVAL"] = float(os.getenv("JOBS_SCHEDULE_INTERVAL", 60))
+
+    # Уведомления (app/notifications.py): раз в сколько секунд (не чаще)
+    # пользователю уходит письмо-сводка со всем, что накопилось.
+    app.config["NOTIFY_DIGEST_INTERVAL"] = float(os.getenv("NOTIFY_DIGEST_INTERVAL", 300))
+
+    # Сроки реакции (app/sla.py): "статус:секунд,..." — сколько заявка может
+    # провести в статусе; и как часто фоновая задача ищет просроченные.
+    app.config["SLA_POLICIES"] = os.getenv("SLA_POLICIES", "open:14400,in-progress:86400")
+    app.config["SLA_CHECK_INTERVAL"] = float(os.getenv("SLA_CHECK_INTERVAL", 60))
+
+    # Ограничение попыток входа (app/ratelimit.py): "попыток/секунд".
+    # RATELIMIT_STORAGE — путь к общему SQLite-файлу (пусто — память процесса).
+    app.config["RATELIMIT_ENABLED"] = os.getenv("RATELIMIT_ENABLED", "1") == "1"
+    app.config["RATELIMIT_LOGIN_IP"] = os.getenv("RATELIMIT_LOGIN_IP", "30/60")
+    app.config["RATELIMIT_LOGIN_USER"] = os.getenv("RATELIMIT_LOGIN_USER", "10/60")
+    app.config["RATELIMIT_STORAGE"] = os.getenv("RATELIMIT_STORAGE", "")
+
+    # Токены доступа для API (app/tokens.py): ключи подписи "kid:секрет,..."
+    # (первый — текущий) и срок жизни токена в секундах.
+    app.config["API_TOKEN_KEYS"] = os.getenv("API_TOKEN_KEYS", "")
+    app.config["API_TOKEN_TTL"] = int(os.getenv("API_TOKEN_TTL", 3600))
+
+    # Шина сброса кэшей между процессами (app/bus.py): SQLite-файл журнала
+    # (пусто — выключена, процесс один), как часто процесс читает журнал
+    # (столько секунд другой процесс может видеть устаревший кэш) и сколько
+    # секунд хранятся строки (не меньше срока жизни токена — новый процесс
+    # узнаёт из журнала об отозванных токенах).
+    app.config["INVALIDATION_BUS"] = os.getenv(
+        "INVALIDATION_BUS", "" if testing else os.path.join(app.instance_path, "bus.db")
+    )
+    app.config["INVALIDATION_POLL_INTERVAL"] = float(os.getenv("INVALIDATION_POLL_INTERVAL", 0.5))
+    app.config["INVALIDATION_RETENTION"] = float(
+        os.getenv("INVALIDATION_RETENTION", app.config["API_TOKEN_TTL"])
+    )
+
+    # Сессии на стороне сервера (app/sessions.py): SQLite-файл хранилища
+    # (пусто — память процесса; для нескольких воркеров нужен файл), срок
+    # жизни сессии, размер кэша записей и сколько секунд запись в кэше
+    # считается свежей (столько другие процессы могут не видеть отзыв).
+    app.config["SESSION_STORE"] = os.getenv(
+        "SESSION_STORE", "" if testing else os.path.join(app.instance_path, "sessions.db")
+    )
+    app.config["SESSION_TTL"] = float(os.getenv("SESSION_TTL", 7 * 24 * 3600))
+    app.config["SESSION_CACHE_SIZE"] = int(os.getenv("SESSION_CACHE_SIZE", 10_000))
+    app.config["SESSION_CACHE_TTL"] = float(os.getenv("SESSION_CACHE_TTL", 5))
+    app.config["SESSION_SWEEP_INTERVAL"] = float(os.getenv("SESSION_SWEEP_INTERVAL", 3600))
+
+    # Повторы запросов с Idempotency-Key (app/idempotency.py): сколько
+    # секунд хранится ответ, размер кэша ответов в процессе и как часто
+    # фоновая задача удаляет истёкшие ключи.
+    app.config["IDEMPOTENCY_TTL"] = float(os.getenv("IDEMPOTENCY_TTL", 24 * 3600))
+    app.config["IDEMPOTENCY_CACHE_SIZE"] = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 10_000))
+    app.config["IDEMPOTENCY_SWEEP_INTERVAL"] = float(os.getenv("IDEMPOTENCY_SWEEP_INTERVAL", 3600))
+
+    # Шаблоны (app/fragments.py): каталог для скомпилированного байткода
+    # Jinja (пусто — не сохранять) и размер кэша HTML-фрагментов.
+    app.config["TEMPLATE_CACHE_DIR"] = os.getenv(
+        "TEMPLATE_CACHE_DIR", "" if testing else os.path.join(app.instance_path, "jinja_cache")
+    )
+    app.config["FRAGMENT_CACHE_SIZE"] = int(os.getenv("FRAGMENT_CACHE_SIZE", 10_000))
+
+    # Вложения (app/attachments.py): каталог с файлами и наибольший
+    # размер одного файла в байтах.
+    app.config["ATTACHMENTS_DIR"] = os.getenv(
+        "ATTACHMENTS_DIR", os.path.join(app.instance_path, "attachments")
+    )
+    app.config["ATTACHMENT_MAX_SIZE"] = int(os.getenv("ATTACHMENT_MAX_SIZE", 20 * 1024 * 1024))
+    # USE_X_SENDFILE=1 — файл отдаёт сам веб-сервер перед приложением
+    # (nginx/Apache), приложение только проверяет права и ставит заголовок.
+    app.config["USE_X_SENDFILE"] = os.getenv("USE_X_SENDFILE", "0") == "1"
+
     # Расширения
     db.init_app(app)
     bcrypt.init_app(app)
     login_manager.init_app(app)
+    bus.init_app(app)
+    ratelimit.init_app(app)
+    tokens.init_app(app)
+    fragments.init_app(app)
+    routing.init_app(app)
+    sharding.init_app(app)
+    attachments.init_app(app)
+    sla.init_app(app)
+    sessions.init_app(app)
+    idempotency.init_app(app)
 
     # Flask-Login: без редиректов на /login для API
     login_manager.login_view = None
@@ -27,23 +153,39 @@ def create_app(testing: bool = False) -> Flask:
     def load_user(user_id: str):
         return User.query.get(int(user_id))
 
+    # Если в сессии пользователя нет, пробуем заголовок
+    # "Authorization: Bearer <токен>" — проверка без обращения к базе.
+    @login_manager.request_loader
+    def load_user_from_request(req):
+        return tokens.user_from_request(req)
+
     @login_manager.unauthorized_handler
     def unauthorized():
-        # Для API-тестов
+        # Страницы веб-интерфейса отправляют гостя на форму входа,
+        # JSON-API отвечает 401.
+        if request.blueprint == "web":
+            return redirect(url_for("web.web_login"))
         return jsonify({"error": "unauthorized"}), 401
 
-    # === Режим тестов: только JSON-API ===
-    if testing:
+    # Консольные команды (экспорт/импорт данных и т.п.)
+    from .commands import register_commands
+    register_commands(app)
+
+    # === JSON-API (режимы "api" и "both") ===
+    if mode in ("api", "both"):
         from .api.auth_api import auth_api
         from .api.tickets_api import tickets_api
         from .api.admin_api import admin_api
+        from .api.notifications_api import notifications_api
 
-        app.register_blueprint(auth_api)
-        app.register_blueprint(tickets_api)
-        app.register_blueprint(admin_api)
+        prefix = "/api" if mode == "both" else None
+        app.register_blueprint(auth_api, url_prefix=prefix)
+        app.register_blueprint(tickets_api, url_prefix=prefix)
+        app.register_blueprint(admin_api, url_prefix=prefix)
+        app.register_blueprint(notifications_api, url_prefix=prefix)
 
-    # === Обычный режим: только веб-интерфейс ===
-    else:
+    # === Веб-интерфейс (режимы "web" и "both") ===
+    if mode in ("web", "both"):
         from .web import web_bp
         app.register_blueprint(web_bp)
 
@@ -1,8 +1,14 @@
+# io — чтобы читать тело запроса построчно при импорте.
+import io
+from datetime import datetime
+
 # Импортируем инструменты из Flask:
 # Blueprint — позволяет создавать отдельные "разделы" API.
 # request — содержит данные, которые прислал клиент.
 # jsonify — превращает данные Python в JSON для ответа.
-from flask import Blueprint, request, jsonify
+# Response и stream_with_context нужны для потоковой выдачи больших выгрузок.
+
+from flask import Blueprint, request, jsonify, Response, stream_with_context, url_for
 
 # Импортируем инструменты Flask-Login:
 # login_required — не пускает на маршрут, если пользователь не авторизован.
@@ -12,38 +18,53 @@ from flask_login import login_required, current_user
 # Подключаем объект базы данных, чтобы читать и изменять записи в таблицах
 from app.extensions import db
 
-# Импортируем модель User — класс, который соответствует таблице пользователей
-from app.models import User
+# Ошибка базы при нарушении уникальности (например, повторный импорт тех же id)
+from sqlalchemy.exc import IntegrityError
+
+# Общий слой логики: права доступа и работа с пользователями
+from app import services
+from app.services import Forbidden, ServiceError
+
+# Декоратор для обработчиков, которые только читают (могут идти на реплику)
+from app.routing import read_only
+
+# Повтор с тем же Idempotency-Key возвращает сохранённый ответ
+from app.idempotency import idempotent
 
 # Создаём новый API-раздел (Blueprint) под названием "admin_api".
 # Это отдельный логический модуль для маршрутов администратора.
 admin_api = Blueprint("admin_api", __name__)
 
 
+# Нет прав — одинаковый ответ для всех маршрутов этого раздела.
+@admin_api.errorhandler(Forbidden)
+def forbidden(e):
+    return jsonify({"error": "forbidden"}), 403
+
+
 # ============================================================
 # 1. Маршрут: ПОЛУЧЕНИЕ СПИСКА ВСЕХ ПОЛЬЗОВАТЕЛЕЙ
 # ============================================================
 
-# @admin_api.get("/users") означает:
-# "Когда приходит GET-запрос по адресу /users, вызывай эту функцию".
+# # GET /users?q=<начало имени>&after=<имя>&limit=50 — страница каталога
+# пользователей по алфавиту, с числом заявок каждого.
+# Ссылка на следующую страницу — в заголовке Link (rel="next").
 @admin_api.get("/users")
+@read_only  # Только чтение — можно с реплики
 @login_required  # Этот маршрут закрыт — его может вызвать только авторизованный пользователь
 def list_users():
-    # Проверяем: является ли текущий пользователь администратором?
-    # Если его роль не 'admin', то он не имеет прав видеть список всех пользователей.
-    if current_user.role != "admin":
-        return jsonify({"error": "forbidden"}), 403  # 403 означает "Доступ запрещён"
-
-    # Если администратор — получаем всех пользователей из базы
-    # User.query.all() — выбирает *все строки* из таблицы User
-    # Далее в цикле формируем список словарей (id, имя, роль)
-    users = [
-        {"id": u.id, "username": u.username, "role": u.role}
-        for u in User.query.all()
-    ]
+    # Только администратор может видеть список всех пользователей
+    # (иначе services.list_users бросит Forbidden → ответ 403 "Доступ запрещён").
+    limit = min(max(request.args.get("limit", services.USERS_PAGE, type=int), 1), 500)
+    prefix = request.args.get("q", "").strip()
+    users, next_after = services.list_users(current_user, prefix, request.args.get("after"), limit)
 
     # Возвращаем список пользователей в формате JSON
-    return jsonify(users), 200  # 200 — успешный код ответа
+    response = jsonify(users)
+    if next_after is not None:
+        next_url = url_for("admin_api.list_users", q=prefix or None, after=next_after, limit=limit)
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return response, 200  # 200 — успешный код ответа
 
 
 # ============================================================
@@ -56,34 +77,213 @@ def list_users():
 @admin_api.put("/users/<int:user_id>")
 @login_required
 def update_user_role_api(user_id: int):
-
-    # Проверяем, что текущий пользователь — администратор.
-    if current_user.role != "admin":
-        return jsonify({"error": "forbidden"}), 403
-
-    # Ищем пользователя в базе по ID.
-    # get_or_404 выдаёт ошибку 404, если пользователь не найден.
-    user = User.query.get_or_404(user_id)
-
     # Получаем JSON-данные из запроса.
     # Если данных нет, то подставляем пустой словарь.
     data = request.get_json() or {}
 
-    # Берём новое значение роли, которое указал клиент.
-    new_role = data.get("role")
-
-    # Проверяем, корректно ли указана роль.
-    # Допускаются только "admin" и "user".
-    if new_role not in ("user", "admin"):
-        return jsonify({"error": "invalid role"}), 400
-
-    # Записываем новую роль пользователю
-    user.role = new_role
-
-    # Сохраняем изменения в базе данных
-    db.session.commit()
+    # Проверка прав (только админ), поиск пользователя (404, если нет),
+    # проверка роли ("admin" или "user"), сохранение и отзыв токенов
+    # пользователя — в общем слое app/services.py.
+    try:
+        user = services.set_role(current_user, user_id, data.get("role"))
+    except ServiceError as e:
+        return jsonify({"error": e.error}), 400
 
     # Возвращаем обновлённые данные пользователя
     return jsonify(
         {"id": user.id, "username": user.username, "role": user.role}
     ), 200
+
+
+# ============================================================
+# 3. Маршрут: ПОТОКОВЫЙ ЭКСПОРТ ПОЛЬЗОВАТЕЛЕЙ ИЛИ ЗАЯВОК
+# ============================================================
+
+# GET /admin/export/users?format=csv — выгрузка всех пользователей в CSV.
+# GET /admin/export/tickets?format=ndjson — выгрузка заявок построчным JSON.
+# Ответ отдаётся потоком: данные читаются из базы кусками и сразу
+# отправляются клиенту, в памяти не собирается весь файл.
+@admin_api.get("/admin/export/<kind>")
+@read_only  # Только чтение — можно с реплики
+@login_required
+def export_data_api(kind: str):
+    services.require_admin(current_user)
+
+    from app import transfer
+
+    fmt = request.args.get("format", "ndjson")
+    chunk_size = request.args.get("chunk_size", transfer.CHUNK_SIZE, type=int)
+    if kind not in transfer.KINDS or fmt not in transfer.FORMATS:
+        return jsonify({"error": "unknown kind or format"}), 400
+
+    # stream_with_context — чтобы генератор мог обращаться к базе
+    # уже после того, как функция-обработчик вернула ответ.
+    return Response(
+        stream_with_context(transfer.export_stream(kind, fmt, max(chunk_size, 1))),
+        mimetype=transfer.FORMATS[fmt],
+        headers={"Content-Disposition": f"attachment; filename={kind}.{fmt}"},
+    )
+
+
+# ============================================================
+# 4. Маршрут: ИМПОРТ ПОЛЬЗОВАТЕЛЕЙ ИЛИ ЗАЯВОК
+# ============================================================
+
+# POST /admin/import/users?format=csv&offset=0 — тело запроса содержит файл.
+# Тело читается построчно прямо из входного потока, строки вставляются
+# пачками. Если импорт оборвался, клиент повторяет запрос с тем же файлом
+# и offset из последнего ответа — уже сохранённые строки будут пропущены.
+# С заголовком Idempotency-Key повтор того же запроса (тот же offset)
+# возвращает ответ первого, не вставляя строки второй раз.
+@admin_api.post("/admin/import/<kind>")
+@login_required
+@idempotent
+def import_data_api(kind: str):
+    services.require_admin(current_user)
+
+    from app import transfer
+
+    fmt = request.args.get("format", "ndjson")
+    offset = request.args.get("offset", 0, type=int)
+    batch_size = request.args.get("batch_size", transfer.BATCH_SIZE, type=int)
+    if kind not in transfer.KINDS or fmt not in transfer.FORMATS:
+        return jsonify({"error": "unknown kind or format"}), 400
+
+    # Сюда записываем, сколько строк уже точно сохранено в базе.
+    progress = {"offset": offset}
+
+    def remember(done: int):
+        progress["offset"] = done
+
+    lines = io.TextIOWrapper(request.stream, encoding="utf-8", newline="")
+    try:
+        done = transfer.import_rows(
+            kind,
+            transfer.parse_rows(lines, fmt),
+            start=offset,
+            batch_size=max(batch_size, 1),
+            on_batch=remember,
+        )
+    except (ValueError, IntegrityError) as e:  # TransferError — тоже ValueError
+        db.session.rollback()
+        return jsonify({"error": str(e).splitlines()[0], "offset": progress["offset"]}), 400
+
+    return jsonify({"imported": done - offset, "offset": done}), 200
+
+
+# ============================================================
+# 5. Маршруты: СОСТОЯНИЕ ОЧЕРЕДИ ФОНОВЫХ ЗАДАЧ
+# ============================================================
+
+# GET /admin/jobs — сколько задач ждёт, выполняется, готово и упало.
+@admin_api.get("/admin/jobs")
+@login_required
+def jobs_stats_api():
+    services.require_admin(current_user)
+
+    from app import jobs
+
+    return jsonify(jobs.stats()), 200
+
+
+# GET /admin/jobs/failed?limit=50 — последние упавшие задачи с текстом ошибки.
+@admin_api.get("/admin/jobs/failed")
+@login_required
+def jobs_failed_api():
+    services.require_admin(current_user)
+
+    from app import jobs
+    from app.models import Job
+
+    limit = min(request.args.get("limit", 50, type=int), 500)
+    failed = (
+        Job.query.filter_by(status="failed")
+        .order_by(Job.updated_at.desc())
+        .limit(limit)
+        .all()
+    )
+    return jsonify([jobs.serialize(j) for j in failed]), 200
+
+
+# POST /admin/jobs/<id>/retry — вернуть упавшую задачу в очередь.
+@admin_api.post("/admin/jobs/<int:job_id>/retry")
+@login_required
+def jobs_retry_api(job_id: int):
+    services.require_admin(current_user)
+
+    from app.models import Job
+
+    j = Job.query.get_or_404(job_id)
+    if j.status != "failed":
+        return jsonify({"error": "job is not failed"}), 400
+
+    # Даём задаче ещё одну серию попыток.
+    j.status = "queued"
+    j.attempts = 0
+    j.run_at = datetime.utcnow()
+    db.session.commit()
+    return jsonify({"id": j.id, "status": j.status}), 200
+
+
+# ============================================================
+# 6. Маршрут: СЧЁТЧИКИ ПРОЦЕССА
+# ============================================================
+
+# GET /admin/metrics — например, сколько попыток входа было отклонено
+# ограничителем (ratelimit.throttled.ip / ratelimit.throttled.user).
+@admin_api.get("/admin/metrics")
+@login_required
+def metrics_api():
+    services.require_admin(current_user)
+
+    from app import metrics
+
+    return jsonify(metrics.snapshot()), 200
+
+
+# ============================================================
+# 7. Маршрут: ОТЧЁТ ПО ЗАЯВКАМ
+# ============================================================
+
+# GET /reports/tickets?from=2024-01-01&to=2024-03-31&interval=week
+# Создано/закрыто и медианное время решения по дням или неделям.
+# Читаются только готовые итоги по дням (app/reports.py), не заявки.
+# По умолчанию — последние 30 дней по дням.
+@admin_api.get("/reports/tickets")
+@read_only  # Только чтение — можно с реплики
+@login_required
+def ticket_report_api():
+    try:
+        report = services.ticket_report(
+            current_user,
+            request.args.get("from"),
+            request.args.get("to"),
+            request.args.get("interval", "day"),
+        )
+    except ServiceError as e:
+        return jsonify({"error": e.error}), 400
+    return jsonify(report), 200
+
+
+# ============================================================
+# 8. Маршруты: СЕССИИ ПОЛЬЗОВАТЕЛЯ
+# ============================================================
+
+# GET /admin/users/<id>/sessions — активные сессии веб-интерфейса
+# (id сессии — начало ключа в хранилище, не сама cookie).
+@admin_api.get("/admin/users/<int:user_id>/sessions")
+@login_required
+def list_sessions_api(user_id: int):
+    return jsonify(services.list_sessions(current_user, user_id)), 200
+
+
+# DELETE /admin/users/<id>/sessions              — завершить все сессии;
+# DELETE /admin/users/<id>/sessions/<session_id> — завершить одну.
+@admin_api.delete("/admin/users/<int:user_id>/sessions")
+@admin_api.delete("/admin/users/<int:user_id>/sessions/<session_id>")
+@login_required
+def revoke_sessions_api(user_id: int, session_id: str = None):
+    revoked = services.revoke_sessions(current_user, user_id, session_id)
+    if session_id is not None and not revoked:
+        return jsonify({"error": "session not found"}), 404
+    return jsonify({"revoked": revoked}), 200
@@ -1,7 +1,7 @@
 # Импортируем функцию Blueprint из Flask.
 # Blueprint — это способ логически разделить наше приложение на отдельные "модули" (разделы).
 # В данном случае у нас будет отдельный модуль для API авторизации (регистрация, вход, выход).
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 
 # Импортируем функции из Flask-Login:
 # - login_user — "залогинить" пользователя, то есть сохранить информацию о входе в систему.
@@ -9,11 +9,15 @@ from flask import Blueprint, request, jsonify
 # - login_required — специальный декоратор, который не пускает на маршрут, если пользователь не авторизован.
 from flask_login import login_user, logout_user, login_required
 
-# Импортируем объект db — это наша база данных, через которую мы будем сохранять и читать данные.
-from app.extensions import db
+# Общий слой логики (регистрация и проверка пароля) — тот же, что у веб-интерфейса.
+from app import services
+from app.services import ServiceError
 
-# Импортируем модель User — это класс, который описывает таблицу пользователей в базе.
-from app.models import User
+# Ограничение частоты попыток входа (token bucket).
+from app.ratelimit import check_login
+
+# Подписанные токены доступа для API.
+from app import tokens
 
 
 # Создаём Blueprint с именем "auth_api".
@@ -43,36 +47,15 @@ def register():
     # Аналогично достаём пароль.
     password = (data.get("password") or "").strip()
 
-    # Проверяем, что пользователь действительно прислал и логин, и пароль.
-    # Если username пустой ИЛИ password пустой, значит данные введены некорректно.
-    if not username or not password:
-        # jsonify(...) — превращает словарь в JSON-ответ.
+    # Проверки (логин и пароль заполнены, имя свободно) и создание
+    # пользователя — в общем слое app/services.py, тот же код вызывает
+    # и веб-регистрация. При регистрации роль всегда "user".
+    # Пароль хранится не сам, а в виде хеша (bcrypt) — это безопаснее.
+    try:
+        user = services.register_user(username, password)
+    except ServiceError as e:
         # Возвращаем ошибку и HTTP-код 400 (Bad Request — неправильный запрос).
-        return jsonify({"error": "username and password required"}), 400
-
-    # Проверяем, существует ли уже пользователь с таким именем.
-    # User.query.filter_by(username=username).first() — поиск в базе по полю username.
-    # Если пользователь найден — выражение вернёт объект User, если нет — None.
-    if User.query.filter_by(username=username).first():
-        # Если такой пользователь уже есть — возвращаем ошибку.
-        return jsonify({"error": "user exists"}), 400
-
-    # Если всё хорошо — создаём нового пользователя.
-    # Передаём username и роль. По условию — при регистрации обычный пользователь всегда
-    # должен иметь роль "user" (не администратор).
-    user = User(username=username, role="user")
-
-    # Устанавливаем пароль пользователю.
-    # user.set_password(password) — это не просто сохранение пароля, а его шифрование (хеширование).
-    # В базе хранится не сам пароль, а его зашифрованная версия — это безопаснее.
-    user.set_password(password)
-
-    # Добавляем нового пользователя в сессию базы данных.
-    # Пока это только "подготовка" к сохранению.
-    db.session.add(user)
-
-    # Сохраняем изменения окончательно — теперь запись реально попадает в базу.
-    db.session.commit()
+        return jsonify({"error": e.error}), 400
 
     # Формируем JSON-ответ с данными созданного пользователя.
     # Мы возвращаем id, username и role — чтобы клиент (например, Postman или фронтенд) понимал,
@@ -101,14 +84,17 @@ def login():
     if not username or not password:
         return jsonify({"error": "username and password required"}), 400
 
-    # Ищем пользователя в базе по имени.
-    user = User.query.filter_by(username=username).first()
-
-    # Проверяем:
-    # 1) Нашёлся ли пользователь (user не None)
-    # 2) Совпадает ли пароль (user.check_password(password) возвращает True, если пароль правильный)
-    if not user or not user.check_password(password):
-        # Если либо пользователя нет, либо пароль неправильный — возвращаем ошибку.
+    # Сначала проверяем лимит попыток входа (по IP и по имени).
+    # Это делается ДО поиска пользователя и bcrypt, чтобы поток
+    # попыток не загружал процессор проверкой паролей.
+    retry_after = check_login(username)
+    if retry_after:
+        return jsonify({"error": "too many attempts"}), 429, {"Retry-After": str(retry_after)}
+
+    # Проверяем логин и пароль (services.authenticate вернёт None,
+    # если пользователя нет или пароль неправильный).
+    user = services.authenticate(username, password)
+    if user is None:
         return jsonify({"error": "invalid credentials"}), 400
 
     # Если всё хорошо — "логиним" пользователя.
@@ -120,6 +106,38 @@ def login():
     return jsonify({"message": "ok", "role": user.role}), 200
 
 
+# ------------ ВЫДАЧА ТОКЕНА ДОСТУПА ------------
+
+# POST /token — то же, что /login, но вместо cookie-сессии возвращает
+# подписанный токен. Клиент передаёт его в заголовке
+# "Authorization: Bearer <токен>", и сервер проверяет его без базы данных.
+@auth_api.post("/token")
+def issue_token():
+    data = request.get_json() or {}
+    username = (data.get("username") or "").strip()
+    password = (data.get("password") or "").strip()
+
+    if not username or not password:
+        return jsonify({"error": "username and password required"}), 400
+
+    # Тот же лимит попыток, что и у /login.
+    retry_after = check_login(username)
+    if retry_after:
+        return jsonify({"error": "too many attempts"}), 429, {"Retry-After": str(retry_after)}
+
+    user = services.authenticate(username, password)
+    if user is None:
+        return jsonify({"error": "invalid credentials"}), 400
+
+    return jsonify(
+        {
+            "access_token": tokens.issue(user),
+            "token_type": "Bearer",
+            "expires_in": current_app.config["API_TOKEN_TTL"],
+        }
+    ), 200
+
+
 # ------------ ВЫХОД ПОЛЬЗОВАТЕЛЯ ------------
 
 # Выход из системы — POST-запрос на /logout.
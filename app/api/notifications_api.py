@@ -0,0 +1,67 @@
+# Импортируем нужные инструменты Flask
+from flask import Blueprint, request, jsonify
+
+# login_required — только для вошедших; current_user — кто вошёл
+from flask_login import login_required, current_user
+
+# Общий слой логики: уведомления пользователя
+from app import services
+
+# Декоратор для обработчиков, которые только читают (могут идти на реплику)
+from app.routing import read_only
+
+# Создаём Blueprint для уведомлений пользователя.
+# Уведомления создаёт фоновая задача (app/notifications.py), здесь их только
+# читают и отмечают прочитанными. Каждый видит только свои уведомления.
+notifications_api = Blueprint("notifications_api", __name__)
+
+
+# ============================================================
+# 1. СПИСОК УВЕДОМЛЕНИЙ
+# ============================================================
+
+# GET /notifications?before=<id>&limit=50&unread=1 — новые сверху.
+# Следующая страница — before=<id последнего уведомления на странице>.
+@notifications_api.get("/notifications")
+@read_only
+@login_required
+def list_notifications():
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 500)
+    rows = services.list_notifications(
+        current_user,
+        before=request.args.get("before", type=int),
+        limit=limit,
+        unread_only=request.args.get("unread") == "1",
+    )
+    return jsonify([services.notification_dict(n) for n in rows])
+
+
+# ============================================================
+# 2. ЧИСЛО НЕПРОЧИТАННЫХ
+# ============================================================
+
+# GET /notifications/unread-count — клиенты опрашивают его часто,
+# поэтому ответ — одно число, посчитанное по частичному индексу.
+@notifications_api.get("/notifications/unread-count")
+@read_only
+@login_required
+def unread_count():
+    return jsonify({"unread": services.unread_count(current_user)})
+
+
+# ============================================================
+# 3. ОТМЕТИТЬ ПРОЧИТАННЫМИ
+# ============================================================
+
+# POST /notifications/read {"ids": [1, 2]} — отметить указанные;
+# без "ids" — отметить все.
+@notifications_api.post("/notifications/read")
+@login_required
+def mark_read():
+    data = request.get_json(silent=True) or {}
+    ids = data.get("ids")
+    if ids is not None and (not isinstance(ids, list) or not all(isinstance(i, int) for i in ids)):
+        return jsonify({"error": "ids must be a list of integers"}), 400
+
+    marked = services.mark_read(current_user, ids)
+    return jsonify({"marked": marked, "unread": services.unread_count(current_user)})
@@ -6,22 +6,36 @@ from flask import Blueprint, request, jsonify
 # - current_user — объект, который хранит данные о вошедшем пользователе
 from flask_login import login_required, current_user
 
-# Импортируем доступ к базе данных
-from app.extensions import db
+# Общий слой логики: права доступа, запросы, шардирование, быстрые UPDATE/DELETE
+from app import attachments, services
+from app.services import Forbidden, ServiceError, VersionConflict
 
-# Импортируем модель Ticket — таблица заявок
-from app.models import Ticket
+# Декоратор для обработчиков, которые только читают (могут идти на реплику)
+from app.routing import read_only
+
+# ETag — номер версии заявки (оптимистичная блокировка)
+from app.versioning import etag
+
+# Повтор с тем же Idempotency-Key возвращает сохранённый ответ
+from app.idempotency import idempotent
 
 # Создаём Blueprint для работы с заявками
 tickets_api = Blueprint("tickets_api", __name__)
 
 
+# Нет прав — одинаковый ответ для всех маршрутов этого раздела.
+@tickets_api.errorhandler(Forbidden)
+def forbidden(e):
+    return jsonify({"error": "forbidden"}), 403
+
+
 # ============================================================
 # 1. СОЗДАНИЕ НОВОЙ ЗАЯВКИ
 # ============================================================
 
 @tickets_api.post("/tickets")  # POST — создать новый объект
 @login_required                 # Только авторизованный пользователь может создать заявку
+@idempotent                     # Повтор после таймаута не создаёт вторую заявку
 def create_ticket():
     # Получаем JSON из запроса. Если данных нет — подставляем пустой словарь.
     data = request.get_json() or {}
@@ -33,19 +47,12 @@ def create_ticket():
     title = (data.get("title") or "").strip()
     description = (data.get("description") or "").strip()
 
-    # Название — обязательное поле. Если его нет — ошибка.
-    if not title:
-        return jsonify({"error": "title required"}), 400
-
-    # Создаём новый объект таблицы Ticket
-    # author_id=current_user.id — заявка принадлежит пользователю, который вошёл в систему
-    t = Ticket(title=title, description=description, author_id=current_user.id)
-
-    # Добавляем объект в базу (пока без сохранения)
-    db.session.add(t)
-
-    # Окончательно сохраняем
-    db.session.commit()
+    # Название — обязательное поле (проверяет слой services).
+    # Заявка принадлежит пользователю, который вошёл в систему.
+    try:
+        t = services.create_ticket(current_user, title, description)
+    except ServiceError as e:
+        return jsonify({"error": e.error}), 400
 
     # Возвращаем id созданной заявки и её статус (например, "open")
     return jsonify({"id": t.id, "status": t.status}), 201  # 201 — объект создан
@@ -56,28 +63,12 @@ def create_ticket():
 # ============================================================
 
 @tickets_api.get("/tickets")
+@read_only  # Только чтение — можно с реплики
 @login_required
 def list_tickets():
-    # Администратор видит все заявки
-    if current_user.role == "admin":
-        query = Ticket.query
-    else:
-        # Обычный пользователь — только свои
-        query = Ticket.query.filter_by(author_id=current_user.id)
-
-    # Собираем заявки в список словарей
-    items = []
-    for t in query.order_by(Ticket.updated_at.desc()).all():
-        items.append(
-            {
-                "id": t.id,
-                "title": t.title,
-                "description": t.description,
-                "status": t.status,
-                "author_id": t.author_id,
-            }
-        )
-
+    # Администратор видит все заявки, обычный пользователь — только свои
+    # (в режиме шардирования — из шардов, см. app/services.py).
+    items = [services.ticket_dict(t) for t in services.list_tickets(current_user)]
     return jsonify(items), 200
 
 
@@ -86,25 +77,15 @@ def list_tickets():
 # ============================================================
 
 @tickets_api.get("/tickets/<int:ticket_id>")
+@read_only  # Только чтение — можно с реплики
 @login_required
 def get_ticket(ticket_id: int):
-    # Получаем заявку по ID или выдаём 404, если её нет
-    t = Ticket.query.get_or_404(ticket_id)
-
-    # Если пользователь НЕ администратор и заявка НЕ его, значит ему нельзя её видеть
-    if current_user.role != "admin" and t.author_id != current_user.id:
-        return jsonify({"error": "forbidden"}), 403
+    # Получаем заявку по ID: 404, если её нет, 403, если она чужая.
+    t = services.get_ticket(current_user, ticket_id)
 
-    # Возвращаем данные заявки
-    return jsonify(
-        {
-            "id": t.id,
-            "title": t.title,
-            "description": t.description,
-            "status": t.status,
-            "author_id": t.author_id,
-        }
-    ), 200
+    # Возвращаем данные заявки.
+    # ETag — текущая версия: клиент передаёт её обратно в If-Match при PUT.
+    return jsonify(services.ticket_dict(t)), 200, {"ETag": etag(t.version)}
 
 
 # ============================================================
@@ -114,24 +95,26 @@ def get_ticket(ticket_id: int):
 @tickets_api.put("/tickets/<int:ticket_id>")
 @login_required
 def update_ticket_api(ticket_id: int):
-    # Получаем заявку
-    t = Ticket.query.get_or_404(ticket_id)
-
-    # Проверка доступа: админ или автор заявки
-    if current_user.role != "admin" and t.author_id != current_user.id:
-        return jsonify({"error": "forbidden"}), 403
-
     # Получаем JSON с изменениями
     data = request.get_json() or {}
 
     # Изменяем только те поля, которые клиент действительно отправил
-    for field in ("title", "description", "status"):
-        if field in data and data[field] is not None:
-            setattr(t, field, data[field])  # setattr — записывает значение в атрибут объекта
+    values = {
+        field: data[field]
+        for field in ("title", "description", "status")
+        if field in data and data[field] is not None
+    }
 
-    db.session.commit()
+    # Один условный UPDATE ... WHERE id=? AND (автор или админ) AND version=?
+    # без предварительной загрузки заявки. Если клиент прислал версию
+    # (If-Match или "version" в JSON), а заявку уже кто-то изменил —
+    # возвращаем конфликт. Если менять нечего — просто текущая версия.
+    try:
+        version, _ = services.update_ticket(current_user, ticket_id, values, data)
+    except VersionConflict as e:
+        return jsonify({"error": "version conflict", "version": e.current_version}), e.status
 
-    return jsonify({"message": "updated"}), 200
+    return jsonify({"message": "updated", "version": version}), 200, {"ETag": etag(version)}
 
 
 # ============================================================
@@ -141,15 +124,140 @@ def update_ticket_api(ticket_id: int):
 @tickets_api.delete("/tickets/<int:ticket_id>")
 @login_required
 def delete_ticket_api(ticket_id: int):
-    # Ищем заявку
-    t = Ticket.query.get_or_404(ticket_id)
+    # Один DELETE ... WHERE id=? AND (автор или админ).
+    # 404/403 различаются дополнительным запросом только при неудаче.
+    services.delete_ticket(current_user, ticket_id)
+    return jsonify({"message": "deleted"}), 200
 
-    # Проверка доступа
-    if current_user.role != "admin" and t.author_id != current_user.id:
-        return jsonify({"error": "forbidden"}), 403
 
-    # Удаляем запись
-    db.session.delete(t)
-    db.session.commit()
+# ============================================================
+# 6. ОЧЕРЕДИ РАБОТЫ: ВЗЯТЬ СЛЕДУЮЩУЮ ЗАЯВКУ, ВЕРНУТЬ, СПИСОК
+# ============================================================
+
+# POST /tickets/claim — сотрудник поддержки (админ) берёт в работу самую
+# старую открытую заявку без исполнителя. Выбор и назначение — один
+# UPDATE ... RETURNING, поэтому два сотрудника не получат одну заявку.
+# 204 — брать нечего.
+@tickets_api.post("/tickets/claim")
+@login_required
+def claim_ticket_api():
+    t = services.claim_next(current_user)
+    if t is None:
+        return "", 204
+    return jsonify(services.ticket_dict(t)), 200, {"ETag": etag(t.version)}
+
+
+# POST /tickets/<id>/release — вернуть заявку в очередь
+# (может исполнитель или администратор).
+@tickets_api.post("/tickets/<int:ticket_id>/release")
+@login_required
+def release_ticket_api(ticket_id: int):
+    version = services.release_ticket(current_user, ticket_id)
+    return jsonify({"message": "released", "version": version}), 200, {"ETag": etag(version)}
 
+
+# GET /tickets/queue?status=open              — свободные заявки, старые сверху;
+# GET /tickets/queue?status=in-progress&mine=1 — мои заявки в работе.
+@tickets_api.get("/tickets/queue")
+@read_only  # Только чтение — можно с реплики
+@login_required
+def work_queue_api():
+    status = request.args.get("status", "open")
+    mine = request.args.get("mine", "0") == "1"
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 500)
+    try:
+        rows = services.work_queue(current_user, status, mine, limit)
+    except ServiceError as e:
+        return jsonify({"error": e.error}), 400
+    return jsonify([services.ticket_dict(t) for t in rows]), 200
+
+
+# GET /tickets/overdue?limit=100 — заявки с истёкшим сроком SLA,
+# самые давние сверху (только для сотрудников поддержки).
+@tickets_api.get("/tickets/overdue")
+@read_only  # Только чтение — можно с реплики
+@login_required
+def overdue_api():
+    limit = min(max(request.args.get("limit", 100, type=int), 1), 500)
+    rows = services.overdue_tickets(current_user, limit)
+    return jsonify([services.ticket_dict(t) for t in rows]), 200
+
+
+# ============================================================
+# 7. КОММЕНТАРИИ К ЗАЯВКЕ
+# ============================================================
+
+# GET /tickets/<id>/comments?after=<курсор>&limit=50 — страница переписки
+# по порядку написания. "next" — курсор следующей страницы (null — конец).
+@tickets_api.get("/tickets/<int:ticket_id>/comments")
+@read_only  # Только чтение — можно с реплики
+@login_required
+def list_comments_api(ticket_id: int):
+    limit = min(max(request.args.get("limit", services.COMMENTS_PAGE, type=int), 1), 500)
+    try:
+        rows, cursor = services.list_comments(current_user, ticket_id, request.args.get("after"), limit)
+    except ServiceError as e:
+        return jsonify({"error": e.error}), 400
+    return jsonify({"items": [services.comment_dict(c) for c in rows], "next": cursor}), 200
+
+
+# POST /tickets/<id>/comments {"body": "..."} — написать комментарий.
+@tickets_api.post("/tickets/<int:ticket_id>/comments")
+@login_required
+def add_comment_api(ticket_id: int):
+    data = request.get_json() or {}
+    try:
+        c = services.add_comment(current_user, ticket_id, (data.get("body") or "").strip())
+    except ServiceError as e:
+        return jsonify({"error": e.error}), 400
+    return jsonify(services.comment_dict(c)), 201
+
+
+# ============================================================
+# 8. ВЛОЖЕНИЯ (ФАЙЛЫ) К ЗАЯВКЕ
+# ============================================================
+
+# GET /tickets/<id>/attachments — список файлов заявки.
+@tickets_api.get("/tickets/<int:ticket_id>/attachments")
+@read_only  # Только чтение — можно с реплики
+@login_required
+def list_attachments_api(ticket_id: int):
+    rows = services.list_attachments(current_user, ticket_id)
+    return jsonify([services.attachment_dict(a) for a in rows]), 200
+
+
+# POST /tickets/<id>/attachments?filename=log.txt — тело запроса и есть файл
+# (Content-Type — его тип). Можно и обычной формой multipart с полем "file".
+# Тело читается потоком прямо на диск.
+@tickets_api.post("/tickets/<int:ticket_id>/attachments")
+@login_required
+def add_attachment_api(ticket_id: int):
+    upload = request.files.get("file")
+    if upload is not None:
+        stream, filename, content_type = upload.stream, upload.filename, upload.mimetype
+    else:
+        stream, filename, content_type = request.stream, request.args.get("filename"), request.mimetype
+
+    try:
+        a = services.add_attachment(current_user, ticket_id, stream, filename, content_type)
+    except ServiceError as e:
+        return jsonify({"error": e.error}), 413 if e.error == "file too large" else 400
+    return jsonify(services.attachment_dict(a)), 201
+
+
+# GET /tickets/<id>/attachments/<aid> — скачать файл.
+@tickets_api.get("/tickets/<int:ticket_id>/attachments/<int:attachment_id>")
+@read_only  # Только чтение — можно с реплики
+@login_required
+def download_attachment_api(ticket_id: int, attachment_id: int):
+    a = services.get_attachment(current_user, ticket_id, attachment_id)
+    return attachments.send(a)
+
+
+# DELETE /tickets/<id>/attachments/<aid> — убрать файл из заявки.
+@tickets_api.delete("/tickets/<int:ticket_id>/attachments/<int:attachment_id>")
+@login_required
+def delete_attachment_api(ticket_id: int, attachment_id: int):
+    services.delete_attachment(current_user, ticket_id, attachment_id)
     return jsonify({"message": "deleted"}), 200
+
@@ -0,0 +1,177 @@
+# Хранилище вложений (скриншоты, логи) на локальном диске.
+#
+# Файлы раскладываются по содержимому (content-addressed): имя файла —
+# SHA-256 его байтов, путь — <ATTACHMENTS_DIR>/ab/cd/abcd...:
+#  - одинаковые файлы, загруженные в разные заявки (или дважды в одну),
+#    хранятся на диске один раз — в базе лишь несколько строк-ссылок;
+#  - содержимое по такому пути никогда не меняется, поэтому клиент может
+#    смело кэшировать его, а ETag — это просто хеш.
+#
+# Загрузка идёт потоком: тело запроса читается кусками по CHUNK_SIZE,
+# каждый кусок сразу пишется во временный файл и добавляется в хеш.
+# Файл целиком в памяти не держится. Когда хеш известен, временный файл
+# переименовывается (os.replace — атомарно) на своё место или удаляется,
+# если такое содержимое уже есть.
+#
+# Отдача — через send_file: сервер передаёт файл по дескриптору
+# (wsgi.file_wrapper / sendfile, либо X-Sendfile при USE_X_SENDFILE),
+# поддерживает Range (докачка, просмотр логов с середины) и условные
+# запросы (If-None-Match → 304).
+#
+# Ненужные файлы (на которые не ссылается ни одна строка attachment)
+# удаляет команда `flask --app run attachments-gc` / задача attachments.gc.
+
+import hashlib
+import os
+import tempfile
+import time
+
+from flask import current_app, send_file
+from sqlalchemy import select
+
+from .extensions import db
+from .models import Attachment
+
+CHUNK_SIZE = 64 * 1024
+
+# Типы, которые можно показывать прямо в браузере: только растровые
+# картинки, и только если начало файла (сигнатура) совпадает с заявленным
+# типом. SVG, HTML и всё остальное — всегда скачиванием: иначе загруженный
+# файл выполнил бы скрипт от имени нашего сайта (stored XSS).
+INLINE_SIGNATURES = {
+    "image/png": lambda head: head.startswith(b"\x89PNG\r\n\x1a\n"),
+    "image/jpeg": lambda head: head.startswith(b"\xff\xd8\xff"),
+    "image/gif": lambda head: head[:6] in (b"GIF87a", b"GIF89a"),
+    "image/webp": lambda head: head[:4] == b"RIFF" and head[8:12] == b"WEBP",
+}
+
+
+class TooLarge(ValueError):
+    # Файл больше ATTACHMENT_MAX_SIZE.
+    pass
+
+
+class Storage:
+    # Каталог с файлами вложений.
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def save_stream(self, stream, max_size: int, chunk_size: int = CHUNK_SIZE):
+        # Сохранить поток байтов. Возвращает (sha256, размер).
+        tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_size:
+                        raise TooLarge(f"file is larger than {max_size} bytes")
+                    digest.update(chunk)
+                    out.write(chunk)
+
+            sha256 = digest.hexdigest()
+            final = self.path(sha256)
+            if os.path.exists(final):
+                # Такой файл уже есть — копия не нужна. Обновляем время
+                # изменения, чтобы сборщик мусора не удалил файл, на который
+                # вот-вот появится новая ссылка.
+                os.utime(final)
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(final), exist_ok=True)
+                os.replace(tmp_path, final)
+            return sha256, size
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def iter_blobs(self):
+        # Все сохранённые файлы: (sha256, путь).
+        for dirpath, _, filenames in os.walk(self.root):
+            if os.path.basename(dirpath) == "tmp":
+                continue
+            for name in filenames:
+                if len(name) == 64:
+                    yield name, os.path.join(dirpath, name)
+
+    def collect_garbage(self, referenced, grace_seconds: float = 3600) -> int:
+        # Удалить файлы, на которые нет ссылок (referenced(sha) → False).
+        # Свежие файлы (моложе grace_seconds) не трогаем: их ссылка может
+        # быть ещё не записана в базу. Возвращает число удалённых файлов.
+        cutoff = time.time() - grace_seconds
+        removed = 0
+        for sha256, path in self.iter_blobs():
+            if os.path.getmtime(path) < cutoff and not referenced(sha256):
+                os.remove(path)
+                removed += 1
+        return removed
+
+
+def init_app(app):
+    app.extensions["attachments"] = Storage(app.config["ATTACHMENTS_DIR"])
+
+
+def storage() -> Storage:
+    return current_app.extensions["attachments"]
+
+
+def gc(grace_seconds: float = 3600) -> int:
+    # Сборка мусора: удалить файлы, на которые не ссылается ни одно вложение.
+    # Проверка каждого файла — запрос по индексу ix_attachment_sha256.
+    def referenced(sha256: str) -> bool:
+        stmt = select(Attachment.id).where(Attachment.sha256 == sha256).limit(1)
+        return db.session.execute(stmt).first() is not None
+
+    return storage().collect_garbage(referenced, grace_seconds)
+
+
+def inline_allowed(path: str, content_type: str) -> bool:
+    # Можно ли показать файл в браузере: тип из белого списка
+    # и сигнатура содержимого ему соответствует.
+    check = INLINE_SIGNATURES.get((content_type or "").split(";")[0].strip().lower())
+    if check is None:
+        return False
+    with open(path, "rb") as f:
+        return check(f.read(16))
+
+
+def send(attachment):
+    # Ответ с файлом вложения (общий для API и веб-интерфейса).
+    #  - send_file отдаёт файл по дескриптору (sendfile у сервера или
+    #    X-Sendfile), без чтения в память приложения;
+    #  - conditional=True — поддержка Range и If-None-Match/If-Modified-Since;
+    #  - ETag — хеш содержимого: по этому адресу содержимое не меняется.
+    # Растровые картинки (проверенные по сигнатуре) показываются прямо
+    # в браузере, остальное — скачивается.
+    path = storage().path(attachment.sha256)
+    response = send_file(
+        path,
+        mimetype=attachment.content_type,
+        as_attachment=not inline_allowed(path, attachment.content_type),
+        download_name=attachment.filename,
+        conditional=True,
+        etag=attachment.sha256,
+        max_age=24 * 3600,
+    )
+    # Файлы доступны только участникам заявки — общим кэшам (прокси) их
+    # хранить нельзя, браузеру — можно, и перепроверять не нужно.
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    # Браузер не угадывает тип сам, а открытый файл (даже скачанный и
+    # открытый по ссылке) живёт в "песочнице" без скриптов и нашего origin.
+    response.headers["X-Content-Type-Options"] = "nosniff"
+    response.headers["Content-Security-Policy"] = "sandbox"
+    return response
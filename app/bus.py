@@ -0,0 +1,204 @@
+# Шина сброса кэшей между процессами-воркерами одной машины.
+#
+# У каждого процесса свои кэши в памяти: записи сессий (app/sessions.py),
+# список отозванных токенов (app/tokens.py). Пока процесс один, он сам
+# чистит их при записи. Когда процессов несколько (prefork, несколько
+# серверов на одной машине), запись в одном процессе должна сбросить
+# кэш и во всех остальных — иначе удалённый пользователь ещё какое-то
+# время входит через соседний воркер.
+#
+# Шина — таблица-журнал в отдельном SQLite-файле (INVALIDATION_BUS),
+# никаких внешних сервисов:
+#
+#     change(seq — растущий номер, topic — что сбросить, key — какую запись,
+#            origin — какой процесс записал, created_at — когда)
+#
+#  - publish(topic, keys) — процесс, сделавший запись, сам уже почистил
+#    свой кэш и добавляет в журнал строки для остальных;
+#  - poll() — перед каждым запросом процесс читает строки с seq больше
+#    последнего прочитанного (по первичному ключу, обычно ноль строк),
+#    но не чаще раза в INVALIDATION_POLL_INTERVAL секунд. Так любой ответ
+#    учитывает все сбросы, сделанные раньше чем POLL_INTERVAL назад.
+#
+# Строки старше INVALIDATION_RETENTION секунд удаляются. Новый процесс
+# читает журнал с начала — так он узнаёт об отозванных токенах, которые
+# ещё не истекли (поэтому по умолчанию срок хранения = API_TOKEN_TTL).
+# Если процесс пропустил часть журнала (долго не было запросов, строки
+# уже удалены), он очищает свои кэши целиком и читает журнал заново.
+#
+# HTML-фрагменты (app/fragments.py) в шине не нуждаются: их ключ включает
+# updated_at и comment_count заявки, изменённая заявка просто получает
+# новый ключ в любом процессе.
+#
+# Метрики (GET /admin/metrics): bus.applied — сколько чужих сбросов
+# применено, bus.lag.* — через сколько секунд после записи (count/sum/max),
+# bus.resets — сколько раз кэши очищались целиком.
+#
+# INVALIDATION_BUS пусто (тесты, один процесс) — шина выключена,
+# publish ничего не делает.
+
+import os
+import secrets
+import threading
+import time
+
+from . import metrics
+
+# Сколько строк журнала читать за раз.
+BATCH_SIZE = 1000
+
+
+class Bus:
+
+    def __init__(self, path: str, poll_interval: float = 0.5, retention: float = 3600):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.handlers = {}  # topic → (apply(keys), reset())
+        self.local = threading.local()
+        self.lock = threading.Lock()  # один поток читает журнал за раз
+        self.init_lock = threading.Lock()
+        self.ready = False
+        self.pid = None
+        self.origin = None
+        self.last_seq = 0
+        self.last_poll = 0.0
+        self.last_trim = 0.0
+
+    def subscribe(self, topic: str, apply, reset=None):
+        # apply(keys) — сбросить записи с этими ключами (строки);
+        # reset() — очистить кэш целиком (если часть журнала пропущена).
+        self.handlers[topic] = (apply, reset)
+
+    def _check_fork(self):
+        # После fork у дочернего процесса своё имя в журнале
+        # и свои соединения (соединения SQLite нельзя делить с родителем).
+        pid = os.getpid()
+        if self.pid != pid:
+            self.pid = pid
+            self.origin = f"{pid}-{secrets.token_hex(4)}"
+            self.local = threading.local()
+
+    def _connect(self):
+        self._check_fork()
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            # sqlite3 нужен только в этом режиме — импортируем по требованию.
+            import sqlite3
+
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self.local.conn = conn
+            with self.init_lock:
+                if not self.ready:
+                    # WAL: чтение журнала не ждёт, пока другой процесс пишет.
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    # AUTOINCREMENT — номера не используются повторно даже
+                    # после удаления последних строк.
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS change ("
+                        "seq INTEGER PRIMARY KEY AUTOINCREMENT, topic TEXT NOT NULL, "
+                        "key TEXT NOT NULL, origin TEXT NOT NULL, created_at REAL NOT NULL)"
+                    )
+                    conn.execute("CREATE INDEX IF NOT EXISTS ix_change_created_at ON change (created_at)")
+                    self.ready = True
+        return conn
+
+    def publish(self, topic: str, keys):
+        # Сообщить остальным процессам: сбросить записи keys в кэше topic.
+        if not self.path or not keys:
+            return
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO change (topic, key, origin, created_at) VALUES (?, ?, ?, ?)",
+                [(topic, str(key), self.origin, now) for key in keys],
+            )
+            if now - self.last_trim > 60:
+                conn.execute("DELETE FROM change WHERE created_at < ?", (now - self.retention,))
+                self.last_trim = now
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _reset(self):
+        metrics.incr("bus.resets")
+        for _, reset in self.handlers.values():
+            if reset is not None:
+                reset()
+
+    def poll(self, force: bool = False) -> int:
+        # Применить новые строки журнала. Возвращает, сколько применено.
+        if not self.path:
+            return 0
+        if not force and time.time() - self.last_poll < self.poll_interval:
+            return 0
+        with self.lock:
+            now = time.time()
+            if not force and now - self.last_poll < self.poll_interval:
+                return 0
+            conn = self._connect()
+            # Задержку считаем только для свежих строк: при первом чтении
+            # и после сброса журнал читается с начала, это история.
+            live = bool(self.last_poll)
+            # Долго не читали — строки могли удалить, не дождавшись нас.
+            if live and now - self.last_poll > self.retention:
+                self._reset()
+                self.last_seq = 0
+                live = False
+
+            applied = 0
+            while True:
+                rows = conn.execute(
+                    "SELECT seq, topic, key, origin, created_at FROM change WHERE seq > ? ORDER BY seq LIMIT ?",
+                    (self.last_seq, BATCH_SIZE),
+                ).fetchall()
+                if rows and self.last_seq and rows[0][0] > self.last_seq + 1:
+                    # Дыра в номерах — пропущенные строки уже удалены.
+                    self._reset()
+                    self.last_seq = 0
+                    live = False
+                    continue
+
+                by_topic = {}
+                for seq, topic, key, origin, created_at in rows:
+                    if origin != self.origin and topic in self.handlers:
+                        by_topic.setdefault(topic, []).append(key)
+                        if live:
+                            metrics.observe("bus.lag", max(now - created_at, 0.0))
+                for topic, keys in by_topic.items():
+                    self.handlers[topic][0](keys)
+                    applied += len(keys)
+
+                if rows:
+                    self.last_seq = rows[-1][0]
+                if len(rows) < BATCH_SIZE:
+                    break
+
+            self.last_poll = now
+            if applied:
+                metrics.incr("bus.applied", applied)
+            return applied
+
+
+def init_app(app):
+    bus = Bus(
+        app.config["INVALIDATION_BUS"],
+        app.config["INVALIDATION_POLL_INTERVAL"],
+        app.config["INVALIDATION_RETENTION"],
+    )
+    app.extensions["bus"] = bus
+
+    if bus.path:
+        # Журнал читается до всего остального в запросе: before_request
+        # не подходит — сессия к тому времени уже открыта из кэша.
+        wsgi_app = app.wsgi_app
+
+        def apply_invalidations(environ, start_response):
+            bus.poll()
+            return wsgi_app(environ, start_response)
+
+        app.wsgi_app = apply_invalidations
@@ -0,0 +1,197 @@
+# Консольные команды приложения (запускаются через `flask --app run <команда>`).
+#
+# Тяжёлые модули (csv, json и т.п.) импортируются внутри команд,
+# чтобы обычный запуск веб-сервера за них не платил.
+
+import click
+from flask.cli import with_appcontext
+
+
+# ============================================================
+#              СОЗДАНИЕ ТАБЛИЦ И АДМИНИСТРАТОРА
+# ============================================================
+
+def init_db():
+    # Создаём все таблицы (если их ещё нет) и администратора по умолчанию.
+    # Вызывается явно (командой init-db или из run.py), а не при импорте,
+    # чтобы короткие команды и новые воркеры не ходили в базу при старте.
+    from .extensions import db
+    from .models import User
+
+    db.create_all()
+
+    # ---- Создаем администратора, если его нет ----
+    if not User.query.filter_by(username="admin").first():
+        admin = User(username="admin", role="admin")
+        admin.set_password("adminpass")
+        db.session.add(admin)
+        db.session.commit()
+        click.echo("Создан администратор: логин admin / пароль adminpass")
+    else:
+        click.echo("Администратор уже существует")
+
+
+@click.command("init-db")
+@with_appcontext
+def init_db_command():
+    init_db()
+
+
+# ============================================================
+#                    ЭКСПОРТ ДАННЫХ В ФАЙЛ
+# ============================================================
+
+@click.command("export-data")
+@click.argument("kind", type=click.Choice(["users", "tickets"]))
+@click.option("--output", "-o", type=click.Path(dir_okay=False), help="Файл для выгрузки (по умолчанию stdout).")
+@click.option("--format", "fmt", type=click.Choice(["csv", "ndjson"]), default=None)
+@click.option("--chunk-size", type=int, default=None, help="Сколько строк читать из базы за раз.")
+@with_appcontext
+def export_data(kind, output, fmt, chunk_size):
+    from . import transfer
+
+    fmt = fmt or (transfer.format_from_path(output) if output else "ndjson")
+    chunks = transfer.export_stream(kind, fmt, chunk_size or transfer.CHUNK_SIZE)
+
+    # Пишем в файл кусками, по мере чтения из базы.
+    if output:
+        with open(output, "w", encoding="utf-8", newline="") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        click.echo(f"Выгружено в {output}", err=True)
+    else:
+        for chunk in chunks:
+            click.echo(chunk, nl=False)
+
+
+# ============================================================
+#                    ИМПОРТ ДАННЫХ ИЗ ФАЙЛА
+# ============================================================
+
+@click.command("import-data")
+@click.argument("kind", type=click.Choice(["users", "tickets"]))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(["csv", "ndjson"]), default=None)
+@click.option("--batch-size", type=int, default=None, help="Сколько строк вставлять за один INSERT.")
+@click.option("--checkpoint", type=click.Path(dir_okay=False), default=None,
+              help="Файл контрольной точки (по умолчанию <файл>.checkpoint).")
+@click.option("--restart", is_flag=True, help="Игнорировать контрольную точку и начать сначала.")
+@with_appcontext
+def import_data(kind, path, fmt, batch_size, checkpoint, restart):
+    from . import transfer
+
+    fmt = fmt or transfer.format_from_path(path)
+    cp = transfer.Checkpoint(checkpoint or path + ".checkpoint", kind)
+    if restart:
+        cp.clear()
+
+    # С какой строки продолжаем (0 — если импорт ещё не начинался).
+    start = cp.load()
+    if start:
+        click.echo(f"Продолжаем импорт со строки {start + 1}", err=True)
+
+    try:
+        with open(path, encoding="utf-8", newline="") as f:
+            done = transfer.import_rows(
+                kind,
+                transfer.parse_rows(f, fmt),
+                start=start,
+                batch_size=batch_size or transfer.BATCH_SIZE,
+                on_batch=cp.save,
+            )
+    except transfer.TransferError as e:
+        raise click.ClickException(str(e))
+
+    # Всё импортировано — контрольная точка больше не нужна.
+    cp.clear()
+    click.echo(f"Импортировано строк: {done - start} (всего {done})", err=True)
+
+
+# ============================================================
+#                    ВОРКЕР ФОНОВЫХ ЗАДАЧ
+# ============================================================
+
+@click.command("jobs-worker")
+@click.option("--threads", type=int, default=4, help="Сколько задач выполнять параллельно.")
+@click.option("--poll-interval", type=float, default=1.0, help="Пауза (сек), когда очередь пуста.")
+@click.option("--once", is_flag=True, help="Выполнить готовые задачи и выйти.")
+@with_appcontext
+def jobs_worker(threads, poll_interval, once):
+    from flask import current_app
+    from . import jobs
+
+    app = current_app._get_current_object()
+
+    # Периодические задачи ставят себя сами — нужно только, чтобы первая
+    # была в очереди (воркер потом проверяет это сам, см. Worker._schedule).
+    jobs.schedule_periodic()
+
+    if once:
+        click.echo(f"Выполнено задач: {jobs.run_pending(app)}", err=True)
+        return
+
+    worker = jobs.Worker(app, threads=threads, poll_interval=poll_interval)
+    click.echo(f"Воркер запущен ({threads} потоков), Ctrl+C — остановка", err=True)
+    try:
+        worker.run_forever()
+    except KeyboardInterrupt:
+        worker.stop()
+
+
+# ============================================================
+#                СОЗДАНИЕ ТАБЛИЦ В ШАРДАХ ЗАЯВОК
+# ============================================================
+
+@click.command("shards-init")
+@with_appcontext
+def shards_init():
+    from flask import current_app
+    from . import sharding
+
+    if not sharding.enabled():
+        raise click.ClickException("TICKET_SHARDS не задан")
+    shards = current_app.extensions["ticket_shards"]
+    shards.create_schema()
+    click.echo(f"Таблицы созданы в {shards.count} шардах", err=True)
+
+
+# ============================================================
+#              СБОРКА МУСОРА В ХРАНИЛИЩЕ ВЛОЖЕНИЙ
+# ============================================================
+
+@click.command("attachments-gc")
+@click.option("--grace", type=float, default=3600, help="Не трогать файлы моложе стольких секунд.")
+@with_appcontext
+def attachments_gc(grace):
+    from . import attachments
+
+    removed = attachments.gc(grace)
+    click.echo(f"Удалено файлов без ссылок: {removed}", err=True)
+
+
+# ============================================================
+#               ПЕРЕСЧЁТ ИТОГОВ ДЛЯ ОТЧЁТОВ
+# ============================================================
+
+@click.command("reports-backfill")
+@click.option("--batch-size", type=int, default=1000, help="Сколько заявок читать за один запрос.")
+@with_appcontext
+def reports_backfill(batch_size):
+    # Пересчитать дневные итоги по всем заявкам (после обновления или импорта).
+    from . import reports
+
+    result = reports.backfill(batch_size)
+    click.echo(
+        f"Дней: {result['days']}, заявок: {result['tickets']}, закрытых: {result['closed']}", err=True
+    )
+
+
+def register_commands(app):
+    # Подключаем команды к приложению.
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(export_data)
+    app.cli.add_command(import_data)
+    app.cli.add_command(jobs_worker)
+    app.cli.add_command(shards_init)
+    app.cli.add_command(attachments_gc)
+    app.cli.add_command(reports_backfill)
@@ -12,9 +12,13 @@ from flask_login import LoginManager
 from flask_bcrypt import Bcrypt
 
 
+# Сессия, которая умеет отправлять чтения на реплику (см. app/routing.py).
+from .routing import RoutingSession
+
+
 # Создаём один общий объект базы данных.
 # Этот объект будет использоваться во всём приложении для работы с моделями (таблицами).
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 # Создаём объект менеджера логина.
 # Через него Flask-Login узнаёт, как работать с пользователями, как их загружать и т.п.
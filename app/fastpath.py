@@ -0,0 +1,274 @@
+# Быстрые изменения: один SQL-запрос вместо "загрузить объект → проверить
+# права в Python → изменить → сохранить".
+#
+# Проверка прав встроена прямо в WHERE:
+#
+#     UPDATE ticket SET ... WHERE id = :id AND (author_id = :me OR :is_admin)
+#     DELETE FROM ticket   WHERE id = :id AND (author_id = :me OR :is_admin)
+#
+# Если запрос изменил строку — всё готово за один проход к базе.
+# Только если не изменил ничего, делается второй маленький запрос
+# (SELECT author_id, version), чтобы понять причину: заявки нет (404),
+# нет прав (403) или версия устарела (409/412, см. app/versioning.py).
+#
+# Так же устроено "взять следующую заявку" из очереди (claim_statement):
+# выбор самой старой свободной заявки и её назначение — один UPDATE.
+
+from datetime import datetime
+
+from flask import abort
+from sqlalchemy import and_, case, delete, select, true, update
+
+from . import reports, sla
+from .extensions import db
+from .models import Attachment, Comment, IdempotencyKey, Notification, OutboxMessage, Ticket, User
+from .versioning import VersionConflict, expected_version
+
+
+class Forbidden(Exception):
+    # У пользователя нет прав на эту заявку.
+    pass
+
+
+def _scope(user):
+    # Условие "эта заявка доступна пользователю".
+    if user.role == "admin":
+        return true()
+    return Ticket.author_id == user.id
+
+
+def _explain_miss(user, ticket_id: int, conflict_status: int = None):
+    # Запрос не затронул ни одной строки — выясняем почему.
+    row = db.session.execute(
+        select(Ticket.author_id, Ticket.version).where(Ticket.id == ticket_id)
+    ).first()
+    if row is None:
+        abort(404)
+    if user.role != "admin" and row.author_id != user.id:
+        raise Forbidden()
+    raise VersionConflict(conflict_status or 409, row.version)
+
+
+def status_values(table, values: dict, now: datetime) -> dict:
+    # Новый статус меняет и производные колонки в том же UPDATE:
+    # срок SLA (app/sla.py) и время закрытия (app/reports.py).
+    # table — Ticket.__table__ или таблица шарда (app/sharding.py).
+    if "status" not in values:
+        return values
+    status = values["status"]
+    return {
+        **values,
+        "deadline": sla.transition(table, status, now),
+        "closed_at": reports.closed_transition(table, status, now),
+    }
+
+
+def update_ticket(user, ticket_id: int, values: dict, body: dict = None):
+    # Изменить заявку с проверкой прав и версии одним UPDATE.
+    # Возвращает (новая версия, название заявки).
+    version, status = expected_version(body)
+    now = datetime.utcnow()
+
+    stmt = update(Ticket).where(Ticket.id == ticket_id, _scope(user))
+    if version is not None:
+        stmt = stmt.where(Ticket.version == version)
+    stmt = (
+        stmt.values(**status_values(Ticket.__table__, values, now), version=Ticket.version + 1, updated_at=now)
+        .returning(Ticket.version, Ticket.title, Ticket.created_at, Ticket.closed_at)
+        .execution_options(synchronize_session=False)
+    )
+
+    row = db.session.execute(stmt).first()
+    if row is None:
+        db.session.rollback()
+        _explain_miss(user, ticket_id, status)
+
+    # Закрытие попадает в дневные итоги в той же транзакции.
+    if "status" in values:
+        reports.record_transition(values["status"], now, row)
+    db.session.commit()
+    return row.version, row.title
+
+
+def delete_ticket(user, ticket_id: int) -> str:
+    # Удалить заявку с проверкой прав одним DELETE.
+    # Возвращает название удалённой заявки (через RETURNING).
+    row = db.session.execute(
+        delete(Ticket)
+        .where(Ticket.id == ticket_id, _scope(user))
+        .returning(Ticket.title, Ticket.comment_count, Ticket.attachment_count)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if row is None:
+        db.session.rollback()
+        _explain_miss(user, ticket_id)
+
+    # Переписка и вложения удаляются в той же транзакции (по индексам
+    # ticket_id); если их не было (счётчики из RETURNING), лишних запросов нет.
+    if row.comment_count or row.attachment_count:
+        delete_children(ticket_id)
+    db.session.commit()
+    return row.title
+
+
+def delete_children(ticket_id: int):
+    # Удалить комментарии и вложения заявки (без commit).
+    # Файлы вложений остаются на диске до сборки мусора (app/attachments.py).
+    for model in (Comment, Attachment):
+        db.session.execute(
+            delete(model)
+            .where(model.ticket_id == ticket_id)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def claim_statement(table, assignee_id: int, now: datetime):
+    # UPDATE ticket SET assignee_id = :me, status = 'in-progress', ...
+    # WHERE id = (SELECT id FROM ticket
+    #             WHERE status = 'open' AND assignee_id IS NULL
+    #             ORDER BY created_at, id LIMIT 1 FOR UPDATE SKIP LOCKED)
+    #   AND status = 'open' AND assignee_id IS NULL
+    # RETURNING ...
+    #
+    # Подзапрос читает первую запись частичного индекса
+    # ix_ticket_unassigned_open — без просмотра таблицы.
+    # SQLite выполняет запись целиком под блокировкой базы, поэтому две
+    # одновременные попытки не получат одну заявку. В PostgreSQL
+    # SKIP LOCKED пропускает строку, которую прямо сейчас берёт другой
+    # сотрудник, и сразу берёт следующую — без ожидания. Повторная
+    # проверка условий во внешнем WHERE защищает, если гонка всё же была.
+    # table — Ticket.__table__ или таблица шарда (app/sharding.py).
+    free = and_(table.c.status == "open", table.c.assignee_id.is_(None))
+    oldest = (
+        select(table.c.id)
+        .where(free)
+        .order_by(table.c.created_at, table.c.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    return (
+        update(table)
+        .where(table.c.id == oldest, free)
+        .values(
+            assignee_id=assignee_id,
+            status="in-progress",
+            deadline=sla.deadline_for("in-progress", now),
+            version=table.c.version + 1,
+            updated_at=now,
+        )
+        .returning(*table.c)
+    )
+
+
+def claim_ticket(user, attempts: int = 3):
+    # Взять в работу самую старую свободную открытую заявку.
+    # Возвращает строку заявки или None, если очередь пуста.
+    for _ in range(attempts):
+        stmt = claim_statement(Ticket.__table__, user.id, datetime.utcnow())
+        row = db.session.execute(stmt.execution_options(synchronize_session=False)).first()
+        db.session.commit()
+        if row is not None:
+            return row
+        # Пусто: либо очередь действительно пуста, либо заявку из-под
+        # подзапроса перехватили (возможно только без SKIP LOCKED).
+        free = select(Ticket.id).where(Ticket.status == "open", Ticket.assignee_id.is_(None))
+        if db.session.execute(free.limit(1)).first() is None:
+            return None
+    return None
+
+
+def release_ticket(user, ticket_id: int):
+    # Вернуть заявку в очередь: снять исполнителя, статус снова "open".
+    # Может исполнитель или администратор; один UPDATE с проверкой в WHERE.
+    scope = true() if user.role == "admin" else Ticket.assignee_id == user.id
+    row = db.session.execute(
+        update(Ticket)
+        .where(Ticket.id == ticket_id, Ticket.assignee_id.is_not(None), scope)
+        .values(
+            assignee_id=None,
+            status="open",
+            deadline=sla.transition(Ticket.__table__, "open"),
+            closed_at=None,
+            version=Ticket.version + 1,
+            updated_at=datetime.utcnow(),
+        )
+        .returning(Ticket.version)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if row is None:
+        db.session.rollback()
+        current = db.session.execute(
+            select(Ticket.assignee_id, Ticket.version).where(Ticket.id == ticket_id)
+        ).first()
+        if current is None:
+            abort(404)
+        if current.assignee_id is None:
+            # Уже в очереди — повторный запрос ничего не меняет.
+            return current.version
+        raise Forbidden()
+    db.session.commit()
+    return row.version
+
+
+def delete_user(user_id: int, own_tickets=None) -> str:
+    # Удалить пользователя вместе со всеми его заявками.
+    # Заявки удаляются одним DELETE ... WHERE author_id = ? (по индексу),
+    # без загрузки каждой заявки в память; всё в одной транзакции.
+    # own_tickets — id его заявок, уже удалённых из шарда (app/sharding.py);
+    # без шардирования они выбираются подзапросом.
+    # Возвращает имя удалённого пользователя.
+
+    # Переписка и вложения его заявок удаляются вместе с заявками, а его
+    # комментарии и файлы в чужих заявках остаются без автора.
+    if own_tickets is None:
+        own_tickets = select(Ticket.id).where(Ticket.author_id == user_id)
+    for model, author in ((Comment, Comment.author_id), (Attachment, Attachment.uploader_id)):
+        db.session.execute(
+            delete(model)
+            .where(model.ticket_id.in_(own_tickets))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.execute(
+            update(model)
+            .where(author == user_id)
+            .values({author.key: None})
+            .execution_options(synchronize_session=False)
+        )
+    db.session.execute(
+        delete(Ticket)
+        .where(Ticket.author_id == user_id)
+        .execution_options(synchronize_session=False)
+    )
+    # Заявки, которые он взял в работу, возвращаются в очередь.
+    db.session.execute(
+        update(Ticket)
+        .where(Ticket.assignee_id == user_id)
+        .values(
+            assignee_id=None,
+            status=case((Ticket.status == "in-progress", "open"), else_=Ticket.status),
+            deadline=case((Ticket.status == "in-progress", sla.deadline_for("open")), else_=Ticket.deadline),
+            version=Ticket.version + 1,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    # Его уведомления, неотправленные письма и сохранённые ответы
+    # на повторы запросов больше никому не нужны.
+    for model in (Notification, OutboxMessage, IdempotencyKey):
+        db.session.execute(
+            delete(model)
+            .where(model.user_id == user_id)
+            .execution_options(synchronize_session=False)
+        )
+    username = db.session.execute(
+        delete(User)
+        .where(User.id == user_id)
+        .returning(User.username)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    if username is None:
+        db.session.rollback()
+        abort(404)
+
+    db.session.commit()
+    return username
@@ -0,0 +1,79 @@
+# Кэш HTML-фрагментов и байткода шаблонов.
+#
+# 1) Байткод шаблонов. Jinja превращает каждый шаблон в Python-код и
+#    компилирует его. С FileSystemBytecodeCache результат компиляции
+#    сохраняется на диск (TEMPLATE_CACHE_DIR), и новый процесс-воркер
+#    загружает готовый байткод вместо повторной компиляции.
+#
+# 2) Фрагменты. Строка таблицы заявок (templates/_ticket_row.html)
+#    рендерится один раз и хранится в LRU-кэше под ключом
+#    (ticket.id, ticket.updated_at, ticket.comment_count). Любое изменение
+#    заявки меняет updated_at, новый комментарий — comment_count,
+#    поэтому устаревшая строка просто перестаёт
+#    запрашиваться, а в длинном списке администратора заново
+#    рендерятся только изменившиеся строки.
+
+import os
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+from markupsafe import Markup
+
+from . import metrics
+
+
+class FragmentCache:
+    # Потокобезопасный LRU-кэш: при переполнении выбрасываются
+    # фрагменты, которые дольше всего не запрашивались.
+
+    def __init__(self, max_size: int = 10_000):
+        self.max_size = max_size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+def ticket_row(t) -> Markup:
+    # Готовая строка <tr> для заявки t (из кэша или свежеотрендеренная).
+    cache = current_app.extensions["fragment_cache"]
+    key = ("ticket_row", t.id, t.updated_at, t.comment_count)
+
+    html = cache.get(key)
+    if html is None:
+        metrics.incr("fragments.miss")
+        html = Markup(current_app.jinja_env.get_template("_ticket_row.html").render(t=t))
+        cache.set(key, html)
+    else:
+        metrics.incr("fragments.hit")
+    return html
+
+
+def init_app(app):
+    # Байткод-кэш включается, только если задан каталог.
+    cache_dir = app.config["TEMPLATE_CACHE_DIR"]
+    if cache_dir:
+        from jinja2 import FileSystemBytecodeCache
+
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+    app.extensions["fragment_cache"] = FragmentCache(app.config["FRAGMENT_CACHE_SIZE"])
+    app.jinja_env.globals["ticket_row"] = ticket_row
@@ -0,0 +1,205 @@
+# Повторы запросов с заголовком Idempotency-Key.
+#
+# Интеграции повторяют POST /tickets после таймаута — и получают вторую
+# такую же заявку. Теперь клиент может прислать заголовок
+#
+#     Idempotency-Key: <любая строка до 255 символов, уникальная для операции>
+#
+# и повтор с тем же ключом вернёт сохранённый ответ первого запроса
+# (с заголовком Idempotent-Replayed: true), ничего не выполняя заново.
+#
+# Как это устроено (декоратор @idempotent, ставится НИЖЕ @login_required):
+#  1) ответ ищется в LRU-кэше процесса, затем в таблице idempotency_key;
+#  2) если его нет — в таблицу добавляется строка-заготовка (без ответа)
+#     в той же транзакции, которую потом сохраняет сам обработчик. Заявка
+#     и заготовка сохраняются вместе; одновременный повтор упирается
+#     в уникальный индекс (user_id, key) и получает 409 "ещё выполняется";
+#  3) после обработчика ответ (код < 500) записывается в строку и в кэш.
+#     Ошибка 5xx или исключение — заготовка удаляется, повтор выполнится
+#     заново.
+#
+# Тот же ключ с другим запросом (метод, адрес, тело JSON) — 422.
+# Ключи живут IDEMPOTENCY_TTL секунд; истёкшие строки удаляет задача
+# idempotency.sweep порциями, так что таблица не растёт без предела.
+
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, jsonify, make_response, request
+from flask_login import current_user
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+
+from . import metrics
+from .extensions import db
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+# Сохранённый ответ. status_code None — запрос ещё выполняется.
+Entry = namedtuple("Entry", "fingerprint status_code body expires_at")
+
+
+class ResponseCache:
+    # LRU-кэш готовых ответов: (user_id, ключ) → Entry.
+
+    def __init__(self, size: int = 10_000):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, now: datetime):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at < now:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry: Entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+def init_app(app):
+    app.extensions["idempotency_cache"] = ResponseCache(app.config["IDEMPOTENCY_CACHE_SIZE"])
+
+
+def _cache() -> ResponseCache:
+    return current_app.extensions["idempotency_cache"]
+
+
+def fingerprint() -> str:
+    # Метод, адрес с параметрами и тело JSON. Тело импорта (поток) не
+    # читается заранее — для него достаточно адреса и параметров.
+    h = hashlib.sha256()
+    h.update(request.method.encode())
+    h.update(b"\0" + request.full_path.encode())
+    if request.is_json:
+        h.update(b"\0" + request.get_data(cache=True))
+    return h.hexdigest()
+
+
+def _load(user_id: int, key: str, now: datetime):
+    row = db.session.execute(
+        select(IdempotencyKey.fingerprint, IdempotencyKey.status_code, IdempotencyKey.body, IdempotencyKey.expires_at)
+        .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key, IdempotencyKey.expires_at >= now)
+    ).first()
+    return Entry(*row) if row else None
+
+
+def _replay(entry: Entry, fp: str):
+    if entry.status_code is None:
+        return jsonify({"error": "request in progress"}), 409, {"Retry-After": "1"}
+    if entry.fingerprint != fp:
+        return jsonify({"error": "idempotency key reused"}), 422
+    metrics.incr("idempotency.replayed")
+    response = current_app.response_class(entry.body, status=entry.status_code, mimetype="application/json")
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _release(user_id: int, key: str):
+    # Убрать заготовку (если обработчик успел её сохранить).
+    db.session.execute(
+        delete(IdempotencyKey).where(
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.key == key,
+            IdempotencyKey.status_code.is_(None),
+        )
+    )
+    db.session.commit()
+
+
+def _store(user_id: int, key: str, entry: Entry, now: datetime):
+    # Записать ответ в заготовку. Если обработчик откатил транзакцию
+    # (например, импорт с ошибкой) и заготовки нет — вставить строку заново.
+    updated = db.session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+        .values(status_code=entry.status_code, body=entry.body)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not updated:
+        db.session.add(IdempotencyKey(user_id=user_id, key=key, created_at=now, **entry._asdict()))
+    db.session.commit()
+
+
+def idempotent(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({"error": "invalid idempotency key"}), 400
+
+        user_id = current_user.id
+        fp = fingerprint()
+        now = datetime.utcnow()
+        entry = _cache().get((user_id, key), now) or _load(user_id, key, now)
+        if entry is not None:
+            return _replay(entry, fp)
+
+        # Заготовка. Истёкшая строка с тем же ключом (задача чистки до неё
+        # ещё не дошла) удаляется, иначе не даст вставить новую.
+        expires_at = now + timedelta(seconds=current_app.config["IDEMPOTENCY_TTL"])
+        db.session.execute(
+            delete(IdempotencyKey).where(
+                IdempotencyKey.user_id == user_id, IdempotencyKey.key == key, IdempotencyKey.expires_at < now
+            )
+        )
+        db.session.add(IdempotencyKey(user_id=user_id, key=key, fingerprint=fp, created_at=now, expires_at=expires_at))
+        try:
+            db.session.flush()
+        except IntegrityError:
+            # Тот же ключ только что занял параллельный запрос.
+            db.session.rollback()
+            entry = _load(user_id, key, now)
+            return _replay(entry or Entry(fp, None, None, expires_at), fp)
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            _release(user_id, key)
+            raise
+        if response.status_code >= 500:
+            db.session.rollback()
+            _release(user_id, key)
+            return response
+
+        entry = Entry(fp, response.status_code, response.get_data(as_text=True), expires_at)
+        _store(user_id, key, entry, now)
+        _cache().put((user_id, key), entry)
+        return response
+
+    return wrapper
+
+
+def sweep(batch_size: int = 1000) -> int:
+    # Удалить истёкшие ключи порциями (короткие транзакции не держат
+    # запись в базу надолго). Возвращает, сколько строк удалено.
+    now = datetime.utcnow()
+    removed = 0
+    while True:
+        ids = select(IdempotencyKey.id).where(IdempotencyKey.expires_at < now).limit(batch_size)
+        n = db.session.execute(
+            delete(IdempotencyKey)
+            .where(IdempotencyKey.id.in_(ids.scalar_subquery()))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        removed += n
+        if n < batch_size:
+            return removed
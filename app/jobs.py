@@ -0,0 +1,358 @@
+# Простая очередь фоновых задач, которая хранится в базе приложения (таблица job).
+#
+# Как это работает:
+#  1) обработчик запроса вызывает enqueue("имя", {...}) — в таблицу job
+#     добавляется строка, запрос сразу отвечает клиенту;
+#  2) воркер (`flask --app run jobs-worker`) периодически забирает готовые
+#     задачи и выполняет их в пуле потоков;
+#  3) если задача упала — она возвращается в очередь с паузой, которая
+#     растёт с каждой попыткой (экспоненциальный backoff), а после
+#     max_attempts попыток помечается как "failed";
+#  4) взятая задача "закрепляется" за воркером до locked_until
+#     (visibility timeout). Если воркер умер и не отчитался, задачу
+#     после этого времени возьмёт другой воркер.
+
+import json
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, func, or_, select, update
+
+from .extensions import db
+from .models import Job
+
+
+# Зарегистрированные обработчики: имя задачи → функция.
+_handlers = {}
+
+
+def job(name: str):
+    # Декоратор для регистрации обработчика:
+    #
+    #   @job("tickets.archive")
+    #   def archive(ticket_id): ...
+    #
+    # Параметры из payload передаются в функцию как именованные аргументы.
+    def decorator(func):
+        _handlers[name] = func
+        return func
+
+    return decorator
+
+
+def enqueue(name: str, payload: dict = None, delay: float = 0, max_attempts: int = None) -> Job:
+    # Ставим задачу в очередь.
+    # Задача только добавляется в текущую сессию — commit делает вызывающий
+    # код вместе со своими изменениями. Так задача и данные, ради которых
+    # она создана, сохраняются в одной транзакции (или не сохраняются вместе).
+    from flask import current_app
+
+    j = Job(
+        name=name,
+        payload=json.dumps(payload or {}),
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+        max_attempts=max_attempts or current_app.config["JOBS_MAX_ATTEMPTS"],
+    )
+    db.session.add(j)
+    return j
+
+
+def ensure_queued(name: str, payload: dict = None) -> bool:
+    # Поставить задачу, если такой ещё нет в очереди (ждущей или
+    # выполняющейся), и сохранить. Так запускаются периодические задачи:
+    # jobs-worker при старте ставит первую, дальше задача сама ставит
+    # следующую. Возвращает True, если задача поставлена.
+    pending = db.session.execute(
+        select(Job.id).where(Job.name == name, Job.status.in_(("queued", "running"))).limit(1)
+    ).first()
+    if pending is not None:
+        return False
+    enqueue(name, payload)
+    db.session.commit()
+    return True
+
+
+def _ready(now: datetime):
+    # Условие "задачу можно брать": она ждёт и время пришло,
+    # либо она "выполняется", но воркер не отчитался вовремя
+    # и попытки ещё не кончились.
+    return or_(
+        and_(Job.status == "queued", Job.run_at <= now),
+        and_(Job.status == "running", Job.locked_until < now, Job.attempts < Job.max_attempts),
+    )
+
+
+def claim(limit: int, visibility_timeout: float) -> list:
+    # Забираем до limit задач. Каждая задача захватывается отдельным
+    # условным UPDATE ... WHERE id=? AND <всё ещё готова>: если два воркера
+    # выбрали одну и ту же задачу, строку обновит только один из них.
+    now = datetime.utcnow()
+
+    # Задачи, на которых воркер "умирал" все max_attempts раз, больше
+    # не берём — иначе такая задача перезапускалась бы бесконечно.
+    db.session.execute(
+        update(Job)
+        .where(Job.status == "running", Job.locked_until < now, Job.attempts >= Job.max_attempts)
+        .values(status="failed", locked_until=None, last_error="visibility timeout expired")
+    )
+
+    candidates = db.session.execute(
+        select(Job.id).where(_ready(now)).order_by(Job.run_at, Job.id).limit(limit)
+    ).scalars().all()
+
+    claimed = []
+    for job_id in candidates:
+        result = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, _ready(now))
+            .values(
+                status="running",
+                attempts=Job.attempts + 1,
+                locked_until=now + timedelta(seconds=visibility_timeout),
+            )
+        )
+        if result.rowcount == 1:
+            claimed.append(job_id)
+    db.session.commit()
+    return claimed
+
+
+# Периодические задачи: каждая ставит следующую себя сама, а воркер
+# при запуске и потом раз в JOBS_SCHEDULE_INTERVAL секунд проверяет,
+# что все они в очереди. Так цепочка восстанавливается, даже если
+# задача упала max_attempts раз подряд.
+PERIODIC = ("sla.check", "sessions.sweep", "idempotency.sweep", "jobs.prune", "attachments.gc")
+
+
+def schedule_periodic() -> int:
+    # Поставить недостающие периодические задачи; возвращает, сколько поставлено.
+    return sum(ensure_queued(name) for name in PERIODIC)
+
+
+def backoff(attempts: int, base: float) -> float:
+    # Пауза перед повтором: base, 2*base, 4*base, ... но не больше часа.
+    return min(base * (2 ** (attempts - 1)), 3600)
+
+
+def execute(job_id: int):
+    # Выполнение одной задачи (внутри контекста приложения).
+    from flask import current_app
+
+    j = db.session.get(Job, job_id)
+    if j is None or j.status != "running":
+        return
+    # Номер своей попытки запоминаем до запуска: после rollback объект
+    # перечитается из базы, где задачу мог уже перехватить другой воркер.
+    attempt, max_attempts = j.attempts, j.max_attempts
+
+    try:
+        handler = _handlers.get(j.name)
+        if handler is None:
+            raise LookupError(f"unknown job: {j.name}")
+        handler(**json.loads(j.payload))
+    except Exception:
+        # Откатываем всё, что обработчик успел изменить, и записываем ошибку.
+        db.session.rollback()
+        error = traceback.format_exc(limit=5)
+        if attempt >= max_attempts:
+            values = {"status": "failed", "locked_until": None, "last_error": error}
+        else:
+            delay = backoff(attempt, current_app.config["JOBS_BACKOFF_BASE"])
+            values = {
+                "status": "queued",
+                "locked_until": None,
+                "last_error": error,
+                "run_at": datetime.utcnow() + timedelta(seconds=delay),
+            }
+    else:
+        values = {"status": "done", "locked_until": None}
+
+    # Отчитываемся только если задача всё ещё наша (не перехвачена по таймауту).
+    # attempts растёт при каждом захвате в claim(), поэтому номер попытки —
+    # метка владельца: у перехватившего воркера он уже другой.
+    db.session.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == "running", Job.attempts == attempt)
+        .values(**values)
+    )
+    db.session.commit()
+
+
+# ============================================================
+#                          ВОРКЕР
+# ============================================================
+
+class Worker:
+    # Забирает задачи из очереди и выполняет их в пуле потоков.
+    # Каждый поток работает в своём контексте приложения (и своей сессии БД).
+
+    def __init__(self, app, threads: int = 4, poll_interval: float = 1.0):
+        self.app = app
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.stopped = threading.Event()
+        self.scheduled_at = None
+
+    def _run_in_context(self, job_id: int):
+        with self.app.app_context():
+            execute(job_id)
+
+    def _schedule(self):
+        # Раз в JOBS_SCHEDULE_INTERVAL секунд — проверка периодических задач.
+        now = time.monotonic()
+        if self.scheduled_at is not None and now - self.scheduled_at < self.app.config["JOBS_SCHEDULE_INTERVAL"]:
+            return
+        self.scheduled_at = now
+        with self.app.app_context():
+            schedule_periodic()
+
+    def run_once(self, executor: ThreadPoolExecutor = None) -> int:
+        # Одна "порция": захватить задачи и дождаться их выполнения.
+        # Без executor задачи выполняются по очереди в текущем потоке.
+        with self.app.app_context():
+            ids = claim(self.threads, self.app.config["JOBS_VISIBILITY_TIMEOUT"])
+
+        if executor is None:
+            for job_id in ids:
+                self._run_in_context(job_id)
+        else:
+            list(executor.map(self._run_in_context, ids))
+        return len(ids)
+
+    def run_forever(self):
+        # Основной цикл воркера: работаем, пока есть задачи,
+        # а если очередь пуста — ждём poll_interval секунд.
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            while not self.stopped.is_set():
+                self._schedule()
+                if not self.run_once(executor):
+                    self.stopped.wait(self.poll_interval)
+
+    def stop(self):
+        self.stopped.set()
+
+
+def run_pending(app) -> int:
+    # Выполнить всё, что готово прямо сейчас, в текущем потоке.
+    # Удобно в тестах и для разовых запусков (`jobs-worker --once`).
+    worker = Worker(app)
+    total = 0
+    while True:
+        n = worker.run_once()
+        if not n:
+            return total
+        total += n
+
+
+# ============================================================
+#                   СТАТИСТИКА ДЛЯ АДМИНИСТРАТОРА
+# ============================================================
+
+def stats() -> dict:
+    # Глубина очереди по состояниям и возраст самой старой готовой задачи.
+    counts = dict(
+        db.session.execute(select(Job.status, func.count()).group_by(Job.status)).all()
+    )
+    oldest = db.session.execute(
+        select(func.min(Job.run_at)).where(Job.status == "queued")
+    ).scalar()
+    lag = (datetime.utcnow() - oldest).total_seconds() if oldest else 0
+    return {
+        "queued": counts.get("queued", 0),
+        "running": counts.get("running", 0),
+        "done": counts.get("done", 0),
+        "failed": counts.get("failed", 0),
+        "oldest_queued_seconds": max(lag, 0),
+    }
+
+
+def serialize(j: Job) -> dict:
+    return {
+        "id": j.id,
+        "name": j.name,
+        "payload": json.loads(j.payload),
+        "status": j.status,
+        "attempts": j.attempts,
+        "max_attempts": j.max_attempts,
+        "run_at": j.run_at.isoformat(),
+        "last_error": j.last_error,
+    }
+
+
+# ============================================================
+#                  ВСТРОЕННЫЕ СЛУЖЕБНЫЕ ЗАДАЧИ
+# ============================================================
+
+@job("jobs.prune")
+def prune(older_than: float = 7 * 24 * 3600):
+    # Удаляем выполненные задачи старше older_than секунд,
+    # чтобы таблица job не росла бесконечно, и ставим следующую чистку.
+    from flask import current_app
+
+    border = datetime.utcnow() - timedelta(seconds=older_than)
+    db.session.execute(delete(Job).where(Job.status == "done", Job.updated_at < border))
+    enqueue("jobs.prune", delay=current_app.config["JOBS_PRUNE_INTERVAL"])
+    db.session.commit()
+
+
+@job("attachments.gc")
+def attachments_gc(grace_seconds: float = 3600):
+    # Удаляем с диска файлы вложений, на которые больше нет ссылок
+    # (см. app/attachments.py), и ставим следующую сборку.
+    from flask import current_app
+    from . import attachments
+
+    attachments.gc(grace_seconds)
+    enqueue("attachments.gc", delay=current_app.config["ATTACHMENTS_GC_INTERVAL"])
+    db.session.commit()
+
+
+@job("notifications.fanout")
+def notifications_fanout(ticket_id: int, kind: str, actor_id: int, status: str = None):
+    # Записываем уведомления участникам заявки (см. app/notifications.py).
+    from . import notifications
+
+    notifications.fanout(ticket_id, kind, actor_id, status)
+
+
+@job("notifications.digest")
+def notifications_digest():
+    # Письма-сводки по накопившимся уведомлениям.
+    from . import notifications
+
+    notifications.digest()
+
+
+@job("sla.check")
+def sla_check(since: str = None):
+    # Уведомления о заявках, у которых истёк срок SLA; задача сама
+    # ставит следующую проверку (см. app/sla.py).
+    from . import sla
+
+    sla.check(since)
+
+
+@job("sessions.sweep")
+def sessions_sweep():
+    # Удаляем истёкшие сессии (см. app/sessions.py) и ставим следующую чистку.
+    from flask import current_app
+    from . import sessions
+
+    sessions.sweep()
+    enqueue("sessions.sweep", delay=current_app.config["SESSION_SWEEP_INTERVAL"])
+    db.session.commit()
+
+
+@job("idempotency.sweep")
+def idempotency_sweep(batch_size: int = 1000):
+    # Удаляем истёкшие ключи повторов (см. app/idempotency.py) и ставим
+    # следующую чистку.
+    from flask import current_app
+    from . import idempotency
+
+    idempotency.sweep(batch_size)
+    enqueue("idempotency.sweep", delay=current_app.config["IDEMPOTENCY_SWEEP_INTERVAL"])
+    db.session.commit()
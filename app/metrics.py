@@ -0,0 +1,47 @@
+# Простые счётчики внутри процесса (сколько раз что-то произошло).
+# Их можно посмотреть администратору через GET /admin/metrics.
+#
+# Счётчики живут в памяти процесса: при нескольких воркерах у каждого свои.
+#
+# Кроме счётчиков есть наблюдения (observe): для величин вроде задержки
+# хранится число наблюдений, их сумма и максимум — <имя>.count/.sum/.max.
+
+import threading
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_observations = {}  # имя → [сколько, сумма, максимум]
+
+
+def incr(name: str, value: int = 1):
+    # Увеличить счётчик name на value.
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name: str, value: float):
+    # Запомнить ещё одно значение величины name (например, задержку в секундах).
+    with _lock:
+        o = _observations.setdefault(name, [0, 0.0, value])
+        o[0] += 1
+        o[1] += value
+        o[2] = max(o[2], value)
+
+
+def snapshot() -> dict:
+    # Копия всех счётчиков и наблюдений (чтобы отдать в JSON).
+    with _lock:
+        result = dict(_counters)
+        for name, (count, total, peak) in _observations.items():
+            result[f"{name}.count"] = count
+            result[f"{name}.sum"] = total
+            result[f"{name}.max"] = peak
+        return result
+
+
+def reset():
+    # Обнулить всё (используется в тестах).
+    with _lock:
+        _counters.clear()
+        _observations.clear()
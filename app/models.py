@@ -72,12 +72,295 @@ class Ticket(db.Model):
 
     # Внешний ключ на пользователя (автора заявки).
     # В таблице ticket будет колонка author_id, которая "ссылается" на user.id.
-    author_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    # index=True — быстрый поиск заявок автора ("мои заявки", удаление
+    # всех заявок пользователя одним запросом).
+    author_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
+
+    # Исполнитель — сотрудник поддержки, который взял заявку в работу.
+    # NULL — заявка ещё никому не назначена.
+    assignee_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True)
+
+    # Номер версии заявки (оптимистичная блокировка).
+    # Каждое изменение увеличивает его на 1. Изменение применяется только
+    # если версия в базе совпадает с той, которую видел клиент:
+    # UPDATE ... WHERE id = ? AND version = ?. Иначе — конфликт (409/412).
+    version = db.Column(db.Integer, default=1, nullable=False)
+
+    # Сколько комментариев у заявки. Хранится прямо в строке заявки и
+    # увеличивается вместе с добавлением комментария, поэтому список заявок
+    # показывает активность без COUNT(*) по комментариям для каждой строки.
+    comment_count = db.Column(db.Integer, default=0, nullable=False)
+
+    # Сколько файлов приложено к заявке (см. модель Attachment) —
+    # так же хранится готовым числом, как и comment_count.
+    attachment_count = db.Column(db.Integer, default=0, nullable=False)
+
+    # Срок реакции (SLA): до какого времени заявка должна уйти из текущего
+    # статуса. Пересчитывается при каждой смене статуса (app/sla.py);
+    # NULL — у статуса нет срока (например, "closed").
+    deadline = db.Column(db.DateTime, nullable=True)
+
+    # Когда заявку закрыли (NULL — не закрыта). Ставится при переходе в
+    # "closed", сбрасывается при повторном открытии; по нему считается
+    # время решения в отчётах (app/reports.py).
+    closed_at = db.Column(db.DateTime, nullable=True)
 
     # Связь с моделью User.
     # Позволяет из заявки обратиться к пользователю: t.author.username.
     # backref создаёт обратную связь: из пользователя можно обратиться к его заявкам: user.tickets.
+    # foreign_keys — у заявки две ссылки на user (автор и исполнитель),
+    # поэтому указываем, по какой колонке строится каждая связь.
     author = db.relationship(
         "User",
+        foreign_keys=[author_id],
         backref=db.backref("tickets", lazy=True),
     )
+
+    # Исполнитель заявки: t.assignee.username (или None).
+    assignee = db.relationship("User", foreign_keys=[assignee_id])
+
+    # version_id_col — SQLAlchemy сам увеличивает version и проверяет её
+    # при каждом изменении заявки через ORM (t.status = ...; commit()).
+    __mapper_args__ = {"version_id_col": version}
+
+    # Индексы очередей работы:
+    #  - частичный индекс только по открытым и никому не назначенным заявкам
+    #    (WHERE status = 'open' AND assignee_id IS NULL) — "взять следующую
+    #    заявку" читает из него первую запись, не просматривая таблицу;
+    #    индекс маленький: заявки из него уходят, как только их берут;
+    #  - (assignee_id, status, created_at) только по назначенным заявкам —
+    #    "мои заявки в работе" по статусу.
+    # И индекс сроков (status, deadline) только по заявкам со сроком:
+    # просроченные заявки статуса — это его диапазон от начала до "сейчас"
+    # (app/sla.py). Закрытые заявки (без срока) в него не попадают, поэтому
+    # индекс не растёт вместе с историей.
+    __table_args__ = (
+        db.Index(
+            "ix_ticket_unassigned_open",
+            "created_at",
+            "id",
+            sqlite_where=db.and_(status == "open", assignee_id.is_(None)),
+            postgresql_where=db.and_(status == "open", assignee_id.is_(None)),
+        ),
+        db.Index(
+            "ix_ticket_assignee_status",
+            "assignee_id",
+            "status",
+            "created_at",
+            sqlite_where=assignee_id.is_not(None),
+            postgresql_where=assignee_id.is_not(None),
+        ),
+        db.Index(
+            "ix_ticket_status_deadline",
+            "status",
+            "deadline",
+            sqlite_where=deadline.is_not(None),
+            postgresql_where=deadline.is_not(None),
+        ),
+    )
+
+
+# Класс Comment описывает таблицу "comment" — переписка по заявке
+# между автором и администраторами.
+class Comment(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+
+    # Номер заявки. Без внешнего ключа: в режиме шардирования
+    # (app/sharding.py) сама заявка лежит не в основной базе.
+    ticket_id = db.Column(db.Integer, nullable=False)
+
+    # Автор комментария. NULL — пользователь был удалён,
+    # а его комментарии в чужих заявках остались.
+    author_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True)
+
+    # Текст комментария.
+    body = db.Column(db.Text, nullable=False)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    # Автор: c.author.username (или None, если пользователь удалён).
+    author = db.relationship("User")
+
+    # Комментарии заявки читаются страницами по порядку (created_at, id):
+    # "следующая страница" — это продолжение индекса с места, где закончилась
+    # предыдущая (keyset), без OFFSET и без чтения всей переписки.
+    __table_args__ = (db.Index("ix_comment_ticket_created", "ticket_id", "created_at", "id"),)
+
+
+# Класс Attachment описывает таблицу "attachment" — файлы, приложенные
+# к заявке. Здесь только сведения о файле, само содержимое лежит на диске
+# под именем sha256 (см. app/attachments.py); одинаковые файлы в разных
+# заявках — разные строки с одним и тем же sha256.
+class Attachment(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+
+    # Номер заявки (без внешнего ключа — как у Comment, из-за шардов).
+    ticket_id = db.Column(db.Integer, nullable=False, index=True)
+
+    # Кто загрузил файл. NULL — пользователь удалён.
+    uploader_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True)
+
+    # Имя файла, как его назвал пользователь (уже очищенное), и тип содержимого.
+    filename = db.Column(db.String(255), nullable=False)
+    content_type = db.Column(db.String(100), nullable=False, default="application/octet-stream")
+
+    # Размер в байтах и SHA-256 содержимого (имя файла на диске).
+    size = db.Column(db.Integer, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False, index=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    uploader = db.relationship("User")
+
+
+# Класс Notification описывает таблицу "notification" — уведомления
+# пользователю: сменился статус его заявки, появился комментарий.
+# Строки создаёт фоновая задача notifications.fanout (app/notifications.py),
+# а не обработчик запроса, поэтому изменение заявки не становится медленнее.
+class Notification(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+
+    # Кому уведомление.
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+
+    # О какой заявке и что случилось ("status" или "comment").
+    ticket_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    message = db.Column(db.String(300), nullable=False)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    # Когда пользователь прочитал уведомление (NULL — не прочитано).
+    read_at = db.Column(db.DateTime, nullable=True)
+
+    # Когда уведомление попало в письмо-сводку (NULL — ещё не попало).
+    digested_at = db.Column(db.DateTime, nullable=True)
+
+    # Частичные индексы только по "живым" строкам:
+    #  - непрочитанные пользователя — счётчик в шапке страницы считается
+    #    по маленькому индексу, а не по всей истории уведомлений;
+    #  - ещё не попавшие в сводку — их выбирает задача notifications.digest.
+    # Плюс (user_id, id) — список "мои уведомления, новые сверху".
+    __table_args__ = (
+        db.Index(
+            "ix_notification_unread",
+            "user_id",
+            sqlite_where=read_at.is_(None),
+            postgresql_where=read_at.is_(None),
+        ),
+        db.Index(
+            "ix_notification_undigested",
+            "user_id",
+            "id",
+            sqlite_where=digested_at.is_(None),
+            postgresql_where=digested_at.is_(None),
+        ),
+        db.Index("ix_notification_user_id", "user_id", "id"),
+    )
+
+
+# Класс OutboxMessage описывает таблицу "outbox_message" — исходящие
+# письма-сводки. Это заменитель почты: письмо "отправлено", когда оно
+# записано сюда; настоящая отправка может забирать письма из этой таблицы.
+class OutboxMessage(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, index=True)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+# Класс TicketDailyStats описывает таблицу "ticket_daily_stats" — готовые
+# итоги по дням для отчётов (app/reports.py): сколько заявок создано и
+# сколько закрыто за день. Строки обновляются при каждом создании/закрытии
+# заявки, поэтому отчёт за любой период читает по строке на день, а не
+# всю таблицу ticket.
+class TicketDailyStats(db.Model):
+    __tablename__ = "ticket_daily_stats"
+
+    day = db.Column(db.Date, primary_key=True)
+    created = db.Column(db.Integer, default=0, nullable=False)
+    closed = db.Column(db.Integer, default=0, nullable=False)
+
+
+# Класс TicketCloseHistogram описывает таблицу "ticket_close_histogram" —
+# распределение времени решения по дням: сколько заявок, закрытых в этот
+# день, решались в пределах каждой "корзины" (до 5 минут, до часа, до дня...).
+# Медиана за период считается по сумме гистограмм его дней — без
+# хранения и сортировки времени каждой заявки.
+class TicketCloseHistogram(db.Model):
+    __tablename__ = "ticket_close_histogram"
+
+    day = db.Column(db.Date, primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, default=0, nullable=False)
+
+
+# Класс IdempotencyKey описывает таблицу "idempotency_key" — ответы на
+# запросы с заголовком Idempotency-Key (app/idempotency.py). Клиент,
+# повторяющий POST после таймаута, получает сохранённый ответ, а заявка
+# второй раз не создаётся. Строки живут IDEMPOTENCY_TTL секунд.
+class IdempotencyKey(db.Model):
+    __tablename__ = "idempotency_key"
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    # Ключ уникален в пределах пользователя: чужой ключ не даёт чужой ответ.
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+
+    # Отпечаток запроса (метод, адрес, тело): тот же ключ с другим
+    # запросом — ошибка клиента, а не повтор.
+    fingerprint = db.Column(db.String(64), nullable=False)
+
+    # Сохранённый ответ. status_code NULL — запрос ещё выполняется.
+    status_code = db.Column(db.Integer, nullable=True)
+    body = db.Column(db.Text, nullable=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    __table_args__ = (db.UniqueConstraint("user_id", "key", name="uq_idempotency_user_key"),)
+
+
+# Класс Job описывает таблицу "job" — очередь фоновых задач.
+# Обработчик запроса кладёт сюда задачу и сразу отвечает клиенту,
+# а выполняет её отдельный процесс-воркер (см. app/jobs.py).
+class Job(db.Model):
+    # Уникальный идентификатор задачи.
+    id = db.Column(db.Integer, primary_key=True)
+
+    # Имя обработчика, например "jobs.prune".
+    name = db.Column(db.String(100), nullable=False)
+
+    # Параметры задачи в виде JSON-строки.
+    payload = db.Column(db.Text, nullable=False, default="{}")
+
+    # Состояние: "queued" (ждёт), "running" (выполняется), "done" (готово), "failed" (сдались).
+    status = db.Column(db.String(20), default="queued", nullable=False)
+
+    # Сколько раз задачу уже пытались выполнить и сколько попыток разрешено.
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=5, nullable=False)
+
+    # Не раньше какого времени задачу можно брать в работу
+    # (так делаются отложенные задачи и паузы между повторами).
+    run_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    # До какого времени задача "закреплена" за воркером (visibility timeout).
+    # Если воркер упал и не отчитался, после этого времени задачу возьмёт другой.
+    locked_until = db.Column(db.DateTime, nullable=True)
+
+    # Текст последней ошибки (для разбора упавших задач).
+    last_error = db.Column(db.Text, nullable=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(
+        db.DateTime,
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow,
+        nullable=False,
+    )
+
+    # Индекс для выборки "какие задачи пора выполнять": status + run_at.
+    __table_args__ = (db.Index("ix_job_status_run_at", "status", "run_at"),)
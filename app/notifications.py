@@ -0,0 +1,136 @@
+# Уведомления о смене статуса заявки и новых комментариях.
+#
+# Путь уведомления:
+#  1) обработчик запроса (app/services.py) только ставит в очередь задачу
+#     notifications.fanout — в той же транзакции, что и само изменение;
+#     запрос пользователя не ждёт рассылки;
+#  2) задача fanout определяет получателей (автор и исполнитель заявки,
+#     кроме того, кто сделал изменение) и записывает им уведомления;
+#  3) если сводка ещё не запланирована, fanout ставит задачу
+#     notifications.digest с задержкой NOTIFY_DIGEST_INTERVAL. Всё, что
+#     случилось за это время, попадает в ОДНО письмо каждому получателю
+#     (таблица outbox_message — заменитель почты), а не письмо на каждое
+#     изменение. Уже прочитанные на сайте уведомления в письмо не попадают.
+#
+# Сами задачи зарегистрированы в app/jobs.py.
+
+from datetime import datetime
+from itertools import groupby
+
+from flask import current_app
+from sqlalchemy import insert, select, update
+
+from . import sharding
+from .extensions import db
+from .models import Job, Notification, OutboxMessage, Ticket
+
+MESSAGES = {
+    "status": "Заявка «{title}»: статус {status}",
+    "comment": "Новый комментарий к заявке «{title}»",
+    "sla": "Просрочена заявка «{title}» (статус {status})",
+}
+
+
+def notify(ticket_id: int, kind: str, actor_id: int, status: str = None):
+    # Запланировать рассылку. Задача добавляется в текущую сессию,
+    # commit делает вызывающий код вместе со своим изменением.
+    # status — новый статус заявки: к моменту выполнения задачи он мог
+    # смениться ещё раз, а в уведомлении должен быть именно этот.
+    from . import jobs
+
+    jobs.enqueue(
+        "notifications.fanout",
+        {"ticket_id": ticket_id, "kind": kind, "actor_id": actor_id, "status": status},
+    )
+
+
+def _load_ticket(ticket_id: int):
+    if sharding.enabled():
+        return sharding.get(ticket_id)
+    return db.session.execute(
+        select(Ticket.id, Ticket.title, Ticket.status, Ticket.author_id, Ticket.assignee_id)
+        .where(Ticket.id == ticket_id)
+    ).first()
+
+
+def fanout(ticket_id: int, kind: str, actor_id: int, status: str = None):
+    # Записать уведомления всем заинтересованным в заявке.
+    t = _load_ticket(ticket_id)
+    if t is None:
+        return  # заявку уже удалили
+
+    recipients = {t.author_id, t.assignee_id} - {None, actor_id}
+    if not recipients:
+        return
+
+    message = MESSAGES[kind].format(title=t.title, status=status or t.status)
+    deliver(recipients, ticket_id, kind, message)
+    db.session.commit()
+
+
+def deliver(user_ids, ticket_id: int, kind: str, message: str):
+    # Записать одно и то же уведомление нескольким пользователям
+    # (одним INSERT) и запланировать сводку. Без commit.
+    if not user_ids:
+        return
+    now = datetime.utcnow()
+    db.session.execute(
+        insert(Notification),
+        [
+            {"user_id": uid, "ticket_id": ticket_id, "kind": kind, "message": message, "created_at": now}
+            for uid in sorted(set(user_ids))
+        ],
+    )
+    schedule_digest()
+
+
+def schedule_digest():
+    # Одна ожидающая сводка на всех: если она уже в очереди, новые
+    # уведомления просто попадут в неё.
+    from . import jobs
+
+    pending = db.session.execute(
+        select(Job.id).where(Job.status == "queued", Job.name == "notifications.digest").limit(1)
+    ).first()
+    if pending is None:
+        jobs.enqueue("notifications.digest", delay=current_app.config["NOTIFY_DIGEST_INTERVAL"])
+
+
+def digest(batch_size: int = 1000) -> int:
+    # Собрать ещё не отправленные уведомления в письма — по одному
+    # на пользователя. Возвращает число записанных писем.
+    now = datetime.utcnow()
+    sent = 0
+    while True:
+        rows = db.session.execute(
+            select(Notification.id, Notification.user_id, Notification.message, Notification.read_at)
+            .where(Notification.digested_at.is_(None))
+            .order_by(Notification.user_id, Notification.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return sent
+
+        messages = []
+        for user_id, group in groupby(rows, key=lambda r: r.user_id):
+            # Прочитанное на сайте в письмо не включаем.
+            lines = [r.message for r in group if r.read_at is None]
+            if lines:
+                messages.append(
+                    {
+                        "user_id": user_id,
+                        "subject": f"Техподдержка: новых событий — {len(lines)}",
+                        "body": "\n".join(f"- {line}" for line in lines),
+                        "created_at": now,
+                    }
+                )
+        if messages:
+            db.session.execute(insert(OutboxMessage), messages)
+        db.session.execute(
+            update(Notification)
+            .where(Notification.id.in_([r.id for r in rows]))
+            .values(digested_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        sent += len(messages)
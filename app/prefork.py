@@ -0,0 +1,95 @@
+# Режим "подготовить, затем размножить" (preload-then-fork).
+#
+# Главный процесс один раз создаёт приложение, компилирует все шаблоны
+# и открывает сокет, а затем делает fork() нужное число раз.
+# Дочерние процессы получают уже готовое приложение и кэш шаблонов
+# (память общая до первой записи — copy-on-write), поэтому новый воркер
+# начинает отвечать сразу, без повторных импортов и компиляции.
+# Если воркер завершился, главный процесс запускает новый.
+#
+# Работает только там, где есть os.fork() (Linux, macOS).
+
+import os
+import signal
+import socket
+
+from werkzeug.serving import make_server
+
+from .extensions import db
+
+
+def warm_up(app):
+    # Компилируем все HTML-шаблоны в кэш окружения Jinja.
+    for name in app.jinja_env.list_templates():
+        if name.endswith(".html"):
+            app.jinja_env.get_template(name)
+
+    # Соединения с базой нельзя делить между процессами: закрываем
+    # пул в главном процессе, каждый воркер откроет свои соединения.
+    with app.app_context():
+        db.engine.dispose()
+    if "db_replica" in app.extensions:
+        app.extensions["db_replica"].dispose()
+    if "ticket_shards" in app.extensions:
+        for engine in app.extensions["ticket_shards"].engines:
+            engine.dispose()
+
+
+def _listen(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _child(app, host: str, port: int, sock: socket.socket, threaded: bool):
+    # Код воркера: обычные сигналы и сервер на общем сокете.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    server = make_server(host, port, app, threaded=threaded, fd=sock.fileno())
+    try:
+        server.serve_forever()
+    finally:
+        os._exit(0)
+
+
+def serve(app, host: str = "127.0.0.1", port: int = 5000, workers: int = 2, threaded: bool = False):
+    warm_up(app)
+    sock = _listen(host, port)
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            _child(app, host, port, sock, threaded)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        spawn()
+    print(f"Слушаем http://{host}:{port}, воркеров: {workers} (pid {os.getpid()})")
+
+    # Ждём завершения воркеров; упавшего заменяем новым.
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            spawn()
+    sock.close()
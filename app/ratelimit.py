@@ -0,0 +1,165 @@
+# Ограничение частоты попыток входа (rate limiting) по алгоритму token bucket.
+#
+# У каждого IP-адреса и у каждого имени пользователя есть своё "ведро" жетонов.
+# Каждая попытка входа забирает один жетон, а жетоны постепенно
+# восстанавливаются с постоянной скоростью. Пустое ведро — попытка
+# отклоняется с кодом 429 и заголовком Retry-After, причём ДО проверки
+# пароля: дорогой bcrypt для отклонённых попыток вообще не выполняется.
+#
+# Два ограничения работают вместе:
+#  - по IP — против перебора множества логинов с одного адреса
+#    (credential stuffing);
+#  - по имени пользователя — против подбора пароля к одной учётной записи
+#    с множества адресов.
+#
+# Хранилище ведер:
+#  - по умолчанию — словарь в памяти процесса;
+#  - RATELIMIT_STORAGE=<путь к файлу> — общий SQLite-файл, чтобы
+#    несколько процессов на одной машине делили одни и те же лимиты.
+
+import math
+import os
+import threading
+import time
+
+from flask import current_app, request
+
+from . import metrics
+
+
+def parse_rule(rule: str):
+    # "20/60" → (20 жетонов максимум, 20 жетонов за 60 секунд).
+    count, seconds = rule.split("/")
+    capacity = float(count)
+    return capacity, capacity / float(seconds)
+
+
+class MemoryStore:
+    # Ведра в словаре: ключ → (жетонов осталось, время последнего обновления).
+
+    def __init__(self, max_keys: int = 100_000):
+        self.buckets = {}
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+
+    def take(self, key: str, capacity: float, rate: float, now: float) -> float:
+        # Забрать жетон. Возвращает 0, если можно, иначе — сколько секунд ждать.
+        with self.lock:
+            tokens, stamp = self.buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - stamp) * rate)
+            if tokens >= 1:
+                self.buckets[key] = (tokens - 1, now)
+                return 0
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_keys:
+                self._evict(now, capacity, rate)
+            return (1 - tokens) / rate
+
+    def _evict(self, now: float, capacity: float, rate: float):
+        # Выбрасываем ведра, которые уже успели наполниться до краёв:
+        # они ничем не отличаются от отсутствующих.
+        full_after = capacity / rate
+        for key, (_, stamp) in list(self.buckets.items()):
+            if now - stamp >= full_after:
+                del self.buckets[key]
+
+
+class SqliteStore:
+    # Ведра в общем SQLite-файле. BEGIN IMMEDIATE сразу берёт блокировку
+    # на запись, поэтому чтение и обновление ведра атомарны между процессами.
+    # Соединение — своё у каждого потока и каждого процесса: открывается
+    # при первом обращении, а после fork (app/prefork.py) — заново, потому
+    # что соединение SQLite нельзя делить с родительским процессом.
+
+    def __init__(self, path: str):
+        self.path = path
+        self.pid = os.getpid()
+        self.local = threading.local()
+
+    def _connect(self):
+        pid = os.getpid()
+        if self.pid != pid:
+            self.pid = pid
+            self.local = threading.local()
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            # sqlite3 нужен только в этом режиме — импортируем по требованию.
+            import sqlite3
+
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS bucket "
+                "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, stamp REAL NOT NULL)"
+            )
+            self.local.conn = conn
+        return conn
+
+    def take(self, key: str, capacity: float, rate: float, now: float) -> float:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, stamp FROM bucket WHERE key = ?", (key,)).fetchone()
+            tokens, stamp = row if row else (capacity, now)
+            tokens = min(capacity, tokens + (now - stamp) * rate)
+            wait = 0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            conn.execute(
+                "INSERT OR REPLACE INTO bucket (key, tokens, stamp) VALUES (?, ?, ?)",
+                (key, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+
+class RateLimiter:
+    # Набор правил "что ограничиваем" поверх одного хранилища.
+
+    def __init__(self, store, rules: dict):
+        self.store = store
+        # rules: {"ip": (capacity, rate), "user": (capacity, rate)}
+        self.rules = rules
+
+    def hit(self, **keys) -> int:
+        # Одна попытка: hit(ip="1.2.3.4", user="bob").
+        # Возвращает 0 — можно продолжать, иначе — Retry-After в секундах.
+        # Ведра проверяются по порядку, и на первом пустом проверка
+        # останавливается: попытки с заблокированного IP не тратят жетоны
+        # учётной записи, иначе перебор с одного адреса запирал бы вход
+        # её владельцу.
+        now = time.time()
+        for kind, value in keys.items():
+            if not value or kind not in self.rules:
+                continue
+            capacity, rate = self.rules[kind]
+            wait = self.store.take(f"{kind}:{value}", capacity, rate, now)
+            if wait:
+                metrics.incr(f"ratelimit.throttled.{kind}")
+                metrics.incr("ratelimit.throttled")
+                return math.ceil(wait)
+        return 0
+
+
+def init_app(app):
+    # Создаём ограничитель для приложения и кладём его в app.extensions.
+    storage = app.config["RATELIMIT_STORAGE"]
+    store = SqliteStore(storage) if storage else MemoryStore()
+    app.extensions["ratelimiter"] = RateLimiter(
+        store,
+        {
+            "ip": parse_rule(app.config["RATELIMIT_LOGIN_IP"]),
+            "user": parse_rule(app.config["RATELIMIT_LOGIN_USER"]),
+        },
+    )
+
+
+def check_login(username: str) -> int:
+    # Вызывается в начале обработчиков входа, до проверки пароля.
+    # Возвращает 0 или количество секунд для заголовка Retry-After.
+    if not current_app.config["RATELIMIT_ENABLED"]:
+        return 0
+    limiter = current_app.extensions["ratelimiter"]
+    return limiter.hit(ip=request.remote_addr, user=username.lower())
@@ -0,0 +1,246 @@
+# Отчёты по заявкам: сколько создано и закрыто за день/неделю и медианное
+# время решения.
+#
+# Считать это по таблице ticket в момент запроса — значит каждый раз читать
+# все заявки периода. Вместо этого итоги копятся заранее, по дням (UTC):
+#  - ticket_daily_stats     — день → создано, закрыто;
+#  - ticket_close_histogram — день, корзина → сколько заявок, закрытых в
+#    этот день, решались столько времени (корзины: до 5 минут, до 15 минут,
+#    ..., до 90 дней, больше).
+#
+# Итоги обновляются в той же транзакции, что и сама заявка: создание — +1
+# к created сегодняшнего дня, закрытие — +1 к closed и к корзине времени
+# решения (INSERT ... ON CONFLICT DO UPDATE SET n = n + 1). Закрытие
+# считается событием: заявку открыли заново и закрыли ещё раз — это два
+# закрытия, и уже учтённые дни не пересчитываются.
+#
+# Отчёт за любой период — сумма строк его дней (чтение по первичному ключу
+# диапазоном), медиана — по сумме гистограмм (с точностью до корзины,
+# внутри корзины — линейная интерполяция).
+#
+# Данные, появившиеся до этого модуля (или импортированные мимо него),
+# учитывает команда `flask --app run reports-backfill`.
+
+from bisect import bisect_left
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import case, delete, select
+
+from .extensions import db
+from .models import Ticket, TicketCloseHistogram, TicketDailyStats
+
+# Верхние границы корзин времени решения, в секундах. Последняя корзина
+# (номер len(BUCKETS)) — всё, что дольше.
+BUCKETS = [
+    5 * 60, 15 * 60, 30 * 60, 3600, 2 * 3600, 4 * 3600, 8 * 3600, 12 * 3600,
+    86400, 2 * 86400, 3 * 86400, 5 * 86400, 7 * 86400, 14 * 86400, 30 * 86400, 90 * 86400,
+]
+
+INTERVALS = ("day", "week")
+
+
+def bucket_of(seconds: float) -> int:
+    return bisect_left(BUCKETS, seconds)
+
+
+def _upsert(model, keys: dict, increments: dict):
+    # INSERT INTO <model> (...) VALUES (...)
+    # ON CONFLICT (<ключ>) DO UPDATE SET n = n + :n
+    # Одна строка на день — одновременные записи не создают дубликатов.
+    if db.engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    table = model.__table__
+    stmt = insert(table).values(**keys, **increments)
+    db.session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={name: table.c[name] + stmt.excluded[name] for name in increments},
+        )
+    )
+
+
+def record_created(now: datetime):
+    # Учесть созданную заявку (без commit).
+    _upsert(TicketDailyStats, {"day": now.date()}, {"created": 1, "closed": 0})
+
+
+def record_closed(created_at: datetime, closed_at: datetime):
+    # Учесть закрытие заявки (без commit).
+    day = closed_at.date()
+    _upsert(TicketDailyStats, {"day": day}, {"created": 0, "closed": 1})
+    seconds = (closed_at - created_at).total_seconds()
+    _upsert(TicketCloseHistogram, {"day": day, "bucket": bucket_of(seconds)}, {"count": 1})
+
+
+def closed_transition(table, status: str, now: datetime):
+    # Значение для SET closed_at = ... в UPDATE, меняющем статус:
+    #  - закрываем:      CASE WHEN status = 'closed' THEN closed_at ELSE :now END
+    #    (уже закрытая заявка сохраняет прежнее время закрытия);
+    #  - любой другой статус — NULL.
+    # Если после UPDATE closed_at == now, заявка закрыта именно сейчас —
+    # так record_transition узнаёт о закрытии без чтения старой строки.
+    if status != "closed":
+        return None
+    return case((table.c.status == "closed", table.c.closed_at), else_=now)
+
+
+def record_transition(status: str, now: datetime, row):
+    # Учесть результат UPDATE статуса (row — RETURNING created_at, closed_at).
+    if status == "closed" and row.closed_at == now:
+        record_closed(row.created_at, now)
+
+
+# ============================================================
+#                         ОТЧЁТ
+# ============================================================
+
+def _median(histogram: Counter):
+    # Медиана по гистограмме: корзина, в которую попадает середина,
+    # и линейная интерполяция внутри неё. None — закрытий не было.
+    total = sum(histogram.values())
+    if not total:
+        return None
+    half = total / 2
+    seen = 0
+    for bucket in range(len(BUCKETS) + 1):
+        n = histogram.get(bucket, 0)
+        if n and seen + n >= half:
+            low = BUCKETS[bucket - 1] if bucket else 0
+            high = BUCKETS[bucket] if bucket < len(BUCKETS) else low * 2
+            return low + (high - low) * (half - seen) / n
+        seen += n
+    return None
+
+
+def _period(day: date, interval: str) -> date:
+    # Начало периода, в который попадает день (неделя — с понедельника).
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def ticket_report(start: date, end: date, interval: str = "day") -> dict:
+    # Создано/закрыто и медиана времени решения по дням или неделям
+    # в [start, end]. Два запроса по первичным ключам итоговых таблиц.
+    stats = db.session.execute(
+        select(TicketDailyStats.day, TicketDailyStats.created, TicketDailyStats.closed)
+        .where(TicketDailyStats.day.between(start, end))
+    ).all()
+    hist = db.session.execute(
+        select(TicketCloseHistogram.day, TicketCloseHistogram.bucket, TicketCloseHistogram.count)
+        .where(TicketCloseHistogram.day.between(start, end))
+    ).all()
+
+    periods = {}
+    day = _period(start, interval)
+    step = timedelta(days=7 if interval == "week" else 1)
+    while day <= end:
+        periods[day] = {"created": 0, "closed": 0, "histogram": Counter()}
+        day += step
+
+    totals = Counter()
+    for row in stats:
+        p = periods[_period(row.day, interval)]
+        p["created"] += row.created
+        p["closed"] += row.closed
+    for row in hist:
+        periods[_period(row.day, interval)]["histogram"][row.bucket] += row.count
+        totals[row.bucket] += row.count
+
+    series = [
+        {
+            "period": day.isoformat(),
+            "created": p["created"],
+            "closed": p["closed"],
+            "median_close_seconds": _median(p["histogram"]),
+        }
+        for day, p in periods.items()
+    ]
+    return {
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "interval": interval,
+        "series": series,
+        "total": {
+            "created": sum(p["created"] for p in periods.values()),
+            "closed": sum(p["closed"] for p in periods.values()),
+            "median_close_seconds": _median(totals),
+        },
+    }
+
+
+# ============================================================
+#                   ПЕРЕСЧЁТ ПО ИСТОРИИ
+# ============================================================
+
+def _ticket_tables():
+    # Все таблицы заявок: основная или таблицы шардов.
+    from . import sharding
+
+    if sharding.enabled():
+        from flask import current_app
+
+        return [(engine, sharding.ticket_table) for engine in current_app.extensions["ticket_shards"].engines]
+    return [(None, Ticket.__table__)]
+
+
+def _scan(conn, t, created: Counter, closed: Counter, histogram: Counter, batch_size: int):
+    # Одна таблица заявок: дописать closed_at старым закрытым заявкам и
+    # сложить заявки в счётчики, читая порциями по id.
+    conn.execute(
+        t.update().where(t.c.status == "closed", t.c.closed_at.is_(None)).values(closed_at=t.c.updated_at)
+    )
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(t.c.id, t.c.created_at, t.c.closed_at)
+            .where(t.c.id > last_id)
+            .order_by(t.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return
+        for row in rows:
+            created[row.created_at.date()] += 1
+            if row.closed_at is not None:
+                day = row.closed_at.date()
+                closed[day] += 1
+                histogram[day, bucket_of((row.closed_at - row.created_at).total_seconds())] += 1
+        last_id = rows[-1].id
+
+
+def backfill(batch_size: int = 1000) -> dict:
+    # Пересчитать итоги целиком по таблице ticket (первый запуск или после
+    # импорта). Закрытым заявкам без closed_at (закрыты до появления
+    # колонки) временем закрытия считается updated_at. Итоги строятся
+    # в памяти (строк — дни × корзины) и записываются одной транзакцией.
+    created = Counter()
+    closed = Counter()
+    histogram = Counter()
+
+    for engine, t in _ticket_tables():
+        if engine is None:
+            _scan(db.session, t, created, closed, histogram, batch_size)
+        else:
+            with engine.begin() as conn:
+                _scan(conn, t, created, closed, histogram, batch_size)
+
+    db.session.execute(delete(TicketDailyStats))
+    db.session.execute(delete(TicketCloseHistogram))
+    days = sorted(set(created) | set(closed))
+    if days:
+        db.session.execute(
+            TicketDailyStats.__table__.insert(),
+            [{"day": d, "created": created[d], "closed": closed[d]} for d in days],
+        )
+    if histogram:
+        db.session.execute(
+            TicketCloseHistogram.__table__.insert(),
+            [{"day": d, "bucket": b, "count": n} for (d, b), n in sorted(histogram.items())],
+        )
+    db.session.commit()
+    return {"days": len(days), "tickets": sum(created.values()), "closed": sum(closed.values())}
@@ -0,0 +1,130 @@
+# Маршрутизация запросов к базе: основная база (primary) и реплика для чтения.
+#
+# Если задан REPLICA_DATABASE_URL, у приложения появляется второй движок
+# (app.extensions["db_replica"]). Обработчики, помеченные @read_only, выполняют SELECT-запросы
+# на реплике, а все изменения (INSERT/UPDATE/DELETE, flush) всегда идут
+# в основную базу.
+#
+# Read-your-writes: реплика может немного отставать от основной базы.
+# Поэтому после того как пользователь что-то изменил, в его сессию
+# записывается время последней записи, и ещё REPLICA_RYW_SECONDS секунд
+# его GET-запросы читают из основной базы — он сразу видит свои изменения.
+# У клиентов с токеном (app/tokens.py) cookie-сессии нет: время их записи
+# хранится в памяти процесса по id пользователя — новая сессия на каждый
+# такой запрос только засоряла бы хранилище сессий.
+
+import threading
+import time
+from functools import wraps
+
+import sqlalchemy as sa
+from flask import current_app, g, has_request_context, request, session
+from flask_login import current_user
+from flask_sqlalchemy.session import Session
+
+
+class RoutingSession(Session):
+    # Сессия SQLAlchemy, которая отправляет чтения на реплику,
+    # если текущий запрос это разрешил (g.db_replica).
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and not self._flushing
+            and isinstance(clause, sa.sql.Select)
+            and has_request_context()
+            and g.get("db_replica")
+        ):
+            return current_app.extensions["db_replica"]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@sa.event.listens_for(RoutingSession, "after_flush")
+def _remember_flush(session, flush_context):
+    # ORM что-то записал в базу — запоминаем это для текущего запроса.
+    if has_request_context():
+        g.db_wrote = True
+
+
+@sa.event.listens_for(RoutingSession, "do_orm_execute")
+def _remember_dml(orm_execute_state):
+    # То же самое для массовых UPDATE/DELETE/INSERT через session.execute().
+    if has_request_context() and (
+        orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert
+    ):
+        g.db_wrote = True
+
+
+class RecentWrites:
+    # Время последней записи клиентов без cookie-сессии: user_id → время.
+    # Записи старше окна read-your-writes выбрасываются при добавлении.
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def mark(self, user_id: int, now: float, window: float):
+        with self.lock:
+            self.entries[user_id] = now
+            for uid, at in list(self.entries.items()):
+                if now - at > window:
+                    del self.entries[uid]
+
+    def last(self, user_id: int) -> float:
+        return self.entries.get(user_id, 0)
+
+
+def _has_cookie_session() -> bool:
+    app = current_app._get_current_object()
+    return app.session_interface.get_cookie_name(app) in request.cookies
+
+
+def replica_allowed() -> bool:
+    # Можно ли читать с реплики: реплика настроена и пользователь
+    # ничего не записывал последние REPLICA_RYW_SECONDS секунд.
+    if "db_replica" not in current_app.extensions:
+        return False
+    if _has_cookie_session():
+        last_write = session.get("last_write", 0)
+    elif current_user.is_authenticated:
+        # Без cookie пользователь берётся из токена — без запроса к базе.
+        last_write = current_app.extensions["replica_writes"].last(current_user.id)
+    else:
+        last_write = 0
+    return time.time() - last_write > current_app.config["REPLICA_RYW_SECONDS"]
+
+
+def read_only(view):
+    # Декоратор для обработчиков, которые только читают данные.
+    # Ставить его нужно ВЫШЕ @login_required, чтобы и загрузка
+    # текущего пользователя шла с реплики.
+    # Для POST/PUT/DELETE в том же обработчике реплика не используется.
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method in ("GET", "HEAD"):
+            g.db_replica = replica_allowed()
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def init_app(app):
+    # Движок реплики создаём сами, а не через SQLALCHEMY_BINDS:
+    # у реплики та же схема, что и у основной базы, отдельные
+    # метаданные (и create_all для неё) не нужны.
+    if app.config["REPLICA_DATABASE_URL"]:
+        app.extensions["db_replica"] = sa.create_engine(app.config["REPLICA_DATABASE_URL"])
+        app.extensions["replica_writes"] = RecentWrites()
+
+    @app.after_request
+    def mark_last_write(response):
+        # Если в этом запросе была запись — отмечаем время, чтобы следующие
+        # чтения пользователя шли в основную базу: в его cookie-сессии,
+        # а для клиента с токеном — по id пользователя.
+        if not g.get("db_wrote") or "db_replica" not in app.extensions:
+            return response
+        if _has_cookie_session() or session.modified:
+            session["last_write"] = time.time()
+        elif current_user.is_authenticated:
+            app.extensions["replica_writes"].mark(current_user.id, time.time(), app.config["REPLICA_RYW_SECONDS"])
+        return response
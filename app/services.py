@@ -0,0 +1,647 @@
+# Общий слой бизнес-логики для веб-интерфейса (app/web.py) и JSON-API (app/api/*).
+#
+# Раньше обе части приложения сами писали одни и те же запросы и проверки:
+# "админ видит всё, пользователь — только свои заявки", "только админ меняет
+# роли" и т.д. Теперь это делают функции этого модуля, а обработчики только
+# разбирают запрос и оформляют ответ (HTML или JSON). Поэтому кэширование,
+# жадная загрузка связей, шардирование и быстрые запросы (app/fastpath.py)
+# работают одинаково для обоих интерфейсов.
+#
+# Ошибки сообщаются исключениями:
+#  - ServiceError       — неверные данные (код ошибки для API + текст для веба);
+#  - Forbidden          — нет прав (из app/fastpath.py);
+#  - VersionConflict    — заявку уже изменили (из app/versioning.py);
+#  - abort(404)         — объекта нет.
+
+import base64
+from datetime import date, datetime, timedelta
+
+from flask import abort, current_app
+from sqlalchemy import delete, func, select, tuple_, update
+from sqlalchemy.orm import joinedload
+from werkzeug.utils import secure_filename
+
+from . import attachments, fastpath, notifications, reports, sessions, sharding, sla, tokens
+from .extensions import db
+from .fastpath import Forbidden
+from .models import Attachment, Comment, Notification, Ticket, User
+from .versioning import VersionConflict
+
+ROLES = ("user", "admin")
+STATUSES = ("open", "in-progress", "closed")
+
+
+class ServiceError(ValueError):
+    # Неверные входные данные.
+    # error   — короткий код для JSON-ответа ("title required");
+    # message — текст для пользователя веб-интерфейса.
+    def __init__(self, error: str, message: str):
+        super().__init__(error)
+        self.error = error
+        self.message = message
+
+
+# ============================================================
+#                     ПРАВА ДОСТУПА
+# ============================================================
+
+def is_admin(user) -> bool:
+    return user.role == "admin"
+
+
+def require_admin(user):
+    if not is_admin(user):
+        raise Forbidden()
+
+
+def can_access(user, t) -> bool:
+    # Админ видит все заявки, пользователь — только свои.
+    return is_admin(user) or t.author_id == user.id
+
+
+# ============================================================
+#                     ПОЛЬЗОВАТЕЛИ
+# ============================================================
+
+def register_user(username: str, password: str) -> User:
+    if not username or not password:
+        raise ServiceError("username and password required", "Заполните все поля")
+    if User.query.filter_by(username=username).first():
+        raise ServiceError("user exists", "Пользователь уже существует")
+
+    # При регистрации всегда обычный пользователь, не администратор.
+    user = User(username=username, role="user")
+    user.set_password(password)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def authenticate(username: str, password: str):
+    # Пользователь, если логин и пароль верные, иначе None.
+    # (Лимит попыток проверяет обработчик — до вызова этой функции.)
+    user = User.query.filter_by(username=username).first()
+    if user and user.check_password(password):
+        return user
+    return None
+
+
+USERS_PAGE = 50
+
+
+def list_users(user, prefix: str = "", after: str = None, limit: int = USERS_PAGE):
+    # Страница каталога пользователей (только для админа), по алфавиту.
+    # prefix — начало имени ("поиск"), after — имя последнего пользователя
+    # предыдущей страницы. Возвращает (строки, after следующей страницы
+    # или None). Строка — словарь id/username/role + число заявок.
+    #
+    # Запрос читает уникальный индекс по username диапазоном
+    #   WHERE username >= :prefix AND username < :prefix || U+10FFFF
+    #     AND username > :after ORDER BY username LIMIT :limit + 1
+    # — без OFFSET и без LIKE, поэтому страница с любого места каталога
+    # из 100 тысяч человек стоит одинаково мало.
+    require_admin(user)
+    query = select(User.id, User.username, User.role)
+    if prefix:
+        query = query.where(User.username >= prefix, User.username < prefix + "\U0010ffff")
+    if after:
+        query = query.where(User.username > after)
+    rows = db.session.execute(query.order_by(User.username).limit(limit + 1)).all()
+
+    next_after = rows[limit - 1].username if len(rows) > limit else None
+    rows = rows[:limit]
+    counts = ticket_counts([r.id for r in rows])
+    page = [
+        {"id": r.id, "username": r.username, "role": r.role, **counts.get(r.id, {"tickets": 0, "open_tickets": 0})}
+        for r in rows
+    ]
+    return page, next_after
+
+
+def ticket_counts(user_ids) -> dict:
+    # Число заявок (всего и открытых) у каждого из пользователей одним
+    # запросом с GROUP BY по индексу author_id — вместо user.tickets на
+    # каждую строку. Результат: {user_id: {"tickets": n, "open_tickets": m}}.
+    if not user_ids:
+        return {}
+    if sharding.enabled():
+        return sharding.count_by_author(user_ids)
+    rows = db.session.execute(
+        select(
+            Ticket.author_id,
+            func.count(),
+            func.count().filter(Ticket.status == "open"),
+        )
+        .where(Ticket.author_id.in_(user_ids))
+        .group_by(Ticket.author_id)
+    ).all()
+    return {author_id: {"tickets": total, "open_tickets": open_} for author_id, total, open_ in rows}
+
+
+def set_role(user, user_id: int, role: str) -> User:
+    require_admin(user)
+    target = db.get_or_404(User, user_id)
+    if role not in ROLES:
+        raise ServiceError("invalid role", "Некорректная роль")
+
+    target.role = role
+    db.session.commit()
+
+    # Роль записана внутри выданных токенов API — отзываем их.
+    tokens.revoke_user(target.id)
+    return target
+
+
+def delete_user(user, user_id: int) -> str:
+    # Удаляет пользователя вместе с заявками, возвращает его имя.
+    require_admin(user)
+    own_tickets = None
+    if sharding.enabled():
+        # Его заявки лежат в шарде автора, а взятые им в работу — в любом.
+        own_tickets = sharding.delete_author(user_id)
+        sharding.release_assignee(user_id)
+    username = fastpath.delete_user(user_id, own_tickets)
+
+    # Токены и сессии удалённого пользователя больше не должны приниматься.
+    tokens.revoke_user(user_id)
+    sessions.revoke_user(user_id)
+    return username
+
+
+def list_sessions(user, user_id: int) -> list:
+    # Активные сессии веб-интерфейса пользователя (только для админа).
+    require_admin(user)
+    db.get_or_404(User, user_id)
+    return sessions.sessions_of(user_id)
+
+
+def revoke_sessions(user, user_id: int, session_id: str = None) -> int:
+    # Завершить сессии пользователя: одну (session_id) или все.
+    # Возвращает число завершённых.
+    require_admin(user)
+    db.get_or_404(User, user_id)
+    if session_id is not None:
+        return int(sessions.revoke(user_id, session_id))
+    return sessions.revoke_user(user_id)
+
+
+# ============================================================
+#                     ЗАЯВКИ
+# ============================================================
+
+class _ShardTicket:
+    # Строка заявки из шарда + автор и исполнитель из основной базы. Нужна,
+    # чтобы шаблоны обращались к t.author.username так же, как к модели Ticket.
+    def __init__(self, row, users):
+        self.__dict__.update(row._mapping)
+        self.author = users.get(self.author_id)
+        self.assignee = users.get(self.assignee_id)
+
+
+def _with_authors(rows):
+    # Авторы и исполнители всех заявок одним запросом (WHERE id IN (...)),
+    # а не по одному.
+    ids = {r.author_id for r in rows} | {r.assignee_id for r in rows if r.assignee_id}
+    users = {u.id: u for u in User.query.filter(User.id.in_(ids))} if ids else {}
+    return [_ShardTicket(r, users) for r in rows]
+
+
+def visible_tickets(user):
+    # Запрос "заявки, доступные пользователю". Автор загружается тем же
+    # запросом (JOIN), чтобы список не делал по запросу на каждую строку.
+    query = Ticket.query.options(joinedload(Ticket.author))
+    if not is_admin(user):
+        query = query.filter(Ticket.author_id == user.id)
+    return query
+
+
+def list_tickets(user):
+    # Список заявок, новые сверху.
+    if sharding.enabled():
+        # Админ — параллельно со всех шардов, пользователь — только из своего.
+        if is_admin(user):
+            return _with_authors(sharding.list_all())
+        return _with_authors(sharding.list_for_author(user.id))
+    return visible_tickets(user).order_by(Ticket.updated_at.desc()).all()
+
+
+def get_ticket(user, ticket_id: int):
+    # Заявка по ID с проверкой прав (404, если нет; Forbidden, если чужая).
+    if sharding.enabled():
+        row = sharding.get(ticket_id)
+        if row is None:
+            abort(404)
+        t = _with_authors([row])[0]
+    else:
+        t = db.get_or_404(Ticket, ticket_id)
+    if not can_access(user, t):
+        raise Forbidden()
+    return t
+
+
+def create_ticket(user, title: str, description: str):
+    if not title:
+        raise ServiceError("title required", "Название обязательно")
+
+    # В режиме шардирования заявка пишется в базу-шард автора,
+    # а итоги для отчётов — в основную базу.
+    if sharding.enabled():
+        t = sharding.create(user.id, title, description)
+        reports.record_created(t.created_at)
+        db.session.commit()
+        return t
+
+    now = datetime.utcnow()
+    t = Ticket(
+        title=title,
+        description=description,
+        author_id=user.id,
+        created_at=now,
+        updated_at=now,
+        deadline=sla.deadline_for("open", now),
+    )
+    db.session.add(t)
+    db.session.flush()
+    # Автора могли удалить, пока шёл запрос: delete_user уже прошёл —
+    # заявка осталась бы без автора. После INSERT транзакция держит
+    # запись в базу, поэтому проверка не разойдётся с delete_user.
+    if db.session.execute(select(User.id).where(User.id == user.id)).first() is None:
+        db.session.rollback()
+        raise ServiceError("user deleted", "Пользователь удалён")
+    reports.record_created(now)
+    db.session.commit()
+    return t
+
+
+def update_ticket(user, ticket_id: int, values: dict, body=None):
+    # Изменить заявку; возвращает (новая версия, название заявки).
+    # body — JSON или форма, откуда берётся ожидаемая версия (app/versioning.py).
+    if not values:
+        # Нечего менять — только проверка прав и текущая версия.
+        t = get_ticket(user, ticket_id)
+        return t.version, t.title
+
+    if sharding.enabled():
+        t = get_ticket(user, ticket_id)
+        now = datetime.utcnow()
+        row = sharding.update(ticket_id, values, body, now)
+        if "status" in values:
+            reports.record_transition(values["status"], now, row)
+            notifications.notify(ticket_id, "status", user.id, values["status"])
+            db.session.commit()
+        return row.version, values.get("title", t.title)
+
+    # Смена статуса — уведомление автору и исполнителю. Задача рассылки
+    # попадает в ту же транзакцию, что и UPDATE: не прошёл UPDATE (нет
+    # прав, конфликт версий) — не будет и рассылки.
+    if "status" in values:
+        notifications.notify(ticket_id, "status", user.id, values["status"])
+
+    # Один условный UPDATE ... WHERE id=? AND (автор или админ) AND version=?.
+    return fastpath.update_ticket(user, ticket_id, values, body)
+
+
+def delete_ticket(user, ticket_id: int) -> str:
+    # Удалить заявку; возвращает её название.
+    if sharding.enabled():
+        t = get_ticket(user, ticket_id)
+        sharding.delete(ticket_id)
+        if t.comment_count or t.attachment_count:
+            fastpath.delete_children(ticket_id)
+            db.session.commit()
+        return t.title
+
+    # Один DELETE ... WHERE id=? AND (автор или админ) RETURNING title.
+    return fastpath.delete_ticket(user, ticket_id)
+
+
+# ============================================================
+#                     КОММЕНТАРИИ
+# ============================================================
+
+COMMENTS_PAGE = 50
+
+
+def _encode_cursor(c) -> str:
+    # Курсор страницы — позиция последнего показанного комментария
+    # (created_at, id), упакованная в строку для URL.
+    raw = f"{c.created_at.isoformat()}|{c.id}"
+    return base64.urlsafe_b64encode(raw.encode("ascii")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii")
+        created_at, _, comment_id = raw.partition("|")
+        return datetime.fromisoformat(created_at), int(comment_id)
+    except ValueError:
+        raise ServiceError("invalid cursor", "Некорректная ссылка на страницу комментариев")
+
+
+def comment_page(ticket_id: int, after: str = None, limit: int = COMMENTS_PAGE):
+    # Страница комментариев заявки по порядку написания.
+    # Возвращает (комментарии, курсор следующей страницы или None).
+    # Права на заявку проверяет вызывающий код (list_comments, get_ticket).
+    query = Comment.query.options(joinedload(Comment.author)).filter(Comment.ticket_id == ticket_id)
+    if after:
+        # WHERE (created_at, id) > (:created_at, :id) — продолжаем чтение
+        # индекса ix_comment_ticket_created с нужного места, без OFFSET.
+        query = query.filter(tuple_(Comment.created_at, Comment.id) > _decode_cursor(after))
+
+    # Берём на одну запись больше, чтобы понять, есть ли следующая страница.
+    rows = query.order_by(Comment.created_at, Comment.id).limit(limit + 1).all()
+    if len(rows) > limit:
+        return rows[:limit], _encode_cursor(rows[limit - 1])
+    return rows, None
+
+
+def list_comments(user, ticket_id: int, after: str = None, limit: int = COMMENTS_PAGE):
+    get_ticket(user, ticket_id)
+    return comment_page(ticket_id, after, limit)
+
+
+def add_comment(user, ticket_id: int, body: str) -> Comment:
+    # Комментировать может тот, кто видит заявку (автор или админ).
+    if not body:
+        raise ServiceError("body required", "Комментарий не может быть пустым")
+    get_ticket(user, ticket_id)
+
+    comment = Comment(ticket_id=ticket_id, author_id=user.id, body=body)
+    db.session.add(comment)
+    notifications.notify(ticket_id, "comment", user.id)
+    # Заявку могли удалить после проверки доступа — тогда счётчик
+    # обновлять некому, и комментарий не сохраняем.
+    if _bump(ticket_id, "comment_count", 1) == 0:
+        db.session.rollback()
+        abort(404)
+    db.session.commit()
+    return comment
+
+
+def _bump(ticket_id: int, counter: str, delta: int):
+    # Изменить счётчик заявки (comment_count, attachment_count).
+    # В основной базе — в той же транзакции, что и само изменение:
+    # UPDATE ticket SET <счётчик> = <счётчик> + delta WHERE id = ?;
+    # commit делает вызывающий код. В режиме шардирования заявка в другой
+    # базе, поэтому сначала сохраняем изменение, затем счётчик в шарде.
+    # Возвращает, сколько заявок обновлено (0 — заявки уже нет), в режиме
+    # шардирования — None.
+    if sharding.enabled():
+        db.session.commit()
+        sharding.bump(ticket_id, counter, delta)
+        return None
+    return db.session.execute(
+        update(Ticket)
+        .where(Ticket.id == ticket_id)
+        .values({counter: getattr(Ticket, counter) + delta})
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+# ============================================================
+#                     ВЛОЖЕНИЯ
+# ============================================================
+
+def attachments_of(t):
+    # Вложения заявки t (права уже проверены). Если счётчик в заявке
+    # равен нулю, к таблице attachment не обращаемся вовсе.
+    if not t.attachment_count:
+        return []
+    return Attachment.query.filter_by(ticket_id=t.id).order_by(Attachment.id).all()
+
+
+def list_attachments(user, ticket_id: int):
+    return attachments_of(get_ticket(user, ticket_id))
+
+
+def add_attachment(user, ticket_id: int, stream, filename: str, content_type: str) -> Attachment:
+    # Приложить файл к заявке (может тот, кто видит заявку).
+    # stream читается кусками прямо в хранилище, целиком в память не попадает.
+    get_ticket(user, ticket_id)
+    try:
+        sha256, size = attachments.storage().save_stream(stream, current_app.config["ATTACHMENT_MAX_SIZE"])
+    except attachments.TooLarge:
+        raise ServiceError("file too large", "Файл слишком большой")
+    if size == 0:
+        raise ServiceError("file required", "Выберите файл")
+
+    attachment = Attachment(
+        ticket_id=ticket_id,
+        uploader_id=user.id,
+        filename=secure_filename(filename or "") or "file",
+        content_type=content_type or "application/octet-stream",
+        size=size,
+        sha256=sha256,
+    )
+    db.session.add(attachment)
+    # Как и для комментария: заявку могли удалить, пока файл загружался, —
+    # тогда ссылку не сохраняем (файл уберёт сборщик мусора).
+    if _bump(ticket_id, "attachment_count", 1) == 0:
+        db.session.rollback()
+        abort(404)
+    db.session.commit()
+    return attachment
+
+
+def get_attachment(user, ticket_id: int, attachment_id: int):
+    # Вложение заявки (права — как у самой заявки).
+    get_ticket(user, ticket_id)
+    return Attachment.query.filter_by(id=attachment_id, ticket_id=ticket_id).first_or_404()
+
+
+def delete_attachment(user, ticket_id: int, attachment_id: int):
+    # Удаляется только строка-ссылка; файл на диске уберёт сборщик мусора,
+    # если на это содержимое больше никто не ссылается.
+    get_ticket(user, ticket_id)
+    deleted = db.session.execute(
+        delete(Attachment)
+        .where(Attachment.id == attachment_id, Attachment.ticket_id == ticket_id)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not deleted:
+        db.session.rollback()
+        abort(404)
+    _bump(ticket_id, "attachment_count", -1)
+    db.session.commit()
+
+
+def attachment_dict(a) -> dict:
+    return {
+        "id": a.id,
+        "ticket_id": a.ticket_id,
+        "filename": a.filename,
+        "content_type": a.content_type,
+        "size": a.size,
+        "sha256": a.sha256,
+        "created_at": a.created_at.isoformat(),
+    }
+
+
+def comment_dict(c) -> dict:
+    return {
+        "id": c.id,
+        "ticket_id": c.ticket_id,
+        "author_id": c.author_id,
+        "author": c.author.username if c.author else None,
+        "body": c.body,
+        "created_at": c.created_at.isoformat(),
+    }
+
+
+# ============================================================
+#                     ОЧЕРЕДИ РАБОТЫ
+# ============================================================
+
+def claim_next(user):
+    # Сотрудник поддержки (админ) берёт в работу самую старую открытую
+    # заявку без исполнителя. None — очередь пуста.
+    require_admin(user)
+    if sharding.enabled():
+        t = sharding.claim(user.id)
+    else:
+        t = fastpath.claim_ticket(user)
+    if t is not None:
+        notifications.notify(t.id, "status", user.id, "in-progress")
+        db.session.commit()
+    return t
+
+
+def release_ticket(user, ticket_id: int) -> int:
+    # Вернуть заявку в очередь; возвращает новую версию.
+    if sharding.enabled():
+        row = sharding.get(ticket_id)
+        if row is None:
+            abort(404)
+        if row.assignee_id is None:
+            return row.version
+        if not is_admin(user) and row.assignee_id != user.id:
+            raise Forbidden()
+        version = sharding.release(ticket_id)
+        notifications.notify(ticket_id, "status", user.id, "open")
+        db.session.commit()
+        return version
+
+    # Задача рассылки — в транзакции UPDATE: если заявка уже была в очереди,
+    # fastpath откатывает транзакцию, и уведомления не будет.
+    notifications.notify(ticket_id, "status", user.id, "open")
+    return fastpath.release_ticket(user, ticket_id)
+
+
+def work_queue(user, status: str = "open", mine: bool = False, limit: int = 50):
+    # Очередь заявок в статусе status, старые сверху:
+    #  - mine=False — никому не назначенные (кого взять следующим);
+    #  - mine=True  — назначенные на текущего сотрудника.
+    # Читается по индексам ix_ticket_unassigned_open / ix_ticket_assignee_status.
+    require_admin(user)
+    if status not in STATUSES:
+        raise ServiceError("invalid status", "Некорректный статус")
+    assignee_id = user.id if mine else None
+
+    if sharding.enabled():
+        return _with_authors(sharding.queue(status, assignee_id, limit))
+
+    query = Ticket.query.options(joinedload(Ticket.author)).filter(Ticket.status == status)
+    if mine:
+        query = query.filter(Ticket.assignee_id == assignee_id)
+    else:
+        query = query.filter(Ticket.assignee_id.is_(None))
+    return query.order_by(Ticket.created_at, Ticket.id).limit(limit).all()
+
+
+# ============================================================
+#                     УВЕДОМЛЕНИЯ
+# ============================================================
+
+def list_notifications(user, before: int = None, limit: int = 50, unread_only: bool = False):
+    # Уведомления пользователя, новые сверху (индекс ix_notification_user_id).
+    # before — id последнего показанного уведомления (следующая страница).
+    query = Notification.query.filter(Notification.user_id == user.id)
+    if before:
+        query = query.filter(Notification.id < before)
+    if unread_only:
+        query = query.filter(Notification.read_at.is_(None))
+    return query.order_by(Notification.id.desc()).limit(limit).all()
+
+
+def unread_count(user) -> int:
+    # Число непрочитанных — показывается на каждой странице, поэтому это
+    # COUNT только по частичному индексу ix_notification_unread.
+    return db.session.execute(
+        select(func.count())
+        .select_from(Notification)
+        .where(Notification.user_id == user.id, Notification.read_at.is_(None))
+    ).scalar()
+
+
+def mark_read(user, ids=None) -> int:
+    # Отметить прочитанными уведомления ids (None — все). Чужие уведомления
+    # не затрагиваются: user_id в WHERE. Возвращает число отмеченных.
+    stmt = update(Notification).where(Notification.user_id == user.id, Notification.read_at.is_(None))
+    if ids is not None:
+        stmt = stmt.where(Notification.id.in_(ids))
+    count = db.session.execute(
+        stmt.values(read_at=datetime.utcnow()).execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return count
+
+
+def notification_dict(n) -> dict:
+    return {
+        "id": n.id,
+        "ticket_id": n.ticket_id,
+        "kind": n.kind,
+        "message": n.message,
+        "created_at": n.created_at.isoformat(),
+        "read": n.read_at is not None,
+    }
+
+
+# ============================================================
+#                     СРОКИ (SLA)
+# ============================================================
+
+def overdue_tickets(user, limit: int = 100):
+    # Просроченные заявки (для сотрудников поддержки), самые давние сверху.
+    require_admin(user)
+    return sla.overdue(limit=limit)
+
+
+# ============================================================
+#                     ОТЧЁТЫ
+# ============================================================
+
+REPORT_MAX_DAYS = 3 * 366
+
+
+def ticket_report(user, start: str = None, end: str = None, interval: str = "day") -> dict:
+    # Отчёт по заявкам за период (даты "ГГГГ-ММ-ДД", включительно).
+    # По умолчанию — последние 30 дней.
+    require_admin(user)
+    if interval not in reports.INTERVALS:
+        raise ServiceError("invalid interval", "Некорректный интервал")
+    try:
+        end_day = date.fromisoformat(end) if end else datetime.utcnow().date()
+        start_day = date.fromisoformat(start) if start else end_day - timedelta(days=29)
+    except ValueError:
+        raise ServiceError("invalid date", "Некорректная дата")
+    if start_day > end_day or (end_day - start_day).days >= REPORT_MAX_DAYS:
+        raise ServiceError("invalid range", "Некорректный период")
+    return reports.ticket_report(start_day, end_day, interval)
+
+
+def ticket_dict(t) -> dict:
+    # Заявка в виде словаря для JSON-ответа.
+    return {
+        "id": t.id,
+        "title": t.title,
+        "description": t.description,
+        "status": t.status,
+        "author_id": t.author_id,
+        "assignee_id": t.assignee_id,
+        "comment_count": t.comment_count,
+        "attachment_count": t.attachment_count,
+        "deadline": t.deadline.isoformat() if t.deadline else None,
+        "version": t.version,
+    }
+
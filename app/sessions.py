@@ -0,0 +1,374 @@
+# Сессии веб-интерфейса на стороне сервера.
+#
+# Раньше всё содержимое сессии (id пользователя, flash-сообщения) лежало
+# в подписанной cookie: её нельзя отозвать — удалённый пользователь
+# оставался "вошедшим", пока не истечёт cookie. Теперь в cookie только
+# случайный идентификатор (256 бит), а сама запись хранится на сервере:
+#
+#     ключ    = sha256(идентификатор)  — утечка хранилища не даёт чужих cookie;
+#     запись  = user_id, данные сессии, когда создана, до какого времени живёт.
+#
+# Хранилище:
+#  - по умолчанию (SESSION_STORE пусто) — словарь в памяти процесса;
+#  - SESSION_STORE=<путь к файлу> — отдельный SQLite-файл (не основная база),
+#    общий для всех процессов-воркеров на машине.
+#
+# Перед хранилищем стоит LRU-кэш в памяти процесса: проверка сессии на
+# каждом запросе при попадании в кэш не ходит в хранилище. Удалённые
+# сессии (выход, отзыв) убираются из кэша своего процесса сразу, а из
+# кэшей остальных процессов — через шину app/bus.py. Запись в кэше в любом
+# случае считается свежей не дольше SESSION_CACHE_TTL секунд.
+#
+# Срок жизни — SESSION_TTL секунд с продлением: если пользователь активен и
+# прошла половина срока, запись продлевается (запись в хранилище не чаще,
+# чем раз в полсрока). Истёкшие записи удаляет задача sessions.sweep.
+
+import hashlib
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import current_app
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+# Запись сессии в хранилище.
+Record = namedtuple("Record", "user_id data created_at expires_at")
+
+serializer = TaggedJSONSerializer()
+
+
+# Идентификатор сессии — secrets.token_urlsafe(32): 43 символа base64url.
+# Cookie другого вида (мусор, не-ASCII) считается отсутствующей.
+SID_PATTERN = re.compile(r"[A-Za-z0-9_-]{43}")
+
+
+def _key(sid: str) -> str:
+    return hashlib.sha256(sid.encode("ascii")).hexdigest()
+
+
+def _user_id(data: dict):
+    # Flask-Login хранит id вошедшего пользователя под ключом "_user_id".
+    value = data.get("_user_id")
+    return int(value) if value is not None else None
+
+
+# ============================================================
+#                        ХРАНИЛИЩА
+# ============================================================
+
+class MemoryStore:
+    # Сессии в словаре процесса (разработка, тесты, один процесс).
+
+    def __init__(self):
+        self.records = {}
+        self.lock = threading.Lock()
+
+    def load(self, key: str):
+        return self.records.get(key)
+
+    def save(self, key: str, record: Record):
+        with self.lock:
+            self.records[key] = record
+
+    def delete(self, key: str):
+        with self.lock:
+            self.records.pop(key, None)
+
+    def for_user(self, user_id: int) -> dict:
+        with self.lock:
+            return {k: r for k, r in self.records.items() if r.user_id == user_id}
+
+    def delete_user(self, user_id: int) -> list:
+        with self.lock:
+            keys = [k for k, r in self.records.items() if r.user_id == user_id]
+            for k in keys:
+                del self.records[k]
+            return keys
+
+    def sweep(self, now: float) -> int:
+        with self.lock:
+            keys = [k for k, r in self.records.items() if r.expires_at < now]
+            for k in keys:
+                del self.records[k]
+            return len(keys)
+
+
+class SqliteStore:
+    # Сессии в отдельном SQLite-файле. Соединение — своё у каждого потока
+    # и открывается при первом обращении (в т.ч. уже после fork воркера).
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+        self.ready = False
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            # sqlite3 нужен только в этом режиме — импортируем по требованию.
+            import sqlite3
+
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self.local.conn = conn
+            with self.lock:
+                if not self.ready:
+                    # WAL: чтение сессий не ждёт, пока другой процесс пишет.
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS session ("
+                        "key TEXT PRIMARY KEY, user_id INTEGER, data TEXT NOT NULL, "
+                        "created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+                    )
+                    conn.execute("CREATE INDEX IF NOT EXISTS ix_session_user_id ON session (user_id)")
+                    conn.execute("CREATE INDEX IF NOT EXISTS ix_session_expires_at ON session (expires_at)")
+                    self.ready = True
+        return conn
+
+    def load(self, key: str):
+        row = self._connect().execute(
+            "SELECT user_id, data, created_at, expires_at FROM session WHERE key = ?", (key,)
+        ).fetchone()
+        return Record(*row) if row else None
+
+    def save(self, key: str, record: Record):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO session (key, user_id, data, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+            (key, *record),
+        )
+
+    def delete(self, key: str):
+        self._connect().execute("DELETE FROM session WHERE key = ?", (key,))
+
+    def for_user(self, user_id: int) -> dict:
+        rows = self._connect().execute(
+            "SELECT key, user_id, data, created_at, expires_at FROM session WHERE user_id = ?", (user_id,)
+        ).fetchall()
+        return {row[0]: Record(*row[1:]) for row in rows}
+
+    def delete_user(self, user_id: int) -> list:
+        rows = self._connect().execute(
+            "DELETE FROM session WHERE user_id = ? RETURNING key", (user_id,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def sweep(self, now: float) -> int:
+        return self._connect().execute("DELETE FROM session WHERE expires_at < ?", (now,)).rowcount
+
+
+class SessionStore:
+    # Хранилище + LRU-кэш записей перед ним.
+
+    def __init__(self, backend, cache_size: int = 10_000, cache_ttl: float = 5, publish=None):
+        self.backend = backend
+        # publish(keys) — сообщить другим процессам об удалённых записях.
+        self.publish = publish
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.cache = OrderedDict()  # key → (запись, когда прочитана)
+        self.lock = threading.Lock()
+
+    def _remember(self, key: str, record: Record, now: float):
+        with self.lock:
+            self.cache[key] = (record, now)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def forget(self, keys):
+        with self.lock:
+            for key in keys:
+                self.cache.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+
+    def get(self, key: str, now: float):
+        # Живая запись сессии или None.
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached is not None and now - cached[1] < self.cache_ttl:
+                self.cache.move_to_end(key)
+        if cached is not None and now - cached[1] < self.cache_ttl:
+            record = cached[0]
+        else:
+            record = self.backend.load(key)
+            if record is None:
+                self.forget([key])
+                return None
+            self._remember(key, record, now)
+        if record.expires_at < now:
+            return None
+        return record
+
+    def save(self, key: str, record: Record, now: float):
+        self.backend.save(key, record)
+        self._remember(key, record, now)
+
+    def delete(self, key: str):
+        self.backend.delete(key)
+        self.forget([key])
+        if self.publish:
+            self.publish([key])
+
+    def for_user(self, user_id: int) -> dict:
+        return self.backend.for_user(user_id)
+
+    def revoke_user(self, user_id: int) -> int:
+        keys = self.backend.delete_user(user_id)
+        self.forget(keys)
+        if self.publish:
+            self.publish(keys)
+        return len(keys)
+
+    def revoke(self, key_prefix: str, user_id: int) -> bool:
+        # Отозвать одну сессию пользователя по началу ключа (как в списке).
+        if not key_prefix:
+            return False
+        for key in self.backend.for_user(user_id):
+            if key.startswith(key_prefix):
+                self.delete(key)
+                return True
+        return False
+
+    def sweep(self, now: float) -> int:
+        removed = self.backend.sweep(now)
+        with self.lock:
+            for key, (record, _) in list(self.cache.items()):
+                if record.expires_at < now:
+                    del self.cache[key]
+        return removed
+
+
+# ============================================================
+#                  СЕССИЯ ДЛЯ FLASK
+# ============================================================
+
+class ServerSession(CallbackDict, SessionMixin):
+    # Словарь сессии; modified ставится при любом изменении.
+
+    def __init__(self, initial=None, sid=None, record=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.record = record
+        self.modified = False
+        # Кто был вошедшим при открытии сессии: вход или выход меняют его,
+        # и тогда сессия получает новый идентификатор (защита от
+        # подстановки чужого идентификатора до входа — session fixation).
+        self.opened_user_id = _user_id(self)
+
+
+class ServerSessionInterface(SessionInterface):
+
+    def _store(self, app) -> SessionStore:
+        return app.extensions["session_store"]
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and SID_PATTERN.fullmatch(sid):
+            record = self._store(app).get(_key(sid), time.time())
+            if record is not None:
+                return ServerSession(serializer.loads(record.data), sid=sid, record=record)
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        store = self._store(app)
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            # Пустая сессия (например, после выхода) — удаляем и запись, и cookie.
+            if session.sid:
+                store.delete(_key(session.sid))
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        ttl = app.config["SESSION_TTL"]
+        sid = session.sid
+        if sid and _user_id(session) != session.opened_user_id:
+            store.delete(_key(sid))
+            sid = None
+
+        if sid is None:
+            sid = secrets.token_urlsafe(32)
+            created_at = now
+        elif session.modified:
+            created_at = session.record.created_at
+        elif session.record.expires_at - now > ttl / 2:
+            # Ничего не менялось и срок ещё далеко — хранилище не трогаем.
+            return
+        else:
+            created_at = session.record.created_at
+
+        record = Record(_user_id(session), serializer.dumps(dict(session)), created_at, now + ttl)
+        store.save(_key(sid), record, now)
+        response.vary.add("Cookie")
+        response.set_cookie(
+            name,
+            sid,
+            max_age=int(ttl),
+            domain=domain,
+            path=path,
+            httponly=self.get_cookie_httponly(app),
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def init_app(app):
+    path = app.config["SESSION_STORE"]
+    backend = SqliteStore(path) if path else MemoryStore()
+    bus = app.extensions["bus"]
+    store = SessionStore(
+        backend,
+        app.config["SESSION_CACHE_SIZE"],
+        app.config["SESSION_CACHE_TTL"],
+        publish=lambda keys: bus.publish("session", keys),
+    )
+    bus.subscribe("session", store.forget, store.clear)
+    app.extensions["session_store"] = store
+    app.session_interface = ServerSessionInterface()
+
+
+def store() -> SessionStore:
+    return current_app.extensions["session_store"]
+
+
+def sessions_of(user_id: int) -> list:
+    # Живые сессии пользователя для администратора (без самих данных).
+    now = time.time()
+    return sorted(
+        (
+            {"id": key[:16], "created_at": r.created_at, "expires_at": r.expires_at}
+            for key, r in store().for_user(user_id).items()
+            if r.expires_at >= now
+        ),
+        key=lambda s: s["created_at"],
+    )
+
+
+def revoke_user(user_id: int) -> int:
+    # Завершить все сессии пользователя; возвращает их число.
+    return store().revoke_user(user_id)
+
+
+def revoke(user_id: int, session_id: str) -> bool:
+    # Завершить одну сессию пользователя (session_id — "id" из sessions_of).
+    return store().revoke(session_id, user_id)
+
+
+def sweep() -> int:
+    # Удалить истёкшие записи (задача sessions.sweep).
+    return store().sweep(time.time())
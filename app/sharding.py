@@ -0,0 +1,407 @@
+# Шардирование заявок по автору (необязательный режим).
+#
+# Обычный пользователь всегда работает только со своими заявками
+# (author_id = current_user.id), поэтому автор — естественный ключ
+# шардирования. Если задан TICKET_SHARDS (список адресов баз через запятую),
+# таблица ticket хранится в N отдельных базах:
+#
+#     шард = author_id % N
+#
+# Номер заявки тоже "знает" свой шард: id всех заявок шарда k дают
+# остаток k при делении на N (k+N, k+2N, ...). Поэтому заявку по id
+# можно найти одним запросом к одному шарду, без обхода всех баз.
+#
+# Запросы администратора по всем заявкам выполняются параллельно на всех
+# шардах (пул потоков), а отсортированные по updated_at результаты
+# сливаются в один список k-way merge'ем (heapq.merge).
+#
+# Пользователи, очередь задач и остальные таблицы остаются в основной базе.
+# Заявки через шарды читают и пишут и JSON-API, и веб-интерфейс
+# (оба работают через app/services.py).
+
+import contextlib
+import heapq
+import itertools
+from datetime import datetime
+
+import sqlalchemy as sa
+from flask import abort, current_app
+
+from . import fastpath, sla, versioning
+from .models import Ticket
+
+
+def _shard_table():
+    # Таблица ticket для шардов: те же колонки, но без внешнего ключа
+    # на user — таблицы пользователей в шардах нет.
+    columns = []
+    for c in Ticket.__table__.columns:
+        columns.append(
+            sa.Column(
+                c.name,
+                c.type,
+                primary_key=c.primary_key,
+                nullable=c.nullable,
+                autoincrement=False,
+                default=c.default.arg if c.default is not None else None,
+                onupdate=c.onupdate.arg if c.onupdate is not None else None,
+            )
+        )
+    metadata = sa.MetaData()
+    table = sa.Table("ticket", metadata, *columns)
+    # Списки "мои заявки, новые сверху" — по этому индексу.
+    sa.Index("ix_ticket_author_updated", table.c.author_id, table.c.updated_at)
+    # Очереди работы — те же индексы, что у основной таблицы (app/models.py).
+    free = sa.and_(table.c.status == "open", table.c.assignee_id.is_(None))
+    sa.Index(
+        "ix_ticket_unassigned_open",
+        table.c.created_at,
+        table.c.id,
+        sqlite_where=free,
+        postgresql_where=free,
+    )
+    assigned = table.c.assignee_id.is_not(None)
+    sa.Index(
+        "ix_ticket_assignee_status",
+        table.c.assignee_id,
+        table.c.status,
+        table.c.created_at,
+        sqlite_where=assigned,
+        postgresql_where=assigned,
+    )
+    has_deadline = table.c.deadline.is_not(None)
+    sa.Index(
+        "ix_ticket_status_deadline",
+        table.c.status,
+        table.c.deadline,
+        sqlite_where=has_deadline,
+        postgresql_where=has_deadline,
+    )
+    return table
+
+
+ticket_table = _shard_table()
+
+
+class TicketShards:
+    # Набор движков шардов и пул потоков для параллельных запросов.
+
+    def __init__(self, urls):
+        # Пул потоков нужен только в режиме шардирования.
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.engines = [sa.create_engine(url) for url in urls]
+        self.executor = ThreadPoolExecutor(max_workers=len(self.engines))
+
+    @property
+    def count(self) -> int:
+        return len(self.engines)
+
+    def for_author(self, author_id: int):
+        return self.engines[author_id % self.count]
+
+    def for_ticket(self, ticket_id: int):
+        return self.engines[ticket_id % self.count]
+
+    def create_schema(self):
+        for engine in self.engines:
+            ticket_table.metadata.create_all(engine)
+
+
+def init_app(app):
+    urls = [u.strip() for u in app.config["TICKET_SHARDS"].split(",") if u.strip()]
+    if urls:
+        app.extensions["ticket_shards"] = TicketShards(urls)
+
+
+def enabled() -> bool:
+    return "ticket_shards" in current_app.extensions
+
+
+def _shards() -> TicketShards:
+    return current_app.extensions["ticket_shards"]
+
+
+# ============================================================
+#                  ОПЕРАЦИИ С ЗАЯВКАМИ В ШАРДАХ
+# ============================================================
+
+def in_author_shard(ticket_id: int, author_id: int) -> bool:
+    shards = _shards()
+    return ticket_id % shards.count == author_id % shards.count
+
+
+# Сколько раз повторять вставку заявки, если id уже занят.
+CREATE_ATTEMPTS = 5
+
+
+def create(author_id: int, title: str, description: str):
+    # Вставка одним запросом: следующий id шарда вычисляется внутри
+    # INSERT ... SELECT MAX(id) + N. В SQLite запись идёт под блокировкой
+    # базы, но в PostgreSQL два одновременных INSERT'а могут прочитать
+    # один и тот же MAX(id) — второй упадёт на первичном ключе. Тогда
+    # вставка повторяется: новый MAX(id) уже учитывает чужую заявку.
+    shards = _shards()
+    shard = author_id % shards.count
+    now = datetime.utcnow()
+    t = ticket_table
+    next_id = sa.func.coalesce(sa.func.max(t.c.id), shard) + shards.count
+    stmt = (
+        sa.insert(t)
+        .from_select(
+            ["id", "title", "description", "status", "created_at", "updated_at", "author_id", "deadline"],
+            sa.select(
+                next_id,
+                sa.literal(title),
+                sa.literal(description),
+                sa.literal("open"),
+                sa.literal(now),
+                sa.literal(now),
+                sa.literal(author_id),
+                sa.literal(sla.deadline_for("open", now), sa.DateTime),
+            ),
+        )
+        .returning(*t.c)
+    )
+    for attempt in range(CREATE_ATTEMPTS):
+        try:
+            with shards.for_author(author_id).begin() as conn:
+                return conn.execute(stmt).one()
+        except sa.exc.IntegrityError:
+            if attempt == CREATE_ATTEMPTS - 1:
+                raise
+
+
+def get(ticket_id: int):
+    # Заявка по id — запрос только к одному шарду.
+    with _shards().for_ticket(ticket_id).connect() as conn:
+        return conn.execute(sa.select(ticket_table).where(ticket_table.c.id == ticket_id)).first()
+
+
+def list_for_author(author_id: int):
+    t = ticket_table
+    with _shards().for_author(author_id).connect() as conn:
+        return conn.execute(
+            sa.select(t).where(t.c.author_id == author_id).order_by(t.c.updated_at.desc())
+        ).all()
+
+
+def _list_shard(engine):
+    t = ticket_table
+    with engine.connect() as conn:
+        return conn.execute(sa.select(t).order_by(t.c.updated_at.desc(), t.c.id.desc())).all()
+
+
+def list_all():
+    # Все заявки: параллельно читаем шарды, каждый уже отсортирован,
+    # и сливаем N отсортированных списков за один проход.
+    shards = _shards()
+    parts = list(shards.executor.map(_list_shard, shards.engines))
+    return list(heapq.merge(*parts, key=lambda r: (r.updated_at, r.id), reverse=True))
+
+
+def _queue_shard(engine, status: str, assignee_id, limit: int):
+    t = ticket_table
+    assignee = t.c.assignee_id == assignee_id if assignee_id else t.c.assignee_id.is_(None)
+    with engine.connect() as conn:
+        return conn.execute(
+            sa.select(t)
+            .where(t.c.status == status, assignee)
+            .order_by(t.c.created_at, t.c.id)
+            .limit(limit)
+        ).all()
+
+
+def _count_shard(engine, author_ids):
+    t = ticket_table
+    with engine.connect() as conn:
+        return conn.execute(
+            sa.select(t.c.author_id, sa.func.count(), sa.func.count().filter(t.c.status == "open"))
+            .where(t.c.author_id.in_(author_ids))
+            .group_by(t.c.author_id)
+        ).all()
+
+
+def count_by_author(author_ids):
+    # Число заявок авторов (всего и открытых): авторы раскладываются по
+    # своим шардам, каждый шард считает своих одним GROUP BY, параллельно.
+    shards = _shards()
+    by_shard = {}
+    for author_id in author_ids:
+        by_shard.setdefault(author_id % shards.count, []).append(author_id)
+    parts = shards.executor.map(lambda item: _count_shard(shards.engines[item[0]], item[1]), by_shard.items())
+    return {
+        author_id: {"tickets": total, "open_tickets": open_}
+        for rows in parts
+        for author_id, total, open_ in rows
+    }
+
+
+def queue(status: str, assignee_id, limit: int):
+    # Очередь заявок со всех шардов: каждый шард отдаёт не больше limit
+    # самых старых, слияние берёт из них общие первые limit.
+    shards = _shards()
+    parts = list(
+        shards.executor.map(lambda e: _queue_shard(e, status, assignee_id, limit), shards.engines)
+    )
+    merged = heapq.merge(*parts, key=lambda r: (r.created_at, r.id))
+    return list(itertools.islice(merged, limit))
+
+
+def _overdue_shard(engine, now, since, after, limit: int):
+    with engine.connect() as conn:
+        return conn.execute(sla.overdue_statement(ticket_table, now, since, after, limit)).all()
+
+
+def overdue(now, since, after, limit: int):
+    # Просроченные заявки со всех шардов: у каждого шарда первые limit
+    # по сроку, слияние берёт из них общие первые limit.
+    shards = _shards()
+    parts = list(
+        shards.executor.map(lambda e: _overdue_shard(e, now, since, after, limit), shards.engines)
+    )
+    merged = heapq.merge(*parts, key=lambda r: (r.deadline, r.id))
+    return list(itertools.islice(merged, limit))
+
+
+def update(ticket_id: int, values: dict, body: dict = None, now: datetime = None):
+    # То же условное UPDATE ... WHERE id=? AND version=?, что и для
+    # основной базы (см. app/versioning.py), но в шарде заявки.
+    # Возвращает строку (version, created_at, closed_at) после изменения.
+    version, status = versioning.expected_version(body)
+    now = now or datetime.utcnow()
+    t = ticket_table
+    stmt = sa.update(t).where(t.c.id == ticket_id)
+    if version is not None:
+        stmt = stmt.where(t.c.version == version)
+    stmt = stmt.values(**fastpath.status_values(t, values, now), version=t.c.version + 1, updated_at=now)
+
+    with _shards().for_ticket(ticket_id).begin() as conn:
+        row = conn.execute(stmt.returning(t.c.version, t.c.created_at, t.c.closed_at)).first()
+        if row is None:
+            # Как и в основной базе (fastpath._explain_miss): заявки нет —
+            # 404, иначе не совпала версия.
+            current = conn.execute(sa.select(t.c.version).where(t.c.id == ticket_id)).scalar()
+            if current is None:
+                abort(404)
+            raise versioning.VersionConflict(status or 409, current)
+    return row
+
+
+# Номер очередного запроса "взять заявку" — с какого шарда его начинать.
+_claim_turn = itertools.count()
+
+
+def claim(assignee_id: int):
+    # Следующая свободная заявка из шардов. Запросы начинают с шардов
+    # по очереди (round-robin), чтобы одновременные запросы сотрудников
+    # расходились по разным базам, и идут по кругу, пока не найдут работу.
+    shards = _shards()
+    start = next(_claim_turn) % shards.count
+    for i in range(shards.count):
+        engine = shards.engines[(start + i) % shards.count]
+        with engine.begin() as conn:
+            row = conn.execute(fastpath.claim_statement(ticket_table, assignee_id, datetime.utcnow())).first()
+        if row is not None:
+            return row
+    return None
+
+
+def release(ticket_id: int) -> int:
+    # Вернуть заявку в очередь (права проверяет вызывающий код).
+    t = ticket_table
+    with _shards().for_ticket(ticket_id).begin() as conn:
+        return conn.execute(
+            sa.update(t)
+            .where(t.c.id == ticket_id)
+            .values(
+                assignee_id=None,
+                status="open",
+                deadline=sla.transition(t, "open"),
+                closed_at=None,
+                version=t.c.version + 1,
+                updated_at=datetime.utcnow(),
+            )
+            .returning(t.c.version)
+        ).scalar()
+
+
+def bump(ticket_id: int, counter: str, delta: int = 1):
+    # Изменить счётчик заявки в её шарде (comment_count, attachment_count).
+    t = ticket_table
+    with _shards().for_ticket(ticket_id).begin() as conn:
+        conn.execute(sa.update(t).where(t.c.id == ticket_id).values({counter: t.c[counter] + delta}))
+
+
+def delete(ticket_id: int) -> bool:
+    t = ticket_table
+    with _shards().for_ticket(ticket_id).begin() as conn:
+        return conn.execute(sa.delete(t).where(t.c.id == ticket_id)).rowcount == 1
+
+
+def delete_author(author_id: int) -> list:
+    # Удалить все заявки автора (они в одном шарде); возвращает их id.
+    t = ticket_table
+    with _shards().for_author(author_id).begin() as conn:
+        return conn.execute(sa.delete(t).where(t.c.author_id == author_id).returning(t.c.id)).scalars().all()
+
+
+def _release_shard(engine, assignee_id: int, deadline) -> int:
+    t = ticket_table
+    in_progress = t.c.status == "in-progress"
+    with engine.begin() as conn:
+        return conn.execute(
+            sa.update(t)
+            .where(t.c.assignee_id == assignee_id)
+            .values(
+                assignee_id=None,
+                status=sa.case((in_progress, "open"), else_=t.c.status),
+                deadline=sa.case((in_progress, deadline), else_=t.c.deadline),
+                version=t.c.version + 1,
+            )
+        ).rowcount
+
+
+def release_assignee(assignee_id: int) -> int:
+    # Вернуть в очередь заявки сотрудника: взятые им заявки могут лежать
+    # в любом шарде, поэтому UPDATE идёт на все шарды параллельно.
+    shards = _shards()
+    deadline = sla.deadline_for("open")
+    return sum(shards.executor.map(lambda e: _release_shard(e, assignee_id, deadline), shards.engines))
+
+
+# ============================================================
+#                     ЭКСПОРТ И ИМПОРТ (app/transfer.py)
+# ============================================================
+
+def iter_chunks(names, chunk_size: int):
+    # Все заявки кусками: шард за шардом, внутри шарда — по id
+    # (та же keyset-пагинация, что и для основной базы).
+    t = ticket_table
+    columns = [t.c[name] for name in names]
+    for engine in _shards().engines:
+        last_id = 0
+        while True:
+            with engine.connect() as conn:
+                rows = conn.execute(
+                    sa.select(*columns).where(t.c.id > last_id).order_by(t.c.id).limit(chunk_size)
+                ).all()
+            if not rows:
+                break
+            yield [dict(row._mapping) for row in rows]
+            last_id = rows[-1].id
+
+
+def insert_rows(rows):
+    # Пачка импорта: каждая заявка — в шард своего id. Транзакции всех
+    # затронутых шардов фиксируются вместе в конце: ошибка в любом
+    # шарде откатывает пачку целиком, и импорт продолжается с прежней
+    # контрольной точки.
+    shards = _shards()
+    by_shard = {}
+    for row in rows:
+        by_shard.setdefault(row["id"] % shards.count, []).append(row)
+    with contextlib.ExitStack() as stack:
+        for index, part in by_shard.items():
+            conn = stack.enter_context(shards.engines[index].begin())
+            conn.execute(sa.insert(ticket_table), part)
@@ -0,0 +1,135 @@
+# Сроки реакции на заявки (SLA).
+#
+# Для каждого статуса задано, сколько секунд заявка может в нём провести
+# (SLA_POLICIES="open:14400,in-progress:86400"; у "closed" срока нет).
+# При каждом переходе в новый статус в заявку записывается готовый срок:
+#
+#     deadline = время перехода + срок статуса   (NULL — срока нет)
+#
+# Поэтому "просрочена ли заявка" — это просто deadline < сейчас, а поиск
+# просроченных — чтение индекса ix_ticket_status_deadline (status, deadline)
+# диапазоном от начала до "сейчас": цена запроса зависит от числа
+# просроченных заявок, а не от размера таблицы, и в Python ничего не
+# сравнивается.
+#
+# Периодическая проверка — фоновая задача sla.check: каждый запуск читает
+# только сроки, истёкшие с прошлого запуска (since < deadline <= now),
+# уведомляет исполнителя (или администраторов, если исполнителя нет) и
+# ставит себя снова через SLA_CHECK_INTERVAL секунд, передав now как since.
+
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case, select, tuple_
+
+from .extensions import db
+from .models import Ticket, User
+
+
+def parse_policies(text: str) -> dict:
+    # "open:14400,in-progress:86400" → {"open": 14400.0, "in-progress": 86400.0}
+    policies = {}
+    for item in text.split(","):
+        if item.strip():
+            status, _, seconds = item.partition(":")
+            policies[status.strip()] = float(seconds)
+    return policies
+
+
+def init_app(app):
+    app.extensions["sla_policies"] = parse_policies(app.config["SLA_POLICIES"])
+
+
+def policies() -> dict:
+    return current_app.extensions["sla_policies"]
+
+
+def deadline_for(status: str, now: datetime = None):
+    # Срок для заявки, которая только что перешла в статус status.
+    seconds = policies().get(status)
+    if seconds is None:
+        return None
+    return (now or datetime.utcnow()) + timedelta(seconds=seconds)
+
+
+def transition(table, status: str, now: datetime = None):
+    # Значение для SET deadline = ... в UPDATE, меняющем статус:
+    #   CASE WHEN status = :new THEN deadline ELSE :новый срок END
+    # Если статус на самом деле не меняется (open → open), срок остаётся
+    # прежним — иначе повторное сохранение формы "продлевало" бы SLA.
+    # table — Ticket.__table__ или таблица шарда (app/sharding.py).
+    return case((table.c.status == status, table.c.deadline), else_=deadline_for(status, now))
+
+
+def overdue_statement(table, now: datetime, since: datetime = None, after=None, limit: int = 100):
+    # SELECT ... WHERE status IN (<статусы со сроком>) AND deadline <= :now
+    #   [AND deadline > :since] [AND (deadline, id) > :after]
+    # ORDER BY deadline, id LIMIT :limit
+    # Для каждого статуса — диапазон индекса (status, deadline).
+    # after — (deadline, id) последней строки предыдущей порции.
+    stmt = select(table).where(table.c.status.in_(list(policies())), table.c.deadline <= now)
+    if since is not None:
+        stmt = stmt.where(table.c.deadline > since)
+    if after is not None:
+        stmt = stmt.where(tuple_(table.c.deadline, table.c.id) > tuple(after))
+    return stmt.order_by(table.c.deadline, table.c.id).limit(limit)
+
+
+def overdue(now: datetime = None, since: datetime = None, after=None, limit: int = 100):
+    # Просроченные заявки, самые давние сверху.
+    from . import sharding
+
+    now = now or datetime.utcnow()
+    if sharding.enabled():
+        return sharding.overdue(now, since, after, limit)
+    return db.session.execute(overdue_statement(Ticket.__table__, now, since, after, limit)).all()
+
+
+# ============================================================
+#                 ПЕРИОДИЧЕСКАЯ ПРОВЕРКА
+# ============================================================
+
+def check(since: str = None, batch_size: int = 500) -> int:
+    # Уведомить о заявках, чей срок истёк после since (ISO-время прошлой
+    # проверки). Возвращает число найденных заявок и ставит следующую
+    # проверку. Первая проверка смотрит на один интервал назад.
+    from . import jobs, notifications
+
+    interval = current_app.config["SLA_CHECK_INTERVAL"]
+    now = datetime.utcnow()
+    start = datetime.fromisoformat(since) if since else now - timedelta(seconds=interval)
+
+    found = 0
+    admins = None
+    after = None
+    while True:
+        rows = overdue(now, start, after, batch_size)
+        for t in rows:
+            if t.assignee_id is not None:
+                recipients = [t.assignee_id]
+            else:
+                # Никто не взял — сообщаем всем сотрудникам поддержки.
+                if admins is None:
+                    admins = db.session.execute(select(User.id).where(User.role == "admin")).scalars().all()
+                recipients = admins
+            notifications.deliver(
+                recipients, t.id, "sla", notifications.MESSAGES["sla"].format(title=t.title, status=t.status)
+            )
+        found += len(rows)
+        if len(rows) < batch_size:
+            break
+        # Следующая порция — после последней строки этой.
+        after = (rows[-1].deadline, rows[-1].id)
+
+    jobs.enqueue("sla.check", {"since": now.isoformat()}, delay=interval)
+    db.session.commit()
+    return found
+
+
+def ensure_scheduled():
+    # Поставить проверку, если её нет в очереди (jobs-worker делает то же
+    # для всех периодических задач, см. jobs.schedule_periodic). Дальше
+    # задача сама ставит себя заново.
+    from . import jobs
+
+    jobs.ensure_queued("sla.check")
@@ -0,0 +1,162 @@
+# Подписанные токены доступа для JSON-API (альтернатива cookie-сессии).
+#
+# Токен выглядит так:  <kid>.<данные>.<подпись>
+#  - kid      — имя ключа, которым подписан токен;
+#  - данные   — base64(JSON): id пользователя, имя, роль, время выдачи и окончания;
+#  - подпись  — HMAC-SHA256 от "<kid>.<данные>".
+#
+# Проверка токена — это только пересчёт HMAC и сравнение времени,
+# без запроса к базе данных. Поэтому любой процесс (или сервер), знающий
+# ключи, может проверить токен сам.
+#
+# Смена ключей (key rotation): в API_TOKEN_KEYS можно указать несколько
+# ключей. Новые токены подписываются первым, а проверяются все —
+# так старые токены работают до истечения срока, пока старый ключ не убран.
+#
+# Отзыв: для удалённых (или изменённых) пользователей ведётся короткий
+# список отзыва в памяти. Запись в нём нужна не дольше срока жизни токена.
+# Другие процессы получают отзыв через шину app/bus.py.
+
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+
+from flask import current_app
+from flask_login import UserMixin
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def parse_keys(value: str, default: str) -> dict:
+    # "k2:секрет2,k1:секрет1" → {"k2": b"секрет2", "k1": b"секрет1"} (порядок важен).
+    if not value:
+        return {"default": default.encode("utf-8")}
+    keys = {}
+    for item in value.split(","):
+        kid, _, secret = item.strip().partition(":")
+        keys[kid] = secret.encode("utf-8")
+    return keys
+
+
+class TokenUser(UserMixin):
+    # "Пользователь" из токена — не строка из базы, а данные из подписи.
+    # У него есть всё, что используют обработчики API: id, username, role.
+
+    def __init__(self, user_id: int, username: str, role: str):
+        self.id = user_id
+        self.username = username
+        self.role = role
+
+
+class RevocationList:
+    # Пользователи, чьи токены больше не принимаются.
+    # user_id → (время отзыва, до какого времени помнить запись).
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def revoke(self, user_id: int, ttl: float, at: float = None):
+        # at — момент отзыва (по умолчанию сейчас; из шины — время в
+        # процессе, где отозвали). Более ранний отзыв не заменяет поздний.
+        now = time.time()
+        at = now if at is None else at
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None or entry[0] < at:
+                self.entries[user_id] = (at, at + ttl)
+            # Заодно выбрасываем устаревшие записи — список остаётся коротким.
+            for uid, (_, until) in list(self.entries.items()):
+                if until < now:
+                    del self.entries[uid]
+
+    def is_revoked(self, user_id: int, issued_at: float) -> bool:
+        # Токен отозван, если выдан не позже момента отзыва.
+        entry = self.entries.get(user_id)
+        return entry is not None and issued_at <= entry[0]
+
+
+def init_app(app):
+    app.extensions["token_keys"] = parse_keys(app.config["API_TOKEN_KEYS"], app.config["SECRET_KEY"])
+    revocations = RevocationList()
+    app.extensions["token_revocations"] = revocations
+
+    def apply(keys):
+        # Ключи из шины: "<user_id>:<время отзыва>".
+        for key in keys:
+            user_id, at = key.split(":")
+            revocations.revoke(int(user_id), app.config["API_TOKEN_TTL"], float(at))
+
+    app.extensions["bus"].subscribe("token", apply)
+
+
+def _sign(key: bytes, message: bytes) -> bytes:
+    return base64.urlsafe_b64encode(hmac.new(key, message, hashlib.sha256).digest()).rstrip(b"=")
+
+
+def issue(user) -> str:
+    # Выдаём токен для пользователя (подписываем первым, "текущим" ключом).
+    keys = current_app.extensions["token_keys"]
+    kid = next(iter(keys))
+    now = time.time()
+    data = {
+        "sub": user.id,
+        "name": user.username,
+        "role": user.role,
+        "iat": now,
+        "exp": now + current_app.config["API_TOKEN_TTL"],
+    }
+    body = _b64encode(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+    message = f"{kid}.{body}"
+    return f"{message}.{_sign(keys[kid], message.encode('ascii')).decode('ascii')}"
+
+
+def verify(token: str):
+    # Проверяем токен. Возвращает TokenUser или None, если токен плохой.
+    # Настоящий токен — только ASCII; всё остальное отбрасываем сразу,
+    # а подпись сравниваем как байты.
+    try:
+        kid, body, signature = token.encode("ascii").split(b".")
+    except (UnicodeEncodeError, ValueError):
+        return None
+
+    key = current_app.extensions["token_keys"].get(kid.decode("ascii"))
+    if key is None or not hmac.compare_digest(signature, _sign(key, kid + b"." + body)):
+        return None
+
+    try:
+        data = json.loads(_b64decode(body.decode("ascii")))
+    except ValueError:
+        return None
+
+    if data["exp"] < time.time():
+        return None
+    if current_app.extensions["token_revocations"].is_revoked(data["sub"], data["iat"]):
+        return None
+    return TokenUser(data["sub"], data["name"], data["role"])
+
+
+def revoke_user(user_id: int):
+    # Отозвать все выданные пользователю токены (удаление, смена роли).
+    now = time.time()
+    current_app.extensions["token_revocations"].revoke(user_id, current_app.config["API_TOKEN_TTL"], now)
+    current_app.extensions["bus"].publish("token", [f"{user_id}:{now}"])
+
+
+def user_from_request(req):
+    # Для Flask-Login: достаём пользователя из заголовка
+    # "Authorization: Bearer <токен>", если он есть.
+    header = req.headers.get("Authorization", "")
+    scheme, _, token = header.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return verify(token.strip())
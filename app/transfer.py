@@ -0,0 +1,325 @@
+# Перенос данных между окружениями: экспорт и импорт пользователей и заявок.
+#
+# Экспорт читает таблицу кусками (по CHUNK_SIZE строк) и отдаёт данные
+# потоком в формате CSV или NDJSON (одна JSON-запись на строку),
+# поэтому даже миллионы строк не загружаются в память целиком.
+#
+# Импорт вставляет строки пачками (batch insert) и после каждой пачки
+# делает commit, а номер последней сохранённой строки записывает в файл
+# контрольной точки (checkpoint). Если импорт прервался, его можно
+# продолжить с этого места, а не начинать сначала.
+#
+# В режиме шардирования (app/sharding.py) заявки выгружаются из всех
+# шардов по очереди и загружаются каждая в свой шард.
+#
+# Важно: хеши паролей переносятся как есть (колонка password_hash),
+# set_password() не вызывается — bcrypt при миграции не работает.
+
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import insert, select, func, text
+from sqlalchemy.exc import IntegrityError
+
+from . import sharding, sla
+from .extensions import db
+from .models import User, Ticket
+
+
+# Сколько строк читаем из базы за один запрос при экспорте.
+CHUNK_SIZE = 1000
+
+# Сколько строк вставляем за один INSERT при импорте.
+BATCH_SIZE = 1000
+
+# Поддерживаемые форматы и их MIME-типы (для HTTP-ответов).
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+# Какие таблицы можно переносить и какие колонки в них выгружаются.
+# Порядок колонок — это и порядок столбцов в CSV.
+KINDS = {
+    "users": (User, ("id", "username", "password_hash", "role")),
+    "tickets": (
+        Ticket,
+        (
+            "id", "title", "description", "status", "created_at", "updated_at", "author_id",
+            "assignee_id", "version", "deadline", "closed_at",
+        ),
+    ),
+}
+
+# Колонки, которые при импорте нужно превратить из строки обратно в число/дату.
+INT_FIELDS = {"id", "author_id", "assignee_id", "version"}
+DATETIME_FIELDS = {"created_at", "updated_at", "deadline", "closed_at"}
+
+# Колонки заявок, которых нет в старых выгрузках: при импорте такого
+# файла они заполняются по остальным полям (см. _fill_old_ticket).
+BACKFILLED = {"version", "deadline", "closed_at"}
+
+
+class TransferError(ValueError):
+    # Ошибка в данных импорта: неизвестная таблица, формат или испорченная строка.
+    pass
+
+
+def _columns(kind: str):
+    # Возвращаем таблицу и список её колонок для указанного вида данных.
+    if kind not in KINDS:
+        raise TransferError(f"unknown kind: {kind}")
+    model, fields = KINDS[kind]
+    table = model.__table__
+    return table, [table.c[name] for name in fields]
+
+
+def _sharded(kind: str) -> bool:
+    # Заявки в режиме шардирования читаются и пишутся в базах-шардах
+    # (app/sharding.py), остальные таблицы — в основной базе.
+    return kind == "tickets" and sharding.enabled()
+
+
+def check_format(fmt: str) -> str:
+    # Проверяем, что формат нам знаком.
+    if fmt not in FORMATS:
+        raise TransferError(f"unknown format: {fmt}")
+    return fmt
+
+
+def format_from_path(path: str, default: str = "ndjson") -> str:
+    # Определяем формат по расширению файла: users.csv → csv, tickets.ndjson → ndjson.
+    ext = os.path.splitext(path)[1].lstrip(".").lower()
+    if ext == "jsonl":
+        ext = "ndjson"
+    return ext if ext in FORMATS else default
+
+
+# ============================================================
+#                          ЭКСПОРТ
+# ============================================================
+
+def iter_rows(kind: str, chunk_size: int = CHUNK_SIZE):
+    # Читаем таблицу кусками по первичному ключу (keyset-пагинация):
+    # WHERE id > последний_id ORDER BY id LIMIT chunk_size.
+    # В отличие от OFFSET, каждый следующий кусок читается так же быстро,
+    # как первый, и между кусками не держится открытый курсор.
+    table, columns = _columns(kind)
+    if _sharded(kind):
+        yield from sharding.iter_chunks([c.name for c in columns], chunk_size)
+        return
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(*columns)
+            .where(table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        yield [dict(row._mapping) for row in rows]
+        last_id = rows[-1].id
+
+
+def _to_text(value):
+    # Даты пишем в ISO-формате, None — пустой строкой (для CSV).
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def export_stream(kind: str, fmt: str = "ndjson", chunk_size: int = CHUNK_SIZE):
+    # Генератор текстовых кусков для потоковой выдачи (файл или HTTP-ответ).
+    # На каждый прочитанный из базы кусок строк — один кусок текста.
+    check_format(fmt)
+    _, columns = _columns(kind)
+    names = [c.name for c in columns]
+
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(names)
+        for chunk in iter_rows(kind, chunk_size):
+            for row in chunk:
+                writer.writerow(
+                    ["" if row[n] is None else _to_text(row[n]) for n in names]
+                )
+            yield buf.getvalue()
+            # Очищаем буфер, чтобы он не рос вместе с выгрузкой.
+            buf.seek(0)
+            buf.truncate()
+        # Если таблица пустая, заголовок всё равно нужно отдать.
+        if buf.tell():
+            yield buf.getvalue()
+    else:
+        for chunk in iter_rows(kind, chunk_size):
+            yield "".join(
+                json.dumps({n: _to_text(row[n]) for n in names}, ensure_ascii=False) + "\n"
+                for row in chunk
+            )
+
+
+# ============================================================
+#                          ИМПОРТ
+# ============================================================
+
+def parse_rows(lines, fmt: str):
+    # Превращаем строки файла (или тела запроса) в словари.
+    # lines — любой итератор по текстовым строкам, файл читается лениво.
+    check_format(fmt)
+    if fmt == "csv":
+        yield from csv.DictReader(lines)
+    else:
+        for number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise TransferError(f"line {number}: bad JSON ({e.msg})")
+            if not isinstance(row, dict):
+                raise TransferError(f"line {number}: expected a JSON object")
+            yield row
+
+
+def _clean_row(kind: str, raw: dict, number: int) -> dict:
+    # Приводим строку к виду, пригодному для INSERT:
+    # оставляем только известные колонки и восстанавливаем типы.
+    _, columns = _columns(kind)
+    row = {}
+    for column in columns:
+        name = column.name
+        if kind == "tickets" and name in BACKFILLED and name not in raw:
+            continue
+        value = raw.get(name)
+        if value == "" and name not in ("title", "description", "username"):
+            value = None
+        try:
+            if value is not None and name in INT_FIELDS:
+                value = int(value)
+            elif value is not None and name in DATETIME_FIELDS:
+                value = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise TransferError(f"row {number}: bad value for {name}")
+        if value is None and not column.nullable:
+            raise TransferError(f"row {number}: {name} required")
+        row[name] = value
+    if kind == "tickets":
+        _fill_old_ticket(raw, row)
+        # Шард заявки находят и по id, и по автору — они должны совпадать.
+        if _sharded(kind) and not sharding.in_author_shard(row["id"], row["author_id"]):
+            raise TransferError(f"row {number}: id {row['id']} is not in the shard of author {row['author_id']}")
+    return row
+
+
+def _fill_old_ticket(raw: dict, row: dict):
+    # Выгрузки до появления версий, сроков SLA и времени закрытия:
+    # таких колонок в файле нет вовсе (а не пустые значения). Версия
+    # начинается с 1, срок считается от последнего изменения заявки,
+    # закрытой заявке время закрытия — тоже последнее изменение.
+    if "version" not in raw:
+        row["version"] = 1
+    if "deadline" not in raw:
+        row["deadline"] = sla.deadline_for(row["status"], row["updated_at"])
+    if "closed_at" not in raw:
+        row["closed_at"] = row["updated_at"] if row["status"] == "closed" else None
+
+
+def import_rows(kind: str, rows, start: int = 0, batch_size: int = BATCH_SIZE, on_batch=None) -> int:
+    # Импорт строк пачками.
+    #  - start — сколько строк уже было импортировано раньше (их пропускаем);
+    #  - on_batch(done) — вызывается после commit каждой пачки, сюда
+    #    удобно записывать контрольную точку.
+    # Возвращает общее число обработанных строк (вместе с пропущенными).
+    table, _ = _columns(kind)
+    done = start
+    rows = islice(rows, start, None)
+
+    while True:
+        batch = [
+            _clean_row(kind, raw, done + i + 1)
+            for i, raw in enumerate(islice(rows, batch_size))
+        ]
+        if not batch:
+            break
+
+        # Один INSERT на всю пачку (executemany), без создания ORM-объектов.
+        # Конфликт (занятый id, имя) откатывает только эту пачку: прошлые
+        # уже сохранены, и импорт можно продолжить с контрольной точки.
+        try:
+            if _sharded(kind):
+                sharding.insert_rows(batch)
+            else:
+                db.session.execute(insert(table), batch)
+                db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            raise TransferError(
+                f"rows {done + 1}-{done + len(batch)}: {str(e.orig).splitlines()[0]}"
+            )
+
+        done += len(batch)
+        if on_batch:
+            on_batch(done)
+
+    # id заявок в шардах выдаёт не счётчик базы, а sharding.create.
+    if not _sharded(kind):
+        _sync_sequence(table)
+    return done
+
+
+def _sync_sequence(table):
+    # В PostgreSQL после вставки явных id нужно сдвинуть счётчик,
+    # иначе следующая обычная вставка получит уже занятый id.
+    # SQLite сам берёт max(id) + 1, там ничего делать не нужно.
+    if db.engine.dialect.name != "postgresql":
+        return
+    max_id = db.session.execute(select(func.max(table.c.id))).scalar()
+    if max_id:
+        db.session.execute(
+            text("SELECT setval(pg_get_serial_sequence(:t, 'id'), :v)"),
+            {"t": table.name, "v": max_id},
+        )
+        db.session.commit()
+
+
+# ============================================================
+#                    КОНТРОЛЬНЫЕ ТОЧКИ ИМПОРТА
+# ============================================================
+
+class Checkpoint:
+    # Маленький JSON-файл рядом с импортируемым файлом:
+    # {"kind": "users", "rows": 42000}
+    # Записывается атомарно (через временный файл и os.replace),
+    # чтобы прерывание в момент записи не испортило его.
+
+    def __init__(self, path: str, kind: str):
+        self.path = path
+        self.kind = kind
+
+    def load(self) -> int:
+        # Сколько строк уже импортировано (0, если файла нет).
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0
+        if data.get("kind") != self.kind:
+            raise TransferError(f"checkpoint {self.path} belongs to {data.get('kind')}")
+        return int(data.get("rows", 0))
+
+    def save(self, rows: int):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"kind": self.kind, "rows": rows}, f)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
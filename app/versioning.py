@@ -0,0 +1,57 @@
+# Оптимистичная блокировка заявок (optimistic concurrency control).
+#
+# Вместо "прочитать → изменить → сохранить" без проверок (когда второе
+# сохранение молча затирает первое) изменение делается одним условным
+# запросом:
+#
+#     UPDATE ticket SET ..., version = version + 1
+#     WHERE id = :id AND version = :version_которую_видел_клиент
+#
+# Если кто-то успел изменить заявку раньше, версия уже другая,
+# запрос не изменит ни одной строки, и клиент получит конфликт:
+#  - 412 Precondition Failed — если версия пришла в заголовке If-Match;
+#  - 409 Conflict            — если версия пришла в теле запроса/форме.
+# Блокировки строк не используются, поэтому параллельные правки
+# разных заявок друг другу не мешают.
+#
+# Сам условный UPDATE выполняется в app/fastpath.py (вместе с проверкой
+# прав), здесь — разбор версии из запроса и ошибка конфликта.
+
+from flask import request
+
+
+class VersionConflict(Exception):
+    # Заявку успели изменить. status — какой HTTP-код вернуть (409 или 412).
+    def __init__(self, status: int, current_version: int = None):
+        super().__init__("version conflict")
+        self.status = status
+        self.current_version = current_version
+
+
+def etag(version: int) -> str:
+    # ETag для заявки — просто номер версии в кавычках.
+    return f'"{version}"'
+
+
+def expected_version(body: dict = None):
+    # Какую версию клиент ожидает увидеть в базе.
+    # Возвращает (версия, код ошибки при конфликте) или (None, None),
+    # если клиент версию не прислал — тогда изменение безусловное.
+    if_match = request.headers.get("If-Match")
+    if if_match and if_match.strip() != "*":
+        value = if_match.split(",")[0].strip()
+        if value.startswith("W/"):
+            value = value[2:]
+        try:
+            return int(value.strip('"')), 412
+        except ValueError:
+            # Непонятный ETag не может совпасть ни с одной версией.
+            return -1, 412
+
+    raw = (body or {}).get("version")
+    if raw not in (None, ""):
+        try:
+            return int(raw), 409
+        except (TypeError, ValueError):
+            return -1, 409
+    return None, None
@@ -19,11 +19,19 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 # - current_user — объект, содержащий текущего авторизованного пользователя.
 from flask_login import login_user, logout_user, login_required, current_user
 
-# Импортируем модели User и Ticket, чтобы работать с пользователями и заявками.
-from .models import User, Ticket
+# Общий слой логики (app/services.py): те же запросы и проверки прав,
+# что и у JSON-API. Здесь только разбор форм и HTML-ответы.
+from . import services
+from .services import Forbidden, ServiceError, VersionConflict
 
-# Импортируем базу данных и шифровщик паролей.
-from .extensions import db, bcrypt
+# Ограничение частоты попыток входа.
+from .ratelimit import check_login
+
+# Чтение с реплики для страниц, которые ничего не меняют.
+from .routing import read_only
+
+# Отдача файлов вложений.
+from . import attachments
 
 
 # -------------------------------------------------------------
@@ -67,11 +75,19 @@ def web_login():
         username = request.form.get("username", "").strip()
         password = request.form.get("password", "").strip()
 
-        # Ищем пользователя в базе по имени.
-        user = User.query.filter_by(username=username).first()
+        # Проверяем лимит попыток входа ещё до bcrypt.
+        # Если попыток слишком много — отвечаем 429 и подсказываем,
+        # через сколько секунд можно повторить (заголовок Retry-After).
+        retry_after = check_login(username)
+        if retry_after:
+            flash(f"Слишком много попыток входа. Повторите через {retry_after} с.")
+            return render_template("login.html"), 429, {"Retry-After": str(retry_after)}
+
+        # Ищем пользователя в базе по имени и проверяем пароль.
+        user = services.authenticate(username, password)
 
         # Если пользователь существует и пароль подходит:
-        if user and user.check_password(password):
+        if user:
             # login_user — "залогинивает" пользователя.
             login_user(user)
 
@@ -113,26 +129,14 @@ def web_register():
         username = request.form.get("username", "").strip()
         password = request.form.get("password", "").strip()
 
-        # Проверяем пустые поля.
-        if not username or not password:
-            flash("Заполните все поля")
-            return redirect(url_for("web.web_register"))
-
-        # Проверяем, существует ли пользователь с таким логином.
-        if User.query.filter_by(username=username).first():
-            flash("Пользователь уже существует")
+        # Проверяем поля и создаём пользователя (пароль хешируется).
+        # Если поля пустые или логин занят — показываем причину.
+        try:
+            services.register_user(username, password)
+        except ServiceError as e:
+            flash(e.message)
             return redirect(url_for("web.web_register"))
 
-        # Создаём нового пользователя.
-        user = User(username=username)
-
-        # Устанавливаем пароль (с хешированием).
-        user.set_password(password)
-
-        # Добавляем в базу данных.
-        db.session.add(user)
-        db.session.commit()
-
         # Сообщаем об успехе.
         flash("Регистрация успешна!")
 
@@ -148,6 +152,7 @@ def web_register():
 # =============================================================
 
 @web_bp.route("/tickets", methods=["GET", "POST"])
+@read_only  # Только чтение — можно с реплики
 @login_required  # Только авторизованные могут видеть заявки.
 def tickets():
 
@@ -157,32 +162,21 @@ def tickets():
         title = request.form["title"].strip()
         description = request.form.get("description", "")
 
-        # Название обязательно.
-        if not title:
-            flash("Название обязательно")
+        # Создаём заявку (автор — текущий пользователь).
+        # Название обязательно — иначе показываем сообщение.
+        try:
+            services.create_ticket(current_user, title, description)
+        except ServiceError as e:
+            flash(e.message)
             return redirect(url_for("web.tickets"))
 
-        # Создаём объект заявки.
-        t = Ticket(
-            title=title,
-            description=description,
-            author_id=current_user.id  # Текущий пользователь — автор.
-        )
-
-        # Сохраняем в базе.
-        db.session.add(t)
-        db.session.commit()
-
         flash("Заявка создана")
         return redirect(url_for("web.tickets"))
 
     # Если GET — показываем список заявок.
-    # Администратор видит всё.
-    # Обычный пользователь — только свои.
-    query = Ticket.query if current_user.role == "admin" else Ticket.query.filter_by(author_id=current_user.id)
-
-    # Получаем список, отсортированный по дате обновления (сначала новые).
-    tickets = query.order_by(Ticket.updated_at.desc()).all()
+    # Администратор видит всё, обычный пользователь — только свои;
+    # сначала новые. Авторы загружаются тем же запросом.
+    tickets = services.list_tickets(current_user)
 
     # Передаём список в HTML-шаблон.
     return render_template("tickets.html", tickets=tickets)
@@ -193,22 +187,117 @@ def tickets():
 # =============================================================
 
 @web_bp.route("/tickets/<int:ticket_id>", methods=["GET"])
+@read_only  # Только чтение — можно с реплики
 @login_required
 def ticket_detail(ticket_id):
 
-    # Ищем заявку по ID.
-    # Если нет — автоматически выдаст ошибку 404.
-    t = Ticket.query.get_or_404(ticket_id)
-
-    # Проверка доступа:
+    # Ищем заявку по ID (если нет — ошибка 404) и проверяем доступ:
     #  - админ может смотреть всё
     #  - обычный пользователь — только свои
-    if current_user.role != "admin" and t.author_id != current_user.id:
+    try:
+        t = services.get_ticket(current_user, ticket_id)
+    except Forbidden:
         flash("Нет доступа к этой заявке")
         return redirect(url_for("web.tickets"))
 
     # Показываем страницу заявки.
-    return render_template("ticket_detail.html", t=t)
+    return _render_detail(t)
+
+
+def _render_detail(t, status: int = 200):
+    # Страница заявки с одной страницей комментариев.
+    # ?after=<курсор> — следующая страница (keyset, без OFFSET), поэтому
+    # заявка с тысячами комментариев открывается так же быстро.
+    try:
+        comments, next_cursor = services.comment_page(t.id, request.args.get("after"))
+    except ServiceError as e:
+        flash(e.message)
+        comments, next_cursor = services.comment_page(t.id)
+    return render_template(
+        "ticket_detail.html",
+        t=t,
+        comments=comments,
+        next_cursor=next_cursor,
+        attachments=services.attachments_of(t),
+    ), status
+
+
+# =============================================================
+#                   КОММЕНТАРИИ К ЗАЯВКЕ
+# =============================================================
+
+@web_bp.route("/tickets/<int:ticket_id>/comments", methods=["POST"])
+@login_required
+def add_comment(ticket_id):
+
+    # Комментировать может автор заявки или администратор.
+    try:
+        services.add_comment(current_user, ticket_id, request.form.get("body", "").strip())
+    except Forbidden:
+        flash("Нет доступа к этой заявке")
+        return redirect(url_for("web.tickets"))
+    except ServiceError as e:
+        flash(e.message)
+
+    return redirect(url_for("web.ticket_detail", ticket_id=ticket_id) + "#comments")
+
+
+# =============================================================
+#                   ВЛОЖЕНИЯ (ФАЙЛЫ) ЗАЯВКИ
+# =============================================================
+
+@web_bp.route("/tickets/<int:ticket_id>/attachments", methods=["POST"])
+@login_required
+def add_attachment(ticket_id):
+
+    # Файл из формы (multipart). Werkzeug при разборе формы сам пишет
+    # большие файлы во временный файл, а мы копируем его в хранилище
+    # кусками — целиком в память файл не читается.
+    upload = request.files.get("file")
+    if upload is None or not upload.filename:
+        flash("Выберите файл")
+        return redirect(url_for("web.ticket_detail", ticket_id=ticket_id))
+
+    try:
+        services.add_attachment(current_user, ticket_id, upload.stream, upload.filename, upload.mimetype)
+    except Forbidden:
+        flash("Нет доступа к этой заявке")
+        return redirect(url_for("web.tickets"))
+    except ServiceError as e:
+        flash(e.message)
+        return redirect(url_for("web.ticket_detail", ticket_id=ticket_id))
+
+    flash("Файл прикреплён")
+    return redirect(url_for("web.ticket_detail", ticket_id=ticket_id))
+
+
+@web_bp.route("/tickets/<int:ticket_id>/attachments/<int:attachment_id>", methods=["GET"])
+@read_only  # Только чтение — можно с реплики
+@login_required
+def download_attachment(ticket_id, attachment_id):
+
+    # Те же права, что и на просмотр заявки.
+    try:
+        a = services.get_attachment(current_user, ticket_id, attachment_id)
+    except Forbidden:
+        flash("Нет доступа к этой заявке")
+        return redirect(url_for("web.tickets"))
+
+    return attachments.send(a)
+
+
+@web_bp.route("/tickets/<int:ticket_id>/attachments/<int:attachment_id>/delete", methods=["POST"])
+@login_required
+def delete_attachment(ticket_id, attachment_id):
+
+    try:
+        services.delete_attachment(current_user, ticket_id, attachment_id)
+    except Forbidden:
+        flash("Нет доступа к этой заявке")
+        return redirect(url_for("web.tickets"))
+
+    flash("Файл удалён")
+    return redirect(url_for("web.ticket_detail", ticket_id=ticket_id))
 
 
 # =============================================================
@@ -219,26 +308,33 @@ def ticket_detail(ticket_id):
 @login_required
 def update_ticket(ticket_id):
 
-    # Ищем заявку.
-    t = Ticket.query.get_or_404(ticket_id)
-
-    # Проверяем права.
-    if t.author_id != current_user.id and current_user.role != "admin":
-        flash("Нет прав для изменения этой заявки")
-        return redirect(url_for("web.ticket_detail", ticket_id=t.id))
-
     # new_status будет:
     #  - из формы (если HTML)
     #  - из JSON (если обращается API)
+    data = (request.get_json(silent=True) or {}) if request.is_json else request.form
     new_status = request.form.get("status") or (request.json.get("status") if request.is_json else None)
 
-    # Если статус передали — обновляем.
+    # Если статус передали — обновляем одним запросом:
+    # UPDATE ... WHERE id=? AND (автор или админ) AND version=?.
+    # Заявку заранее не загружаем; права и версия проверяются в WHERE.
+    # Без статуса менять нечего, но права и существование заявки
+    # проверяются всё равно (services.update_ticket с пустыми values).
+    values = {"status": new_status} if new_status else {}
+    try:
+        _, title = services.update_ticket(current_user, ticket_id, values, data)
+    except Forbidden:
+        flash("Нет прав для изменения этой заявки")
+        return redirect(url_for("web.ticket_detail", ticket_id=ticket_id))
+    except VersionConflict as e:
+        # Форма присылает версию, которую видел пользователь:
+        # если заявку уже изменили, показываем её заново с кодом 409.
+        flash("Заявку уже изменил другой пользователь — проверьте данные и повторите")
+        t = services.get_ticket(current_user, ticket_id)
+        return _render_detail(t, e.status)
     if new_status:
-        t.status = new_status
-        db.session.commit()
-        flash(f"Статус заявки {t.title} обновлен")
+        flash(f"Статус заявки {title} обновлен")
 
-    return redirect(url_for("web.ticket_detail", ticket_id=t.id))
+    return redirect(url_for("web.ticket_detail", ticket_id=ticket_id))
 
 
 # =============================================================
@@ -249,42 +345,118 @@ def update_ticket(ticket_id):
 @login_required
 def delete_ticket(ticket_id):
 
-    # Ищем заявку.
-    t = Ticket.query.get_or_404(ticket_id)
-
-    # Проверяем доступ (как всегда).
-    if t.author_id != current_user.id and current_user.role != "admin":
+    # Удаляем одним запросом: DELETE ... WHERE id=? AND (автор или админ).
+    # Название заявки для сообщения возвращает сам DELETE (RETURNING).
+    try:
+        title = services.delete_ticket(current_user, ticket_id)
+    except Forbidden:
         flash("Нет прав для удаления заявки")
-        return redirect(url_for("web.ticket_detail", ticket_id=t.id))
-
-    # Удаляем.
-    db.session.delete(t)
-    db.session.commit()
+        return redirect(url_for("web.ticket_detail", ticket_id=ticket_id))
 
     # Если это API-запрос (DELETE) — возвращаем JSON.
     if request.method == "DELETE":
         return jsonify({"message": "ticket deleted"}), 200
 
     # Иначе — HTML.
-    flash(f"Заявка {t.title} была удалена")
+    flash(f"Заявка {title} была удалена")
     return redirect(url_for("web.tickets"))
 
 
+# =============================================================
+#            ВЗЯТЬ СЛЕДУЮЩУЮ ЗАЯВКУ / ВЕРНУТЬ В ОЧЕРЕДЬ
+# =============================================================
+
+@web_bp.route("/tickets/claim", methods=["POST"])
+@login_required
+def claim_ticket():
+
+    # Сотрудник (админ) получает самую старую свободную открытую заявку —
+    # вместо того чтобы искать её глазами в общем списке.
+    try:
+        t = services.claim_next(current_user)
+    except Forbidden:
+        flash("Нет доступа")
+        return redirect(url_for("web.tickets"))
+
+    if t is None:
+        flash("Свободных заявок нет")
+        return redirect(url_for("web.tickets"))
+
+    flash(f"Вы взяли в работу заявку {t.title}")
+    return redirect(url_for("web.ticket_detail", ticket_id=t.id))
+
+
+@web_bp.route("/tickets/<int:ticket_id>/release", methods=["POST"])
+@login_required
+def release_ticket(ticket_id):
+
+    # Снять исполнителя: заявка снова попадает в очередь.
+    try:
+        services.release_ticket(current_user, ticket_id)
+    except Forbidden:
+        flash("Нет прав для изменения заявки")
+        return redirect(url_for("web.ticket_detail", ticket_id=ticket_id))
+
+    flash("Заявка возвращена в очередь")
+    return redirect(url_for("web.ticket_detail", ticket_id=ticket_id))
+
+
+# =============================================================
+#                         УВЕДОМЛЕНИЯ
+# =============================================================
+
+@web_bp.app_context_processor
+def unread_notifications():
+    # Число непрочитанных уведомлений для значка в шапке (base.html).
+    # Функция, а не значение: запрос к базе делается, только если
+    # шаблон действительно рисует шапку для вошедшего пользователя.
+    def count():
+        if not current_user.is_authenticated:
+            return 0
+        return services.unread_count(current_user)
+
+    return {"unread_notifications": count}
+
+
+@web_bp.route("/notifications", methods=["GET"])
+@read_only  # Только чтение — можно с реплики
+@login_required
+def notifications():
+
+    # Последние уведомления пользователя, новые сверху.
+    rows = services.list_notifications(current_user, limit=100)
+    return render_template("notifications.html", notifications=rows)
+
+
+@web_bp.route("/notifications/read", methods=["POST"])
+@login_required
+def read_notifications():
+
+    # Отметить все уведомления прочитанными.
+    services.mark_read(current_user)
+    return redirect(url_for("web.notifications"))
+
+
 # =============================================================
 #                   СТРАНИЦА ВСЕХ ПОЛЬЗОВАТЕЛЕЙ (АДМИН)
 # =============================================================
 
 @web_bp.route("/users", methods=["GET"])
+@read_only  # Только чтение — можно с реплики
 @login_required
 def users():
 
     # Только администратор может смотреть всех пользователей.
-    if current_user.role != "admin":
+    # Каталог показывается страницами по алфавиту; q — поиск по началу имени.
+    q = request.args.get("q", "").strip()
+    try:
+        users, next_after = services.list_users(current_user, q, request.args.get("after"))
+    except Forbidden:
         flash("Нет доступа к этой странице")
         return redirect(url_for("web.index"))
 
-    # Передаём список пользователей в шаблон users.html.
-    return render_template("users.html", users=User.query.all())
+    # Передаём страницу пользователей в шаблон users.html.
+    return render_template("users.html", users=users, q=q, next_after=next_after)
 
 
 # =============================================================
@@ -295,26 +467,20 @@ def users():
 @login_required
 def update_user_role(user_id):
 
-    # Проверка, что это админ.
-    if current_user.role != "admin":
-        flash("Нет доступа")
-        return redirect(url_for("web.index"))
-
-    # Получаем пользователя.
-    user = User.query.get_or_404(user_id)
-
     # Роль может приходить как из формы, так и из JSON.
     new_role = request.form.get("role") or (request.json.get("role") if request.is_json else None)
 
-    # Проверяем корректность роли.
-    if new_role not in ["user", "admin"]:
-        flash("Некорректная роль")
+    # Проверка, что это админ, и корректности роли; сохранение роли
+    # и отзыв токенов API пользователя (роль зашита в токены).
+    try:
+        user = services.set_role(current_user, user_id, new_role)
+    except Forbidden:
+        flash("Нет доступа")
+        return redirect(url_for("web.index"))
+    except ServiceError as e:
+        flash(e.message)
         return redirect(url_for("web.users"))
 
-    # Обновляем роль.
-    user.role = new_role
-    db.session.commit()
-
     # Если PUT — это API, возвращаем JSON.
     if request.method == "PUT":
         return jsonify({"message": "role updated"}), 200
@@ -332,19 +498,39 @@ def update_user_role(user_id):
 @login_required
 def delete_user(user_id):
 
-    if current_user.role != "admin":
+    # Удаляем пользователя и все его заявки массовыми DELETE
+    # в одной транзакции, не загружая заявки по одной;
+    # его токены и сессии больше не принимаются.
+    try:
+        username = services.delete_user(current_user, user_id)
+    except Forbidden:
         flash("Нет доступа")
         return redirect(url_for("web.users"))
 
-    user = User.query.get_or_404(user_id)
-
-    db.session.delete(user)
-    db.session.commit()
-
     if request.method == "DELETE":
         return jsonify({"message": "user deleted"}), 200
 
-    flash(f"Пользователь {user.username} был удален")
+    flash(f"Пользователь {username} был удален")
+    return redirect(url_for("web.users"))
+
+
+# =============================================================
+#               ЗАВЕРШЕНИЕ СЕССИЙ ПОЛЬЗОВАТЕЛЯ (АДМИН)
+# =============================================================
+
+@web_bp.route("/users/<int:user_id>/sessions/revoke", methods=["POST"])
+@login_required
+def revoke_sessions(user_id):
+
+    # Пользователь будет разлогинен на всех устройствах
+    # (например, если пароль утёк или сотрудник уволился).
+    try:
+        revoked = services.revoke_sessions(current_user, user_id)
+    except Forbidden:
+        flash("Нет доступа")
+        return redirect(url_for("web.users"))
+
+    flash(f"Завершено сессий: {revoked}")
     return redirect(url_for("web.users"))
 
 
@@ -356,16 +542,6 @@ def delete_user(user_id):
 @login_required
 def edit_ticket(ticket_id):
 
-    # Ищем заявку.
-    t = Ticket.query.get_or_404(ticket_id)
-
-    # Проверяем, что либо:
-    #  - автор,
-    #  - либо администратор.
-    if current_user.role != "admin" and t.author_id != current_user.id:
-        flash("Нет прав для изменения заявки")
-        return redirect(url_for("web.ticket_detail", ticket_id=t.id))
-
     # Если форма была отправлена:
     if request.method == "POST":
 
@@ -373,15 +549,39 @@ def edit_ticket(ticket_id):
         title = request.form["title"].strip()
         description = request.form["description"].strip()
 
-        # Обновляем поля.
-        t.title = title or t.title
-        t.description = description or t.description
-
-        # Сохраняем.
-        db.session.commit()
+        # Меняем только заполненные поля (пустое поле — оставить как было).
+        values = {}
+        if title:
+            values["title"] = title
+        if description:
+            values["description"] = description
+
+        # Одно условное UPDATE: права (автор или админ) и версия из формы
+        # проверяются прямо в WHERE. Если пока пользователь редактировал,
+        # заявку изменил кто-то ещё, показываем форму заново с актуальными
+        # данными и кодом 409. Пустая форма ничего не меняет, но права
+        # проверяются и для неё — чужой заявки "обновить" нельзя.
+        try:
+            services.update_ticket(current_user, ticket_id, values, request.form)
+        except Forbidden:
+            flash("Нет прав для изменения заявки")
+            return redirect(url_for("web.ticket_detail", ticket_id=ticket_id))
+        except VersionConflict as e:
+            flash("Заявку уже изменил другой пользователь — ниже актуальная версия")
+            t = services.get_ticket(current_user, ticket_id)
+            return render_template("edit_ticket.html", ticket=t), e.status
 
         flash("Заявка обновлена")
-        return redirect(url_for("web.ticket_detail", ticket_id=t.id))
+        return redirect(url_for("web.ticket_detail", ticket_id=ticket_id))
+
+    # Ищем заявку и проверяем, что либо:
+    #  - автор,
+    #  - либо администратор.
+    try:
+        t = services.get_ticket(current_user, ticket_id)
+    except Forbidden:
+        flash("Нет прав для изменения заявки")
+        return redirect(url_for("web.ticket_detail", ticket_id=ticket_id))
 
     # Если GET — показываем форму редактирования.
     return render_template("edit_ticket.html", ticket=t)
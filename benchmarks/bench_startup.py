@@ -0,0 +1,92 @@
+# Замер времени запуска приложения.
+#
+# Запуск из корня проекта:
+#     python benchmarks/bench_startup.py [--repeat 5] [--top 15]
+#
+# Что измеряется (каждый раз в новом процессе Python):
+#  1) отчёт `python -X importtime`: общее время импорта и самые
+#     "дорогие" модули (собственное время + время вложенных импортов);
+#  2) время от старта процесса до ответа на первый запрос
+#     (create_app + первый GET /web_login через тестовый клиент);
+#  3) время запуска короткой команды `flask --app run routes` —
+#     такие команды не должны трогать базу данных.
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_REQUEST = (
+    "from app import create_app\n"
+    "app = create_app()\n"
+    "assert app.test_client().get('/web_login').status_code == 200\n"
+)
+
+
+def run(args, env) -> float:
+    # Время выполнения команды в новом процессе, в миллисекундах.
+    start = time.perf_counter()
+    subprocess.run(args, cwd=ROOT, env=env, check=True, capture_output=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def best_of(args, env, repeat: int) -> float:
+    return min(run(args, env) for _ in range(repeat))
+
+
+def import_report(env, top: int):
+    # Строки отчёта -X importtime (пишется в stderr) выглядят так:
+    #   import time: self [us] | cumulative | imported package
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "from app import create_app; create_app()"],
+        cwd=ROOT,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # После "|" идёт один пробел; вложенные импорты отступают дальше.
+        rows.append((int(cumulative_us), int(self_us), name[1:]))
+
+    # Модули верхнего уровня (без отступа) — сумма их cumulative даёт общее время.
+    total = sum(c for c, _, name in rows if not name.startswith(" "))
+    print(f"импорт всего (-X importtime):            {total / 1000:8.2f} мс")
+    print("самые дорогие модули (cumulative, self), мс:")
+    for cumulative, self_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"  {cumulative / 1000:8.2f} {self_us / 1000:8.2f}  {name.strip()}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        # Все файлы приложения (база, кэш шаблонов, сессии, шина, лимиты,
+        # вложения) — во временном каталоге, рабочее дерево не трогаем.
+        env["DATABASE_URL"] = "sqlite:///" + os.path.join(tmp, "bench.db")
+        env["TEMPLATE_CACHE_DIR"] = os.path.join(tmp, "jinja_cache")
+        env["SESSION_STORE"] = os.path.join(tmp, "sessions.db")
+        env["INVALIDATION_BUS"] = os.path.join(tmp, "bus.db")
+        env["RATELIMIT_STORAGE"] = os.path.join(tmp, "ratelimit.db")
+        env["ATTACHMENTS_DIR"] = os.path.join(tmp, "attachments")
+
+        import_report(env, args.top)
+        print(f"пустой процесс python:                   {best_of([sys.executable, '-c', 'pass'], env, args.repeat):8.2f} мс")
+        print(f"до ответа на первый запрос:              {best_of([sys.executable, '-c', FIRST_REQUEST], env, args.repeat):8.2f} мс")
+        print(f"flask --app run routes:                  {best_of([sys.executable, '-m', 'flask', '--app', 'run', 'routes'], env, args.repeat):8.2f} мс")
+
+
+if __name__ == "__main__":
+    main()
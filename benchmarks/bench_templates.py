@@ -0,0 +1,120 @@
+# Замер времени рендеринга шаблонов веб-интерфейса.
+#
+# Запуск из корня проекта:
+#     python benchmarks/bench_templates.py [--tickets 2000] [--repeat 5]
+#
+# Что измеряется:
+#  1) компиляция всех шаблонов "холодным" процессом — без байткод-кэша
+#     и с уже заполненным FileSystemBytecodeCache;
+#  2) страница /tickets администратора с большим списком:
+#     - первый показ (кэш фрагментов пустой),
+#     - повторный показ (все строки из кэша),
+#     - показ после изменения одной заявки.
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def measure(func, repeat: int) -> float:
+    # Лучшее время из repeat запусков, в миллисекундах.
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def bench_compile(app, cache_dir: str, repeat: int):
+    from jinja2 import Environment, FileSystemBytecodeCache
+
+    names = [n for n in app.jinja_env.list_templates() if n.endswith(".html")]
+
+    def compile_all(bytecode_cache):
+        # Каждый раз новое окружение — как в только что запущенном процессе.
+        env = Environment(loader=app.jinja_env.loader, bytecode_cache=bytecode_cache)
+        for name in names:
+            env.get_template(name)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    cache = FileSystemBytecodeCache(cache_dir)
+    compile_all(cache)  # заполняем кэш на диске
+    print(f"компиляция {len(names)} шаблонов без кэша:     {measure(lambda: compile_all(None), repeat):8.2f} мс")
+    print(f"компиляция {len(names)} шаблонов из байткода:  {measure(lambda: compile_all(cache), repeat):8.2f} мс")
+
+
+def bench_list(app, tickets: int, repeat: int):
+    from app.extensions import db
+    from app.models import Ticket, User
+
+    with app.app_context():
+        db.create_all()
+        admin = User(username="admin", role="admin", password_hash="-")
+        db.session.add(admin)
+        db.session.commit()
+        now = datetime.utcnow()
+        db.session.execute(
+            Ticket.__table__.insert(),
+            [
+                {
+                    "title": f"Заявка {i}",
+                    "description": "",
+                    "status": "open",
+                    "created_at": now,
+                    "updated_at": now - timedelta(seconds=i),
+                    "author_id": admin.id,
+                }
+                for i in range(tickets)
+            ],
+        )
+        db.session.commit()
+
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s["_user_id"] = "1"
+
+    cache = app.extensions["fragment_cache"]
+
+    def cold():
+        cache.clear()
+        client.get("/tickets")
+
+    def touch_one():
+        with app.app_context():
+            t = db.session.get(Ticket, 1)
+            t.status = "in-progress" if t.status == "open" else "open"
+            db.session.commit()
+        client.get("/tickets")
+
+    client.get("/tickets")
+    print(f"/tickets, {tickets} строк, кэш пуст:         {measure(cold, repeat):8.2f} мс")
+    client.get("/tickets")
+    print(f"/tickets, {tickets} строк, все из кэша:      {measure(lambda: client.get('/tickets'), repeat):8.2f} мс")
+    print(f"/tickets, {tickets} строк, изменена одна:    {measure(touch_one, repeat):8.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickets", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = "sqlite://"
+        os.environ["TEMPLATE_CACHE_DIR"] = os.path.join(tmp, "jinja_cache")
+
+        from app import create_app
+
+        app = create_app()
+        bench_compile(app, os.path.join(tmp, "bench_cache"), args.repeat)
+        bench_list(app, args.tickets, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,42 @@
-# Импортируем функцию create_app, которая создаёт Flask-приложение,
-# и объект db (база данных) для работы с таблицами.
-from app import create_app, db
+# Импортируем функцию create_app, которая создаёт Flask-приложение.
+from app import create_app
 
-# Импортируем модель пользователя, чтобы при старте приложения
-# автоматически создать учётную запись администратора.
-from app.models import User
+# Функция, которая создаёт таблицы и администратора.
+from app.commands import init_db
 
 
 # Создаём экземпляр приложения, вызвав заранее определённую функцию create_app().
+# При импорте этого файла база данных НЕ трогается: так быстрее стартуют
+# короткие команды (`flask --app run ...`) и новые процессы-воркеры.
+# Таблицы и администратор создаются командой `flask --app run init-db`
+# или при запуске `python run.py`.
 app = create_app()
 
 
-# Открываем контекст приложения.
-# Это нужно, чтобы можно было работать с базой данных (db.create_all и запросы к моделям).
-with app.app_context():
-    # Создаём все таблицы в базе данных, если их ещё нет.
-    db.create_all()
-
-    # ---- Создаем администратора, если его нет ----
-    # Пытаемся найти пользователя с логином "admin" в таблице user.
-    admin = User.query.filter_by(username="admin").first()
-
-    # Если такого пользователя ещё нет...
-    if not admin:
-        # ...создаём нового пользователя с логином "admin" и ролью "admin".
-        admin = User(username="admin", role="admin")
+# Этот блок выполняется, только если файл запущен напрямую:
+# python run.py                — сервер разработки (debug=True)
+# python run.py --workers 4    — режим preload-then-fork: приложение и
+#                                шаблоны готовятся один раз, затем
+#                                запускается 4 процесса-воркера
+if __name__ == "__main__":
+    import argparse
 
-        # Устанавливаем пароль "adminpass" (он будет сохранён в виде хеша).
-        admin.set_password("adminpass")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=0, help="Сколько процессов-воркеров (0 — сервер разработки).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
 
-        # Добавляем администратора в сессию базы данных.
-        db.session.add(admin)
+    # Открываем контекст приложения и создаём таблицы/администратора.
+    with app.app_context():
+        init_db()
 
-        # Сохраняем изменения в базе (записываем администратора в таблицу).
-        db.session.commit()
+    if args.workers:
+        from app.prefork import serve
 
-        # Выводим сообщение в консоль на русском:
-        # информируем, что администратор создан и какие логин/пароль.
-        print("Создан администратор: логин admin / пароль adminpass")
+        serve(app, host=args.host, port=args.port, workers=args.workers)
     else:
-        # Если администратор уже был в базе, выводим в консоль другое сообщение.
-        print("Администратор уже существует")
-
-
-# Этот блок выполняется, только если файл запущен напрямую:
-# python run.py
-if __name__ == "__main__":
-    # Запускаем веб-сервер Flask в режиме отладки (debug=True).
-    # В режиме отладки приложение автоматически перезапускается при изменении кода
-    # и показывает подробные сообщения об ошибках.
-    app.run(debug=True)
+        # Запускаем веб-сервер Flask в режиме отладки (debug=True).
+        # В режиме отладки приложение автоматически перезапускается при изменении кода
+        # и показывает подробные сообщения об ошибках.
+        app.run(debug=True, host=args.host, port=args.port)
@@ -0,0 +1,72 @@
+# Общие фикстуры для всех тестов проекта.
+# (tests/test_api.py объявляет такие же фикстуры у себя — pytest
+#  в этом случае использует локальные, это нормально.)
+import pytest
+
+from app import create_app
+from app.extensions import db
+from app.models import User
+
+
+@pytest.fixture
+def app(monkeypatch, tmp_path):
+    # Приложение в тестовом режиме: JSON-API и база в памяти,
+    # файлы вложений — во временном каталоге.
+    monkeypatch.setenv("ATTACHMENTS_DIR", str(tmp_path / "attachments"))
+    app = create_app(testing=True)
+
+    with app.app_context():
+        db.create_all()
+
+        # Администратор, как в основном файле тестов.
+        admin = User(username="admin", role="admin")
+        admin.set_password("adminpass")
+        db.session.add(admin)
+        db.session.commit()
+
+    yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def login():
+    # Помощник: регистрирует (если нужно) и логинит пользователя.
+    # Использование: login(client, "bob") или login(client, "admin", "adminpass").
+    def _login(client, username, password="pw"):
+        if username != "admin":
+            client.post("/register", json={"username": username, "password": password})
+        r = client.post("/login", json={"username": username, "password": password})
+        assert r.status_code == 200
+        return r
+
+    return _login
+
+
+@pytest.fixture
+def web_app(monkeypatch, tmp_path):
+    # Приложение в обычном режиме (веб-интерфейс), но с базой в памяти
+    # и кэшем шаблонов во временном каталоге.
+    monkeypatch.setenv("DATABASE_URL", "sqlite://")
+    monkeypatch.setenv("TEMPLATE_CACHE_DIR", str(tmp_path / "jinja_cache"))
+    monkeypatch.setenv("ATTACHMENTS_DIR", str(tmp_path / "attachments"))
+    monkeypatch.setenv("SESSION_STORE", str(tmp_path / "sessions.db"))
+    monkeypatch.setenv("INVALIDATION_BUS", str(tmp_path / "bus.db"))
+    app = create_app()
+
+    with app.app_context():
+        db.create_all()
+        admin = User(username="admin", role="admin")
+        admin.set_password("adminpass")
+        db.session.add(admin)
+        db.session.commit()
+
+    yield app
+
+
+@pytest.fixture
+def web_client(web_app):
+    return web_app.test_client()
@@ -0,0 +1,151 @@
+# Тесты вложений: хранение по содержимому, Range, кэш-заголовки, права.
+import io
+import os
+
+from app import attachments
+from app.extensions import db
+from app.models import Attachment, Ticket
+
+
+def _blobs(app):
+    with app.app_context():
+        return list(attachments.storage().iter_blobs())
+
+
+def test_upload_is_deduplicated_by_content(app, client, login):
+    login(client, "bob")
+    t1 = client.post("/tickets", json={"title": "one"}).get_json()["id"]
+    t2 = client.post("/tickets", json={"title": "two"}).get_json()["id"]
+
+    data = b"Traceback...\n" * 1000
+    for tid in (t1, t2):
+        r = client.post(
+            f"/tickets/{tid}/attachments?filename=../../app.log",
+            data=data,
+            content_type="text/plain",
+        )
+        assert r.status_code == 201
+        assert r.get_json()["filename"] == "app.log"
+
+    # Две строки-ссылки, один файл на диске.
+    assert len(_blobs(app)) == 1
+    with app.app_context():
+        assert Attachment.query.count() == 2
+    assert client.get(f"/tickets/{t1}").get_json()["attachment_count"] == 1
+
+
+def test_download_supports_range_and_conditional_requests(client, login):
+    login(client, "bob")
+    tid = client.post("/tickets", json={"title": "t"}).get_json()["id"]
+    aid = client.post(
+        f"/tickets/{tid}/attachments",
+        data={"file": (io.BytesIO(b"0123456789"), "digits.txt", "text/plain")},
+        content_type="multipart/form-data",
+    ).get_json()["id"]
+
+    url = f"/tickets/{tid}/attachments/{aid}"
+    r = client.get(url)
+    assert r.data == b"0123456789"
+    assert "private" in r.headers["Cache-Control"] and "public" not in r.headers["Cache-Control"]
+    assert "attachment" in r.headers["Content-Disposition"]
+
+    r = client.get(url, headers={"Range": "bytes=2-5"})
+    assert r.status_code == 206 and r.data == b"2345"
+
+    r = client.get(url, headers={"If-None-Match": r.headers["ETag"]})
+    assert r.status_code == 304
+
+
+def test_attachments_follow_ticket_permissions(app, login):
+    owner, other = app.test_client(), app.test_client()
+    login(owner, "owner")
+    login(other, "other")
+    tid = owner.post("/tickets", json={"title": "t"}).get_json()["id"]
+    aid = owner.post(f"/tickets/{tid}/attachments?filename=a.txt", data=b"secret").get_json()["id"]
+
+    assert other.get(f"/tickets/{tid}/attachments/{aid}").status_code == 403
+    assert other.post(f"/tickets/{tid}/attachments?filename=b.txt", data=b"x").status_code == 403
+    assert owner.get(f"/tickets/{tid}/attachments/{aid + 1}").status_code == 404
+
+
+def test_too_large_upload_leaves_nothing_behind(app, client, login):
+    app.config["ATTACHMENT_MAX_SIZE"] = 1000
+    login(client, "bob")
+    tid = client.post("/tickets", json={"title": "t"}).get_json()["id"]
+
+    r = client.post(f"/tickets/{tid}/attachments?filename=big.bin", data=b"x" * 5000)
+    assert r.status_code == 413
+    assert _blobs(app) == []
+    assert os.listdir(os.path.join(app.config["ATTACHMENTS_DIR"], "tmp")) == []
+
+
+def test_gc_removes_only_unreferenced_files(app, client, login):
+    login(client, "bob")
+    tid = client.post("/tickets", json={"title": "t"}).get_json()["id"]
+    keep = client.post(f"/tickets/{tid}/attachments?filename=keep.txt", data=b"keep").get_json()["id"]
+    drop = client.post(f"/tickets/{tid}/attachments?filename=drop.txt", data=b"drop").get_json()["id"]
+    assert keep != drop
+
+    assert client.delete(f"/tickets/{tid}/attachments/{drop}").status_code == 200
+    assert client.get(f"/tickets/{tid}").get_json()["attachment_count"] == 1
+    with app.app_context():
+        # Свежие файлы защищены "льготным" временем.
+        assert attachments.gc(grace_seconds=3600) == 0
+        assert attachments.gc(grace_seconds=-1) == 1
+    assert client.get(f"/tickets/{tid}/attachments/{keep}").data == b"keep"
+
+
+def test_web_upload_and_download(web_client):
+    web_client.post("/web_login", data={"username": "admin", "password": "adminpass"})
+    web_client.post("/tickets", data={"title": "with file"})
+    r = web_client.post(
+        "/tickets/1/attachments",
+        data={"file": (io.BytesIO(b"\x89PNG\r\n\x1a\n..."), "shot.png", "image/png")},
+        content_type="multipart/form-data",
+    )
+    assert r.status_code == 302
+
+    page = web_client.get("/tickets/1").get_data(as_text=True)
+    assert "shot.png" in page and "Файлы (1)" in page
+    r = web_client.get("/tickets/1/attachments/1")
+    assert r.data == b"\x89PNG\r\n\x1a\n..." and r.mimetype == "image/png"
+    assert "inline" in r.headers["Content-Disposition"]
+
+
+def test_only_sniffed_raster_images_are_inline(client, login):
+    login(client, "bob")
+    tid = client.post("/tickets", json={"title": "t"}).get_json()["id"]
+    svg = b'<svg xmlns="http://www.w3.org/2000/svg"><script>alert(1)</script></svg>'
+    for data, name, ctype in (
+        (svg, "x.svg", "image/svg+xml"),
+        (b"<html><script>alert(1)</script>", "fake.png", "image/png"),
+    ):
+        aid = client.post(
+            f"/tickets/{tid}/attachments",
+            data={"file": (io.BytesIO(data), name, ctype)},
+            content_type="multipart/form-data",
+        ).get_json()["id"]
+        r = client.get(f"/tickets/{tid}/attachments/{aid}")
+        assert r.headers["Content-Disposition"].startswith("attachment")
+        assert r.headers["X-Content-Type-Options"] == "nosniff"
+        assert r.headers["Content-Security-Policy"] == "sandbox"
+
+
+def test_upload_to_ticket_deleted_meanwhile_is_404(app, client, login, monkeypatch):
+    login(client, "bob")
+    tid = client.post("/tickets", json={"title": "t"}).get_json()["id"]
+
+    # Заявку удаляют, пока файл ещё загружается.
+    original = attachments.Storage.save_stream
+
+    def save_then_delete(self, stream, max_size):
+        result = original(self, stream, max_size)
+        db.session.execute(Ticket.__table__.delete().where(Ticket.id == tid))
+        db.session.commit()
+        return result
+
+    monkeypatch.setattr(attachments.Storage, "save_stream", save_then_delete)
+    r = client.post(f"/tickets/{tid}/attachments?filename=a.txt", data=b"x", content_type="text/plain")
+    assert r.status_code == 404
+    with app.app_context():
+        assert Attachment.query.count() == 0
@@ -0,0 +1,85 @@
+# Тесты шины сброса кэшей: запись в одном "процессе" (приложении) сбрасывает
+# кэши другого, пропущенный журнал очищает кэш целиком, задержка в метриках.
+import pytest
+
+from app import create_app, metrics
+from app.bus import Bus
+from app.extensions import db
+from app.models import User
+
+
+@pytest.fixture
+def workers(monkeypatch, tmp_path):
+    # Два приложения с общими файлами базы, сессий и шины — как два
+    # процесса-воркера на одной машине. Кэш сессий надолго, журнал
+    # читается перед каждым запросом.
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'app.db'}")
+    monkeypatch.setenv("SESSION_STORE", str(tmp_path / "sessions.db"))
+    monkeypatch.setenv("INVALIDATION_BUS", str(tmp_path / "bus.db"))
+    monkeypatch.setenv("TEMPLATE_CACHE_DIR", str(tmp_path / "jinja_cache"))
+    monkeypatch.setenv("ATTACHMENTS_DIR", str(tmp_path / "attachments"))
+    monkeypatch.setenv("INVALIDATION_POLL_INTERVAL", "0")
+    monkeypatch.setenv("SESSION_CACHE_TTL", "60")
+    apps = [create_app(mode="api") for _ in range(2)]
+    with apps[0].app_context():
+        db.create_all()
+        admin = User(username="admin", role="admin")
+        admin.set_password("adminpass")
+        db.session.add(admin)
+        db.session.commit()
+    return apps
+
+
+def test_revoked_session_and_token_stop_working_in_other_worker(workers):
+    a, b = workers
+    admin, bob = a.test_client(), b.test_client()
+    admin.post("/login", json={"username": "admin", "password": "adminpass"})
+    bob.post("/register", json={"username": "bob", "password": "pw"})
+    bob.post("/login", json={"username": "bob", "password": "pw"})
+    token = bob.post("/token", json={"username": "bob", "password": "pw"}).get_json()["access_token"]
+    bearer = b.test_client()
+    auth = {"Authorization": f"Bearer {token}"}
+    assert bob.get("/tickets").status_code == 200  # сессия теперь в кэше b
+    assert bearer.get("/tickets", headers=auth).status_code == 200
+
+    metrics.reset()
+    admin.delete("/admin/users/2/sessions")
+    admin.put("/users/2", json={"role": "user"})  # смена роли отзывает токены
+
+    assert bob.get("/tickets").status_code == 401
+    assert bearer.get("/tickets", headers=auth).status_code == 401
+    snap = metrics.snapshot()
+    assert snap["bus.applied"] == 2 and snap["bus.lag.count"] == 2
+    assert 0 <= snap["bus.lag.max"] < 5
+
+
+def test_new_process_replays_retained_revocations(workers, tmp_path):
+    a, _ = workers
+    with a.app_context():
+        a.extensions["bus"].publish("token", ["7:1000.5"])
+
+    # "Перезапущенный" воркер узнаёт об отзыве из журнала.
+    fresh = Bus(str(tmp_path / "bus.db"), poll_interval=0)
+    seen = []
+    fresh.subscribe("token", seen.extend)
+    assert fresh.poll() == 1 and seen == ["7:1000.5"]
+    assert fresh.poll() == 0
+
+
+def test_missed_rows_reset_cache(tmp_path):
+    path = str(tmp_path / "bus.db")
+    writer, reader = Bus(path), Bus(path, poll_interval=0)
+    cache = {"k1", "k2", "k3"}
+    reader.subscribe("session", lambda keys: cache.difference_update(keys), cache.clear)
+
+    writer.publish("session", ["k1"])
+    assert reader.poll() == 1 and cache == {"k2", "k3"}
+
+    # Строки удалены раньше, чем reader их прочитал, — дыра в номерах.
+    writer.publish("session", ["k2"])
+    writer.publish("session", ["k3"])
+    writer._connect().execute("DELETE FROM change WHERE key = 'k2'")
+    cache.add("k4")
+    metrics.reset()
+    reader.poll()
+    assert cache == set() and metrics.snapshot()["bus.resets"] == 1
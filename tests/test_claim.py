@@ -0,0 +1,94 @@
+# Тесты очередей работы: "взять следующую заявку" и возврат в очередь.
+import threading
+
+import pytest
+import sqlalchemy as sa
+
+from app import create_app, fastpath
+from app.extensions import db
+from app.models import Ticket, User
+
+
+@pytest.fixture
+def file_app(monkeypatch, tmp_path):
+    # Файл базы, а не память: сотрудники обращаются к ней из разных потоков.
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'claim.db'}")
+    monkeypatch.setenv("SESSION_STORE", str(tmp_path / "sessions.db"))
+    monkeypatch.setenv("INVALIDATION_BUS", str(tmp_path / "bus.db"))
+    monkeypatch.setenv("TEMPLATE_CACHE_DIR", str(tmp_path / "jinja_cache"))
+    monkeypatch.setenv("ATTACHMENTS_DIR", str(tmp_path / "attachments"))
+    app = create_app(mode="api")
+    with app.app_context():
+        db.create_all()
+        author = User(username="author")
+        author.set_password("pw")
+        db.session.add(author)
+        for i in range(8):
+            agent = User(username=f"agent{i}", role="admin")
+            agent.set_password("pw")
+            db.session.add(agent)
+        db.session.commit()
+        for i in range(20):
+            db.session.add(Ticket(title=f"t{i}", author_id=author.id))
+        db.session.commit()
+    return app
+
+
+def _client(app, username):
+    client = app.test_client()
+    assert client.post("/login", json={"username": username, "password": "pw"}).status_code == 200
+    return client
+
+
+def test_concurrent_claims_get_distinct_tickets(file_app):
+    clients = [_client(file_app, f"agent{i}") for i in range(8)]
+    claimed = []
+    lock = threading.Lock()
+
+    def work(client):
+        while True:
+            r = client.post("/tickets/claim")
+            if r.status_code == 204:
+                return
+            assert r.status_code == 200
+            with lock:
+                claimed.append(r.get_json())
+
+    threads = [threading.Thread(target=work, args=(c,)) for c in clients]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+
+    ids = [t["id"] for t in claimed]
+    assert sorted(ids) == list(range(1, 21))
+    assert all(t["status"] == "in-progress" and t["assignee_id"] for t in claimed)
+
+
+def test_claim_takes_oldest_and_release_returns_it(file_app):
+    agent = _client(file_app, "agent0")
+    first = agent.post("/tickets/claim").get_json()
+    assert first["id"] == 1
+
+    mine = agent.get("/tickets/queue?status=in-progress&mine=1").get_json()
+    assert [t["id"] for t in mine] == [1]
+
+    # Вернуть может исполнитель или администратор, но не автор заявки.
+    author = _client(file_app, "author")
+    assert author.post("/tickets/1/release").status_code == 403
+    assert author.post("/tickets/claim").status_code == 403
+
+    r = agent.post("/tickets/1/release")
+    assert r.status_code == 200
+    queue = agent.get("/tickets/queue").get_json()
+    assert queue[0]["id"] == 1 and queue[0]["assignee_id"] is None
+    assert agent.post("/tickets/claim").get_json()["id"] == 1
+
+
+def test_claim_uses_partial_index(file_app):
+    with file_app.app_context():
+        stmt = fastpath.claim_statement(Ticket.__table__, 1, None)
+        sql = str(stmt.compile(db.engine, compile_kwargs={"literal_binds": True}))
+        plan = db.session.execute(sa.text("EXPLAIN QUERY PLAN " + sql.split(" RETURNING")[0])).all()
+    details = " ".join(row[-1] for row in plan)
+    assert "ix_ticket_unassigned_open" in details
@@ -0,0 +1,78 @@
+# Тесты комментариев: счётчик в заявке, страницы по курсору, права.
+from datetime import datetime, timedelta
+
+from app.extensions import db
+from app.models import Comment
+
+
+def test_comments_are_paginated_by_cursor(app, client, login):
+    login(client, "bob")
+    tid = client.post("/tickets", json={"title": "long thread"}).get_json()["id"]
+
+    # Много комментариев с одинаковым временем — порядок всё равно
+    # однозначный благодаря id во втором ключе курсора.
+    now = datetime.utcnow()
+    with app.app_context():
+        db.session.execute(
+            Comment.__table__.insert(),
+            [
+                {"ticket_id": tid, "author_id": 2, "body": f"c{i}", "created_at": now + timedelta(seconds=i // 3)}
+                for i in range(120)
+            ],
+        )
+        db.session.commit()
+
+    bodies, cursor = [], None
+    while True:
+        url = f"/tickets/{tid}/comments?limit=50" + (f"&after={cursor}" if cursor else "")
+        page = client.get(url).get_json()
+        bodies += [c["body"] for c in page["items"]]
+        cursor = page["next"]
+        if cursor is None:
+            break
+    assert bodies == [f"c{i}" for i in range(120)]
+
+    assert client.get(f"/tickets/{tid}/comments?after=garbage").status_code == 400
+
+
+def test_comment_count_is_kept_on_ticket(client, login):
+    login(client, "bob")
+    tid = client.post("/tickets", json={"title": "t"}).get_json()["id"]
+
+    for text in ("first", "second"):
+        assert client.post(f"/tickets/{tid}/comments", json={"body": text}).status_code == 201
+    assert client.post(f"/tickets/{tid}/comments", json={"body": " "}).status_code == 400
+
+    assert client.get(f"/tickets/{tid}").get_json()["comment_count"] == 2
+    assert client.get("/tickets").get_json()[0]["comment_count"] == 2
+
+
+def test_only_ticket_participants_can_comment(app, login):
+    owner, other, admin = app.test_client(), app.test_client(), app.test_client()
+    login(owner, "owner")
+    login(other, "other")
+    login(admin, "admin", "adminpass")
+    tid = owner.post("/tickets", json={"title": "t"}).get_json()["id"]
+
+    assert other.post(f"/tickets/{tid}/comments", json={"body": "hi"}).status_code == 403
+    assert other.get(f"/tickets/{tid}/comments").status_code == 403
+    r = admin.post(f"/tickets/{tid}/comments", json={"body": "answer"})
+    assert r.status_code == 201 and r.get_json()["author"] == "admin"
+
+    # Заявку удалили — переписка удаляется вместе с ней.
+    owner.delete(f"/tickets/{tid}")
+    with app.app_context():
+        assert Comment.query.count() == 0
+
+
+def test_web_thread_and_list_counter(web_client):
+    web_client.post("/web_login", data={"username": "admin", "password": "adminpass"})
+    web_client.post("/tickets", data={"title": "web"})
+    web_client.get("/tickets")
+
+    web_client.post("/tickets/1/comments", data={"body": "hello from web"})
+    page = web_client.get("/tickets/1").get_data(as_text=True)
+    assert "hello from web" in page and "Комментарии (1)" in page
+
+    # Строка списка перерисована, хотя updated_at заявки не менялся.
+    assert "<td>1</td>" in web_client.get("/tickets").get_data(as_text=True).split("web</a>")[1]
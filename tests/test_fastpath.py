@@ -0,0 +1,69 @@
+# Тесты изменений и удалений одним запросом.
+import re
+
+from sqlalchemy import event
+
+from app.extensions import db
+from app.models import Ticket, User
+
+
+def _ticket_statements(app, func):
+    # Выполняем func и собираем SQL-запросы, которые касались таблицы ticket
+    # (итоговые таблицы отчётов ticket_daily_stats и т.п. не в счёт).
+    statements = []
+    with app.app_context():
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            result = func()
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+    return result, [s for s in statements if re.search(r"\bticket\b", s)]
+
+
+def test_update_and_delete_are_single_statements(app, client, login):
+    login(client, "bob")
+    tid = client.post("/tickets", json={"title": "T"}).get_json()["id"]
+
+    r, statements = _ticket_statements(app, lambda: client.put(f"/tickets/{tid}", json={"status": "closed"}))
+    assert r.status_code == 200
+    assert len(statements) == 1 and statements[0].startswith("UPDATE ticket")
+
+    r, statements = _ticket_statements(app, lambda: client.delete(f"/tickets/{tid}"))
+    assert r.status_code == 200
+    assert len(statements) == 1 and statements[0].startswith("DELETE FROM ticket")
+
+
+def test_404_and_403_are_told_apart(client, login):
+    login(client, "alice")
+    tid = client.post("/tickets", json={"title": "A"}).get_json()["id"]
+    client.post("/logout")
+
+    login(client, "mallory")
+    assert client.put(f"/tickets/{tid}", json={"title": "x"}).status_code == 403
+    assert client.delete(f"/tickets/{tid}").status_code == 403
+    assert client.put("/tickets/999", json={"title": "x"}).status_code == 404
+    assert client.delete("/tickets/999").status_code == 404
+    client.post("/logout")
+
+    # Администратор может удалить чужую заявку.
+    login(client, "admin", "adminpass")
+    assert client.delete(f"/tickets/{tid}").status_code == 200
+
+
+def test_web_delete_user_removes_their_tickets(web_app, web_client):
+    with web_app.app_context():
+        bob = User(username="bob", password_hash="-")
+        db.session.add(bob)
+        db.session.commit()
+        db.session.add_all([Ticket(title=f"t{i}", author_id=bob.id) for i in range(3)])
+        db.session.commit()
+        bob_id = bob.id
+
+    web_client.post("/web_login", data={"username": "admin", "password": "adminpass"})
+    r = web_client.post(f"/users/{bob_id}/delete")
+    assert r.status_code == 302
+
+    with web_app.app_context():
+        assert db.session.get(User, bob_id) is None
+        assert Ticket.query.filter_by(author_id=bob_id).count() == 0
@@ -0,0 +1,38 @@
+# Тесты кэша шаблонов и HTML-фрагментов веб-интерфейса.
+import os
+
+from app import metrics
+
+
+def _login_admin(client):
+    r = client.post("/web_login", data={"username": "admin", "password": "adminpass"})
+    assert r.status_code == 302
+
+
+def test_ticket_rows_are_cached_until_ticket_changes(web_client):
+    _login_admin(web_client)
+    for title in ("one", "two", "three"):
+        web_client.post("/tickets", data={"title": title})
+
+    metrics.reset()
+    page = web_client.get("/tickets").get_data(as_text=True)
+    assert "one" in page and "three" in page
+    assert metrics.snapshot()["fragments.miss"] == 3
+
+    # Повторный показ — все строки из кэша.
+    metrics.reset()
+    web_client.get("/tickets")
+    assert metrics.snapshot() == {"fragments.hit": 3}
+
+    # Изменили одну заявку — перерисована только её строка.
+    web_client.post("/tickets/1/update", data={"status": "closed"})
+    metrics.reset()
+    page = web_client.get("/tickets").get_data(as_text=True)
+    assert "closed" in page
+    assert metrics.snapshot() == {"fragments.hit": 2, "fragments.miss": 1}
+
+
+def test_bytecode_cache_is_written(web_app, web_client):
+    web_client.get("/")
+    cache_dir = web_app.config["TEMPLATE_CACHE_DIR"]
+    assert any(name.startswith("__jinja2_") for name in os.listdir(cache_dir))
@@ -0,0 +1,107 @@
+# Тесты Idempotency-Key: повтор возвращает сохранённый ответ без второй
+# заявки, ключ привязан к пользователю и запросу, истёкшие ключи чистятся.
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, update
+
+from app import idempotency, jobs
+from app.extensions import db
+from app.models import IdempotencyKey, Ticket
+
+
+def _create(client, key, title="t"):
+    return client.post("/tickets", json={"title": title}, headers={"Idempotency-Key": key})
+
+
+def test_retry_returns_original_ticket(app, client, login):
+    login(client, "bob")
+    first = _create(client, "k1")
+    assert first.status_code == 201
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", record)
+    again = _create(client, "k1")
+    event.remove(engine, "before_cursor_execute", record)
+
+    assert again.status_code == 201 and again.get_json() == first.get_json()
+    assert again.headers["Idempotent-Replayed"] == "true"
+    # Ответ из кэша процесса: ни вставки, ни чтения idempotency_key.
+    assert not any("INSERT" in s or "idempotency_key" in s for s in statements)
+
+    # Без кэша — из таблицы; заявка по-прежнему одна.
+    app.extensions["idempotency_cache"].entries.clear()
+    assert _create(client, "k1").get_json() == first.get_json()
+    with app.app_context():
+        assert Ticket.query.count() == 1
+
+    assert _create(client, "k2").get_json()["id"] != first.get_json()["id"]
+
+
+def test_key_is_bound_to_user_and_request(app, login):
+    bob, alice = app.test_client(), app.test_client()
+    login(bob, "bob")
+    login(alice, "alice")
+
+    bob_id = _create(bob, "same").get_json()["id"]
+    # Другой пользователь с тем же ключом — своя заявка.
+    assert _create(alice, "same").get_json()["id"] != bob_id
+    # Тот же ключ с другим телом — ошибка клиента.
+    assert _create(bob, "same", title="other").status_code == 422
+    assert _create(bob, "").status_code == 400
+
+
+def test_errors_are_replayed_and_in_progress_is_409(app, client, login):
+    login(client, "bob")
+    assert client.post("/tickets", json={}, headers={"Idempotency-Key": "bad"}).status_code == 400
+    r = client.post("/tickets", json={}, headers={"Idempotency-Key": "bad"})
+    assert r.status_code == 400 and r.headers["Idempotent-Replayed"] == "true"
+
+    # Заготовка без ответа — первый запрос ещё выполняется.
+    with app.app_context():
+        db.session.add(IdempotencyKey(
+            user_id=2, key="busy", fingerprint="x", expires_at=datetime.utcnow() + timedelta(hours=1)
+        ))
+        db.session.commit()
+    assert _create(client, "busy").status_code == 409
+
+
+def test_import_retry_does_not_insert_twice(client, login):
+    login(client, "admin", "adminpass")
+    body = '{"id": 10, "username": "u1", "password_hash": "x", "role": "user"}\n'
+    headers = {"Idempotency-Key": "import-1"}
+    first = client.post("/admin/import/users", data=body, headers=headers)
+    again = client.post("/admin/import/users", data=body, headers=headers)
+    assert first.status_code == again.status_code == 200
+    assert again.get_json() == first.get_json() == {"imported": 1, "offset": 1}
+    assert again.headers["Idempotent-Replayed"] == "true"
+
+
+def test_expired_keys_are_swept(app, client, login):
+    login(client, "bob")
+    _create(client, "old")
+    _create(client, "new")
+    with app.app_context():
+        db.session.execute(
+            update(IdempotencyKey).where(IdempotencyKey.key == "old")
+            .values(expires_at=datetime.utcnow() - timedelta(seconds=1))
+        )
+        db.session.commit()
+
+    # Истёкший ключ больше не повтор — создаётся новая заявка.
+    app.extensions["idempotency_cache"].entries.clear()
+    assert _create(client, "old").headers.get("Idempotent-Replayed") is None
+
+    with app.app_context():
+        db.session.execute(update(IdempotencyKey).values(expires_at=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+        jobs.ensure_queued("idempotency.sweep")
+    jobs.run_pending(app)
+    with app.app_context():
+        assert IdempotencyKey.query.count() == 0
+        assert idempotency.sweep() == 0
@@ -0,0 +1,160 @@
+# Тесты очереди фоновых задач.
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from app import jobs
+from app.extensions import db
+from app.models import Job
+
+# Что успели выполнить тестовые обработчики.
+calls = []
+
+
+@jobs.job("test.record")
+def record(value):
+    calls.append(value)
+
+
+@jobs.job("test.fail")
+def fail():
+    raise RuntimeError("boom")
+
+
+def test_enqueue_and_run(app):
+    calls.clear()
+    with app.app_context():
+        jobs.enqueue("test.record", {"value": 42})
+        # Задача в будущем пока не выполняется.
+        jobs.enqueue("test.record", {"value": 7}, delay=3600)
+        db.session.commit()
+
+    assert jobs.run_pending(app) == 1
+    assert calls == [42]
+
+    with app.app_context():
+        assert jobs.stats()["done"] == 1
+        assert jobs.stats()["queued"] == 1
+
+
+def test_failed_job_retries_with_backoff(app):
+    app.config["JOBS_MAX_ATTEMPTS"] = 2
+    with app.app_context():
+        j = jobs.enqueue("test.fail")
+        db.session.commit()
+        job_id = j.id
+
+    jobs.run_pending(app)
+    with app.app_context():
+        j = db.session.get(Job, job_id)
+        # После первой ошибки задача снова в очереди, но с паузой.
+        assert j.status == "queued"
+        assert j.run_at > datetime.utcnow()
+        assert "boom" in j.last_error
+
+        # "Промотаем" время вперёд — вторая попытка будет последней.
+        j.run_at = datetime.utcnow()
+        db.session.commit()
+
+    jobs.run_pending(app)
+    with app.app_context():
+        assert db.session.get(Job, job_id).status == "failed"
+
+
+def test_visibility_timeout_reclaims_stuck_job(app):
+    with app.app_context():
+        j = jobs.enqueue("test.record", {"value": 1})
+        db.session.commit()
+        # Воркер взял задачу и "умер".
+        assert jobs.claim(10, visibility_timeout=60) == [j.id]
+        assert jobs.claim(10, visibility_timeout=60) == []
+
+        # Время закрепления вышло — задачу можно забрать снова.
+        j.locked_until = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        assert jobs.claim(10, visibility_timeout=60) == [j.id]
+
+
+def test_admin_jobs_endpoints(app, client, login):
+    app.config["JOBS_MAX_ATTEMPTS"] = 1
+    with app.app_context():
+        jobs.enqueue("test.fail")
+        db.session.commit()
+    jobs.run_pending(app)
+
+    login(client, "admin", "adminpass")
+    assert client.get("/admin/jobs").get_json()["failed"] == 1
+
+    failed = client.get("/admin/jobs/failed").get_json()
+    assert failed[0]["name"] == "test.fail"
+
+    r = client.post(f"/admin/jobs/{failed[0]['id']}/retry")
+    assert r.get_json()["status"] == "queued"
+    assert client.get("/admin/jobs").get_json()["queued"] == 1
+
+
+@jobs.job("test.stall")
+def stall(job_id):
+    # Воркер "завис" дольше таймаута, и задачу перехватил другой воркер.
+    db.session.execute(
+        update(Job).where(Job.id == job_id).values(locked_until=datetime.utcnow() - timedelta(seconds=1))
+    )
+    assert jobs.claim(10, visibility_timeout=60) == [job_id]
+
+
+def test_late_report_from_stale_worker_is_ignored(app):
+    with app.app_context():
+        j = jobs.enqueue("test.stall")
+        db.session.commit()
+        j.payload = '{"job_id": %d}' % j.id
+        db.session.commit()
+        assert jobs.claim(10, visibility_timeout=60) == [j.id]
+
+        # Отчёт первого воркера не затирает захват второго.
+        jobs.execute(j.id)
+        db.session.refresh(j)
+        assert j.status == "running" and j.attempts == 2 and j.locked_until > datetime.utcnow()
+
+def test_stuck_job_fails_after_max_attempts(app):
+    with app.app_context():
+        j = jobs.enqueue("test.record", {"value": 1}, max_attempts=1)
+        db.session.commit()
+        assert jobs.claim(10, visibility_timeout=60) == [j.id]
+        j.locked_until = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+
+        # Единственная попытка потрачена — задача не перезапускается.
+        assert jobs.claim(10, visibility_timeout=60) == []
+        db.session.refresh(j)
+        assert j.status == "failed" and "visibility timeout" in j.last_error
+
+
+def test_periodic_jobs_requeue_and_worker_restores_broken_chain(app):
+    with app.app_context():
+        assert jobs.schedule_periodic() == len(jobs.PERIODIC)
+        assert jobs.schedule_periodic() == 0
+
+        # Чистка выполнилась и поставила следующую.
+        db.session.execute(update(Job).where(Job.name != "jobs.prune").values(status="done"))
+        db.session.commit()
+    jobs.run_pending(app)
+    with app.app_context():
+        queued = Job.query.filter_by(name="jobs.prune", status="queued").one()
+        assert queued.run_at > datetime.utcnow()
+
+        # Цепочка оборвалась: задача исчерпала попытки.
+        queued.status = "failed"
+        db.session.commit()
+
+    worker = jobs.Worker(app)
+    worker._schedule()
+    with app.app_context():
+        assert Job.query.filter_by(name="jobs.prune", status="queued").count() == 1
+        assert Job.query.filter_by(name="attachments.gc", status="queued").count() == 1
+    # Следующая проверка — не раньше JOBS_SCHEDULE_INTERVAL.
+    with app.app_context():
+        Job.query.filter_by(name="jobs.prune", status="queued").delete()
+        db.session.commit()
+    worker._schedule()
+    with app.app_context():
+        assert Job.query.filter_by(name="jobs.prune", status="queued").count() == 0
@@ -0,0 +1,85 @@
+# Тесты уведомлений: рассылка фоновой задачей, счётчик непрочитанных,
+# письма-сводки (одно письмо на пользователя за интервал).
+from app import jobs, notifications
+from app.models import Job, Notification, OutboxMessage
+
+
+def _setup(app, login):
+    owner, admin = app.test_client(), app.test_client()
+    login(owner, "owner")
+    login(admin, "admin", "adminpass")
+    tid = owner.post("/tickets", json={"title": "printer"}).get_json()["id"]
+    return owner, admin, tid
+
+
+def test_status_change_and_comment_notify_author(app, login):
+    owner, admin, tid = _setup(app, login)
+
+    admin.put(f"/tickets/{tid}", json={"status": "in-progress"})
+    admin.post(f"/tickets/{tid}/comments", json={"body": "on it"})
+    # Свой собственный комментарий автору не приходит.
+    owner.post(f"/tickets/{tid}/comments", json={"body": "thanks"})
+
+    # Запросы только поставили задачи — уведомлений ещё нет.
+    assert owner.get("/notifications/unread-count").get_json() == {"unread": 0}
+    jobs.run_pending(app)
+
+    assert owner.get("/notifications/unread-count").get_json() == {"unread": 2}
+    items = owner.get("/notifications").get_json()
+    assert [n["kind"] for n in items] == ["comment", "status"]
+    assert items[1]["message"] == "Заявка «printer»: статус in-progress"
+    assert admin.get("/notifications/unread-count").get_json() == {"unread": 0}
+
+    r = owner.post("/notifications/read", json={"ids": [items[0]["id"]]})
+    assert r.get_json() == {"marked": 1, "unread": 1}
+    # Чужие уведомления отметить нельзя.
+    assert admin.post("/notifications/read", json={"ids": [items[1]["id"]]}).get_json()["marked"] == 0
+    assert owner.post("/notifications/read").get_json() == {"marked": 1, "unread": 0}
+
+
+def test_failed_update_does_not_notify(app, login):
+    owner, admin, tid = _setup(app, login)
+    r = admin.put(f"/tickets/{tid}", json={"status": "closed", "version": 99})
+    assert r.status_code == 409
+    with app.app_context():
+        assert Job.query.filter_by(name="notifications.fanout").count() == 0
+
+
+def test_digest_coalesces_and_skips_read(app, login):
+    owner, admin, tid = _setup(app, login)
+    for status in ("in-progress", "closed", "open"):
+        admin.put(f"/tickets/{tid}", json={"status": status})
+    jobs.run_pending(app)
+
+    with app.app_context():
+        # Одна отложенная сводка на все изменения.
+        assert Job.query.filter_by(name="notifications.digest", status="queued").count() == 1
+
+    first = owner.get("/notifications").get_json()[-1]
+    owner.post("/notifications/read", json={"ids": [first["id"]]})
+
+    with app.app_context():
+        assert notifications.digest() == 1
+        (mail,) = OutboxMessage.query.all()
+        assert mail.subject.endswith("2")
+        assert "статус closed" in mail.body and "статус in-progress" not in mail.body
+
+        # Повторно те же уведомления в письмо не попадают.
+        assert notifications.digest() == 0
+        assert Notification.query.filter(Notification.digested_at.is_(None)).count() == 0
+
+
+def test_web_badge_and_page(web_client):
+    web_client.post("/web_register", data={"username": "bob", "password": "pw"})
+    web_client.post("/web_login", data={"username": "bob", "password": "pw"})
+    web_client.post("/tickets", data={"title": "web"})
+    app = web_client.application
+    with app.app_context():
+        notifications.fanout(1, "comment", actor_id=None)
+
+    page = web_client.get("/notifications").get_data(as_text=True)
+    assert "Новый комментарий к заявке «web»" in page
+    assert '<span class="badge bg-danger">1</span>' in page
+
+    web_client.post("/notifications/read")
+    assert "badge bg-danger" not in web_client.get("/notifications").get_data(as_text=True)
@@ -0,0 +1,75 @@
+# Тесты ограничения частоты попыток входа.
+from app import metrics, ratelimit
+from app.models import User
+from app.ratelimit import RateLimiter, SqliteStore
+
+
+def test_user_bucket_throttles_before_bcrypt(app, client, monkeypatch):
+    app.config["RATELIMIT_LOGIN_USER"] = "2/60"
+    ratelimit.init_app(app)
+    metrics.reset()
+
+    # Считаем, сколько раз реально запускалась проверка пароля.
+    checks = []
+    original = User.check_password
+    monkeypatch.setattr(User, "check_password", lambda self, pw: checks.append(1) or original(self, pw))
+
+    for _ in range(2):
+        r = client.post("/login", json={"username": "admin", "password": "wrong"})
+        assert r.status_code == 400
+
+    r = client.post("/login", json={"username": "admin", "password": "adminpass"})
+    assert r.status_code == 429
+    assert int(r.headers["Retry-After"]) > 0
+    # Третья попытка отклонена без bcrypt.
+    assert len(checks) == 2
+    assert metrics.snapshot()["ratelimit.throttled.user"] == 1
+
+
+def test_ip_bucket_limits_many_usernames(app, client):
+    app.config["RATELIMIT_LOGIN_IP"] = "3/60"
+    ratelimit.init_app(app)
+
+    codes = [
+        client.post("/login", json={"username": f"user{i}", "password": "x"}).status_code
+        for i in range(4)
+    ]
+    assert codes == [400, 400, 400, 429]
+
+
+def test_throttled_ip_does_not_drain_user_bucket(app):
+    app.config["RATELIMIT_LOGIN_IP"] = "1/60"
+    app.config["RATELIMIT_LOGIN_USER"] = "2/60"
+    ratelimit.init_app(app)
+
+    attacker, owner = app.test_client(), app.test_client()
+    for _ in range(5):
+        attacker.post("/login", json={"username": "admin", "password": "x"})
+    # Попытки с заблокированного IP не съели жетоны учётной записи.
+    r = owner.post(
+        "/login", json={"username": "admin", "password": "adminpass"}, environ_base={"REMOTE_ADDR": "10.0.0.2"}
+    )
+    assert r.status_code == 200
+
+
+def test_sqlite_store_is_shared(tmp_path):
+    # Два "процесса" с общим файлом делят одно ведро.
+    path = str(tmp_path / "buckets.db")
+    rules = {"user": (1, 1 / 60)}
+    a = RateLimiter(SqliteStore(path), rules)
+    b = RateLimiter(SqliteStore(path), rules)
+
+    assert a.hit(user="bob") == 0
+    assert b.hit(user="bob") > 0
+
+
+def test_sqlite_store_reconnects_after_fork(tmp_path, monkeypatch):
+    store = SqliteStore(str(tmp_path / "buckets.db"))
+    parent = store._connect()
+    assert store._connect() is parent
+
+    # "Дочерний процесс" после fork не получает соединение родителя.
+    monkeypatch.setattr(ratelimit.os, "getpid", lambda: -1)
+    child = store._connect()
+    assert child is not parent
+    assert store.take("user:bob", 1, 1 / 60, 0) == 0
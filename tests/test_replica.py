@@ -0,0 +1,86 @@
+# Тесты маршрутизации чтений на реплику.
+from datetime import datetime
+
+import pytest
+from sqlalchemy import insert, select
+
+from app import create_app
+from app.extensions import db
+from app.models import Ticket, User
+
+
+@pytest.fixture
+def replica_app(monkeypatch, tmp_path):
+    # Основная база — в памяти, реплика — отдельный SQLite-файл.
+    monkeypatch.setenv("REPLICA_DATABASE_URL", f"sqlite:///{tmp_path / 'replica.db'}")
+    app = create_app(testing=True)
+    with app.app_context():
+        db.create_all()
+        db.metadata.create_all(app.extensions["db_replica"])
+    return app
+
+
+def _replicate_users(app):
+    # Имитируем репликацию: копируем пользователей из основной базы в реплику.
+    with app.app_context():
+        rows = [dict(r._mapping) for r in db.session.execute(select(User.__table__)).all()]
+        with app.extensions["db_replica"].begin() as conn:
+            conn.execute(User.__table__.delete())
+            conn.execute(insert(User.__table__), rows)
+
+
+def test_reads_go_to_replica_after_ryw_window(replica_app):
+    client = replica_app.test_client()
+    client.post("/register", json={"username": "bob", "password": "pw"})
+    client.post("/login", json={"username": "bob", "password": "pw"})
+    client.post("/tickets", json={"title": "primary"})
+    _replicate_users(replica_app)
+
+    # Сразу после своей записи — читаем из основной базы (read-your-writes).
+    titles = [t["title"] for t in client.get("/tickets").get_json()]
+    assert titles == ["primary"]
+
+    # В реплике лежит другая заявка — по ней видно, откуда идёт чтение.
+    with replica_app.app_context():
+        with replica_app.extensions["db_replica"].begin() as conn:
+            conn.execute(insert(Ticket.__table__), [{
+                "id": 1, "title": "replica", "status": "open", "author_id": 1,
+                "created_at": datetime.utcnow(), "updated_at": datetime.utcnow(),
+            }])
+
+    # Окно read-your-writes прошло — GET идёт на реплику.
+    with client.session_transaction() as s:
+        s["last_write"] = 0
+    titles = [t["title"] for t in client.get("/tickets").get_json()]
+    assert titles == ["replica"]
+
+    # Запись всегда идёт в основную базу и снова включает окно.
+    r = client.put("/tickets/1", json={"status": "closed"})
+    assert r.status_code == 200
+    with replica_app.app_context():
+        assert db.session.get(Ticket, 1).status == "closed"
+    assert [t["status"] for t in client.get("/tickets").get_json()] == ["closed"]
+
+
+def test_without_replica_everything_uses_primary(app):
+    assert "db_replica" not in app.extensions
+
+
+def test_token_client_gets_read_your_writes_without_session(replica_app):
+    client = replica_app.test_client()
+    client.post("/register", json={"username": "bob", "password": "pw"})
+    token = client.post("/token", json={"username": "bob", "password": "pw"}).get_json()["access_token"]
+    _replicate_users(replica_app)
+
+    api = replica_app.test_client()
+    auth = {"Authorization": f"Bearer {token}"}
+    r = api.post("/tickets", json={"title": "primary"}, headers=auth)
+    assert r.status_code == 201
+    # Запись без cookie не создаёт сессию и не ставит cookie.
+    assert "Set-Cookie" not in r.headers
+    assert replica_app.extensions["session_store"].backend.records == {}
+
+    # Окно read-your-writes держится по id пользователя.
+    assert [t["title"] for t in api.get("/tickets", headers=auth).get_json()] == ["primary"]
+    replica_app.extensions["replica_writes"].entries.clear()
+    assert api.get("/tickets", headers=auth).get_json() == []
@@ -0,0 +1,88 @@
+# Тесты отчётов: дневные итоги обновляются при записи заявок,
+# пересчёт по истории, отчёт не читает таблицу ticket.
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from app.extensions import db
+from app.models import Ticket
+
+
+def test_rollups_follow_ticket_writes(client, login):
+    login(client, "admin", "adminpass")
+    ids = [client.post("/tickets", json={"title": f"t{i}"}).get_json()["id"] for i in range(3)]
+    client.put(f"/tickets/{ids[0]}", json={"status": "closed"})
+    client.put(f"/tickets/{ids[1]}", json={"status": "closed"})
+    # Повторное "закрытие" закрытой заявки — не новое событие.
+    client.put(f"/tickets/{ids[1]}", json={"status": "closed", "title": "renamed"})
+
+    today = client.get("/reports/tickets").get_json()["series"][-1]
+    assert (today["created"], today["closed"]) == (3, 2)
+    assert 0 <= today["median_close_seconds"] <= 300
+
+    # Открыли заново и закрыли — ещё одно закрытие.
+    client.put(f"/tickets/{ids[0]}", json={"status": "open"})
+    assert client.get(f"/tickets/{ids[0]}").get_json()["status"] == "open"
+    client.put(f"/tickets/{ids[0]}", json={"status": "closed"})
+    assert client.get("/reports/tickets").get_json()["total"]["closed"] == 3
+
+
+def test_backfill_and_weekly_report(app, client, login):
+    # Заявки "из прошлого", закрытые до появления closed_at.
+    monday = datetime(2024, 1, 1, 9, 0)
+    rows = [
+        (monday, monday + timedelta(minutes=10)),
+        (monday, monday + timedelta(minutes=10)),
+        (monday + timedelta(days=1), monday + timedelta(days=4)),
+        (monday + timedelta(days=8), None),
+    ]
+    with app.app_context():
+        db.session.execute(
+            Ticket.__table__.insert(),
+            [
+                {"title": "old", "author_id": 1, "status": "closed" if closed else "open",
+                 "created_at": created, "updated_at": closed or created, "version": 1,
+                 "comment_count": 0, "attachment_count": 0}
+                for created, closed in rows
+            ],
+        )
+        db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=["reports-backfill", "--batch-size", "2"])
+    assert result.exit_code == 0, result.output
+
+    login(client, "admin", "adminpass")
+    report = client.get("/reports/tickets?from=2024-01-01&to=2024-01-14&interval=week").get_json()
+    weeks = [(p["period"], p["created"], p["closed"]) for p in report["series"]]
+    assert weeks == [("2024-01-01", 3, 3), ("2024-01-08", 1, 0)]
+    # Две заявки из трёх решены за 10 минут — медиана в корзине "до 15 минут".
+    assert 300 < report["total"]["median_close_seconds"] <= 900
+
+
+def test_report_reads_only_rollups(app, client, login):
+    login(client, "admin", "adminpass")
+    client.post("/tickets", json={"title": "t"})
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", record)
+    r = client.get("/reports/tickets?from=2020-01-01&to=2022-12-31")
+    event.remove(engine, "before_cursor_execute", record)
+
+    assert r.status_code == 200 and len(r.get_json()["series"]) == 1096
+    assert not any(re.search(r"\bticket\b", s) for s in statements)
+
+
+def test_report_validation(client, login):
+    login(client, "bob")
+    assert client.get("/reports/tickets").status_code == 403
+    login(client, "admin", "adminpass")
+    assert client.get("/reports/tickets?interval=month").status_code == 400
+    assert client.get("/reports/tickets?from=2024-02-01&to=2024-01-01").status_code == 400
+    assert client.get("/reports/tickets?from=yesterday").status_code == 400
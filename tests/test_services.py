@@ -0,0 +1,110 @@
+# Тесты общего слоя логики и режима "both" (веб + JSON-API в одном процессе).
+import pytest
+import sqlalchemy as sa
+
+from app import create_app
+from app.extensions import db
+from app.models import User
+
+
+def _make_app(monkeypatch, tmp_path, mode, shards=0):
+    monkeypatch.setenv("DATABASE_URL", "sqlite://")
+    monkeypatch.setenv("TEMPLATE_CACHE_DIR", str(tmp_path / "jinja_cache"))
+    monkeypatch.setenv("SESSION_STORE", str(tmp_path / "sessions.db"))
+    monkeypatch.setenv("INVALIDATION_BUS", str(tmp_path / "bus.db"))
+    if shards:
+        urls = ",".join(f"sqlite:///{tmp_path / f'shard{i}.db'}" for i in range(shards))
+        monkeypatch.setenv("TICKET_SHARDS", urls)
+    app = create_app(mode=mode)
+    with app.app_context():
+        db.create_all()
+        admin = User(username="admin", role="admin")
+        admin.set_password("adminpass")
+        db.session.add(admin)
+        db.session.commit()
+    if shards:
+        app.test_cli_runner().invoke(args=["shards-init"])
+    return app
+
+
+@pytest.fixture
+def both_app(monkeypatch, tmp_path):
+    return _make_app(monkeypatch, tmp_path, "both")
+
+
+def test_both_mode_serves_web_and_api(both_app):
+    client = both_app.test_client()
+
+    # Гость: страница — редирект на вход, API — 401.
+    r = client.get("/tickets")
+    assert r.status_code == 302 and "/web_login" in r.headers["Location"]
+    assert client.get("/api/tickets").status_code == 401
+
+    # Регистрация через API, вход через веб — одна и та же сессия.
+    assert client.post("/api/register", json={"username": "bob", "password": "pw"}).status_code == 201
+    assert client.post("/web_login", data={"username": "bob", "password": "pw"}).status_code == 302
+
+    r = client.post("/api/tickets", json={"title": "from api"})
+    assert r.status_code == 201
+    assert "from api" in client.get("/tickets").get_data(as_text=True)
+
+    client.post("/tickets", data={"title": "from web"})
+    titles = [t["title"] for t in client.get("/api/tickets").get_json()]
+    assert sorted(titles) == ["from api", "from web"]
+
+
+def test_same_permission_rules_on_both_sides(both_app):
+    owner = both_app.test_client()
+    owner.post("/api/register", json={"username": "owner", "password": "pw"})
+    owner.post("/api/login", json={"username": "owner", "password": "pw"})
+    tid = owner.post("/api/tickets", json={"title": "secret"}).get_json()["id"]
+
+    other = both_app.test_client()
+    other.post("/api/register", json={"username": "other", "password": "pw"})
+    other.post("/api/login", json={"username": "other", "password": "pw"})
+
+    assert other.get(f"/api/tickets/{tid}").status_code == 403
+    r = other.get(f"/tickets/{tid}")
+    assert r.status_code == 302 and r.headers["Location"].endswith("/tickets")
+    assert other.get("/api/users").status_code == 403
+    assert other.get("/users").status_code == 302
+
+
+def test_web_list_loads_authors_in_one_query(both_app):
+    client = both_app.test_client()
+    client.post("/web_login", data={"username": "admin", "password": "adminpass"})
+    for name in ("u1", "u2", "u3"):
+        c = both_app.test_client()
+        c.post("/api/register", json={"username": name, "password": "pw"})
+        c.post("/api/login", json={"username": name, "password": "pw"})
+        c.post("/api/tickets", json={"title": f"{name} ticket"})
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with both_app.app_context():
+        engine = db.engine
+    sa.event.listen(engine, "before_cursor_execute", record)
+    page = client.get("/tickets").get_data(as_text=True)
+    sa.event.remove(engine, "before_cursor_execute", record)
+
+    # Текущий пользователь + один запрос заявок вместе с авторами (JOIN)
+    # + число непрочитанных уведомлений для шапки.
+    assert all(f"u{i} ticket" in page for i in (1, 2, 3))
+    assert len(statements) == 3
+
+
+def test_web_pages_work_with_sharded_tickets(monkeypatch, tmp_path):
+    app = _make_app(monkeypatch, tmp_path, "both", shards=2)
+    client = app.test_client()
+    client.post("/api/register", json={"username": "bob", "password": "pw"})
+    client.post("/web_login", data={"username": "bob", "password": "pw"})
+
+    client.post("/tickets", data={"title": "sharded"})
+    tid = client.get("/api/tickets").get_json()[0]["id"]
+
+    page = client.get(f"/tickets/{tid}").get_data(as_text=True)
+    assert "sharded" in page and "bob" in page
+    assert "sharded" in client.get("/tickets").get_data(as_text=True)
@@ -0,0 +1,109 @@
+# Тесты серверных сессий: в cookie только идентификатор, кэш перед
+# хранилищем, новый идентификатор при входе, отзыв и чистка.
+import time
+
+from app import sessions
+
+
+def _sid(client):
+    cookie = client.get_cookie("session")
+    return cookie.value if cookie else None
+
+
+def test_cookie_is_opaque_and_cache_avoids_store(app, client, login):
+    login(client, "bob")
+    sid = _sid(client)
+    assert len(sid) == 43 and "bob" not in sid
+
+    store = app.extensions["session_store"]
+    loads = []
+    original = store.backend.load
+    store.backend.load = lambda key: loads.append(key) or original(key)
+
+    for _ in range(5):
+        assert client.get("/tickets").status_code == 200
+    assert loads == []
+
+    # Запись в кэше устарела — одно чтение из хранилища, дальше снова кэш.
+    store.cache_ttl = 0
+    client.get("/tickets")
+    assert len(loads) == 1
+
+
+def test_login_issues_new_session_id(web_client):
+    # Сессия до входа: flash-сообщение, дожидающееся редиректа.
+    web_client.post("/web_register", data={"username": "admin", "password": "x"})
+    before = _sid(web_client)
+    assert before
+
+    web_client.post("/web_login", data={"username": "admin", "password": "adminpass"})
+    after = _sid(web_client)
+    assert after not in (None, before)
+
+    # Старый идентификатор больше ничего не открывает.
+    attacker = web_client.application.test_client()
+    attacker.set_cookie("session", before)
+    assert attacker.get("/tickets").status_code == 302
+
+    # Выход тоже меняет идентификатор: вошедшая сессия больше не действует.
+    web_client.get("/web_logout")
+    assert _sid(web_client) != after
+    attacker.set_cookie("session", after)
+    assert attacker.get("/tickets").status_code == 302
+
+
+def test_malformed_cookie_is_treated_as_absent(app, client, login):
+    for bad in ("éabc", "x" * 42, "x" * 44, "../" + "a" * 40):
+        client.set_cookie("session", bad)
+        assert client.get("/tickets").status_code == 401
+    login(client, "bob")
+    assert client.get("/tickets").status_code == 200
+
+
+def test_admin_revokes_sessions(app, login):
+    bob, admin = app.test_client(), app.test_client()
+    login(bob, "bob")
+    login(admin, "admin", "adminpass")
+    bob_id = 2  # admin создан фикстурой первым
+    listed = admin.get(f"/admin/users/{bob_id}/sessions").get_json()
+    assert len(listed) == 1 and len(listed[0]["id"]) == 16
+    assert bob.get("/admin/users/1/sessions").status_code == 403
+
+    assert admin.delete(f"/admin/users/{bob_id}/sessions/{'0' * 16}").status_code == 404
+    r = admin.delete(f"/admin/users/{bob_id}/sessions/{listed[0]['id']}")
+    assert r.get_json() == {"revoked": 1}
+    assert bob.get("/tickets").status_code == 401
+
+
+def test_deleted_user_is_logged_out_everywhere(web_app):
+    user, admin = web_app.test_client(), web_app.test_client()
+    user.post("/web_register", data={"username": "bob", "password": "pw"})
+    user.post("/web_login", data={"username": "bob", "password": "pw"})
+    admin.post("/web_login", data={"username": "admin", "password": "adminpass"})
+    assert user.get("/tickets").status_code == 200
+
+    admin.post("/users/2/delete")
+    with web_app.app_context():
+        assert sessions.sessions_of(2) == []
+    assert user.get("/tickets").status_code == 302
+
+
+def test_sqlite_store_is_shared_and_swept(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    a = sessions.SessionStore(sessions.SqliteStore(path), cache_ttl=60)
+    b = sessions.SessionStore(sessions.SqliteStore(path), cache_ttl=0)
+    now = time.time()
+
+    a.save("k1", sessions.Record(7, "{}", now, now + 100), now)
+    a.save("k2", sessions.Record(7, "{}", now, now - 1), now)
+    assert b.get("k1", now).user_id == 7
+    assert b.get("k2", now) is None  # истекла
+
+    # Отзыв в другом процессе: b видит сразу, a — после устаревания кэша.
+    assert b.revoke_user(7) == 2
+    assert b.get("k1", now) is None
+    assert a.get("k1", now) is not None
+    assert a.get("k1", now + 61) is None
+
+    a.save("k3", sessions.Record(8, "{}", now, now + 1), now)
+    assert a.sweep(now + 2) == 1 and b.get("k3", now) is None
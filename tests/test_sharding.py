@@ -0,0 +1,176 @@
+# Тесты шардирования заявок по автору.
+import pytest
+import sqlalchemy as sa
+from werkzeug.exceptions import NotFound
+
+from app import create_app, services, sharding
+from app.extensions import db
+from app.models import Comment, User
+from app.versioning import VersionConflict
+
+
+@pytest.fixture
+def sharded_app(monkeypatch, tmp_path):
+    urls = ",".join(f"sqlite:///{tmp_path / f'shard{i}.db'}" for i in range(3))
+    monkeypatch.setenv("TICKET_SHARDS", urls)
+    app = create_app(testing=True)
+    with app.app_context():
+        db.create_all()
+        admin = User(username="admin", role="admin")
+        admin.set_password("adminpass")
+        db.session.add(admin)
+        db.session.commit()
+    app.test_cli_runner().invoke(args=["shards-init"])
+    return app
+
+
+def _user_client(app, name):
+    client = app.test_client()
+    client.post("/register", json={"username": name, "password": "pw"})
+    client.post("/login", json={"username": name, "password": "pw"})
+    return client
+
+
+def test_tickets_are_routed_by_author(sharded_app):
+    shards = sharded_app.extensions["ticket_shards"]
+    clients = {name: _user_client(sharded_app, name) for name in ("u1", "u2", "u3")}
+
+    created = {}
+    for name, client in clients.items():
+        for i in range(2):
+            r = client.post("/tickets", json={"title": f"{name}-{i}"})
+            assert r.status_code == 201
+            created.setdefault(name, []).append(r.get_json()["id"])
+
+    # Заявка лежит в шарде автора, и id указывает на тот же шард.
+    for name, client in clients.items():
+        mine = client.get("/tickets").get_json()
+        assert sorted(t["id"] for t in mine) == sorted(created[name])
+        author_id = mine[0]["author_id"]
+        assert all(tid % shards.count == author_id % shards.count for tid in created[name])
+
+    # Строки реально разложены по разным базам.
+    counts = []
+    for engine in shards.engines:
+        with engine.connect() as conn:
+            counts.append(conn.execute(sa.select(sa.func.count()).select_from(sharding.ticket_table)).scalar())
+    assert counts == [2, 2, 2]
+
+
+def test_admin_list_is_merged_by_updated_at(sharded_app):
+    u1 = _user_client(sharded_app, "u1")
+    u2 = _user_client(sharded_app, "u2")
+    first = u1.post("/tickets", json={"title": "first"}).get_json()["id"]
+    u2.post("/tickets", json={"title": "second"})
+    u1.post("/tickets", json={"title": "third"})
+    # Обновление поднимает заявку наверх списка.
+    u1.put(f"/tickets/{first}", json={"status": "closed"})
+
+    admin = sharded_app.test_client()
+    admin.post("/login", json={"username": "admin", "password": "adminpass"})
+    titles = [t["title"] for t in admin.get("/tickets").get_json()]
+    assert titles == ["first", "third", "second"]
+
+
+def test_permissions_and_delete_in_shards(sharded_app):
+    u1 = _user_client(sharded_app, "u1")
+    u2 = _user_client(sharded_app, "u2")
+    tid = u1.post("/tickets", json={"title": "mine"}).get_json()["id"]
+
+    assert u2.get(f"/tickets/{tid}").status_code == 403
+    assert u2.delete(f"/tickets/{tid}").status_code == 403
+    assert u1.get(f"/tickets/{tid}").get_json()["title"] == "mine"
+    assert u1.delete(f"/tickets/{tid}").status_code == 200
+    assert u1.get(f"/tickets/{tid}").status_code == 404
+
+
+def test_claim_walks_all_shards(sharded_app):
+    for name in ("u1", "u2", "u3"):
+        _user_client(sharded_app, name).post("/tickets", json={"title": name})
+
+    admin = sharded_app.test_client()
+    admin.post("/login", json={"username": "admin", "password": "adminpass"})
+    claimed = [admin.post("/tickets/claim").get_json()["title"] for _ in range(3)]
+    assert sorted(claimed) == ["u1", "u2", "u3"]
+    assert admin.post("/tickets/claim").status_code == 204
+    assert len(admin.get("/tickets/queue?status=in-progress&mine=1").get_json()) == 3
+
+
+def test_delete_user_cleans_every_shard(sharded_app):
+    u1 = _user_client(sharded_app, "u1")
+    u2 = _user_client(sharded_app, "u2")
+    admin = sharded_app.test_client()
+    admin.post("/login", json={"username": "admin", "password": "adminpass"})
+
+    own = u1.post("/tickets", json={"title": "u1"}).get_json()["id"]
+    u1.post(f"/tickets/{own}/comments", json={"body": "c"})
+    other = u2.post("/tickets", json={"title": "u2"}).get_json()["id"]
+    # u1 — администратор, взявший в работу и заявку из чужого шарда.
+    admin.put("/users/2", json={"role": "admin"})
+    u1.post("/login", json={"username": "u1", "password": "pw"})
+    claimed = {u1.post("/tickets/claim").get_json()["id"] for _ in range(2)}
+    assert claimed == {own, other}
+
+    with sharded_app.app_context():
+        assert services.delete_user(db.session.get(User, 1), 2) == "u1"
+        assert Comment.query.filter_by(ticket_id=own).count() == 0
+    assert admin.get(f"/tickets/{own}").status_code == 404
+    released = admin.get(f"/tickets/{other}").get_json()
+    assert released["status"] == "open" and released["assignee_id"] is None
+
+
+def test_create_retries_when_id_is_taken(sharded_app):
+    u1 = _user_client(sharded_app, "u1")
+    engine = sharded_app.extensions["ticket_shards"].for_author(2)
+    conflicts = []
+
+    # Первая вставка "проигрывает" одновременной вставке с тем же id.
+    def conflict(conn, cursor, statement, *args):
+        if statement.startswith("INSERT") and not conflicts:
+            conflicts.append(statement)
+            raise sa.exc.IntegrityError(statement, None, Exception("duplicate id"))
+
+    sa.event.listen(engine, "before_cursor_execute", conflict)
+    try:
+        r = u1.post("/tickets", json={"title": "t"})
+    finally:
+        sa.event.remove(engine, "before_cursor_execute", conflict)
+    assert r.status_code == 201 and len(conflicts) == 1
+    assert u1.get(f"/tickets/{r.get_json()['id']}").status_code == 200
+
+
+def test_export_and_import_go_through_shards(sharded_app):
+    for name in ("u1", "u2", "u3"):
+        _user_client(sharded_app, name).post("/tickets", json={"title": name})
+    admin = sharded_app.test_client()
+    admin.post("/login", json={"username": "admin", "password": "adminpass"})
+    exported = admin.get("/admin/export/tickets").get_data(as_text=True)
+    assert len(exported.splitlines()) == 3
+
+    # Переносим выгрузку в пустые шарды — заявки снова видны авторам.
+    shards = sharded_app.extensions["ticket_shards"]
+    for engine in shards.engines:
+        with engine.begin() as conn:
+            conn.execute(sa.delete(sharding.ticket_table))
+    r = admin.post("/admin/import/tickets", data=exported)
+    assert r.get_json() == {"imported": 3, "offset": 3}
+    assert sorted(t["title"] for t in admin.get("/tickets").get_json()) == ["u1", "u2", "u3"]
+    u1 = sharded_app.test_client()
+    u1.post("/login", json={"username": "u1", "password": "pw"})
+    assert [t["title"] for t in u1.get("/tickets").get_json()] == ["u1"]
+
+    # id не из шарда автора — такую заявку не нашли бы, строка отклоняется.
+    bad = exported.splitlines()[0].replace('"id": ', '"id": 1000', 1)
+    r = admin.post("/admin/import/tickets", data=bad)
+    assert r.status_code == 400 and "shard" in r.get_json()["error"]
+
+
+def test_update_of_missing_ticket_is_404_not_conflict(sharded_app):
+    u1 = _user_client(sharded_app, "u1")
+    tid = u1.post("/tickets", json={"title": "t"}).get_json()["id"]
+    with sharded_app.test_request_context():
+        # Заявку удалили между проверкой прав и UPDATE.
+        with pytest.raises(NotFound):
+            sharding.update(tid + 3000, {"title": "x"}, {"version": 1})
+        with pytest.raises(VersionConflict):
+            sharding.update(tid, {"title": "x"}, {"version": 7})
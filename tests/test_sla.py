@@ -0,0 +1,76 @@
+# Тесты сроков SLA: срок пересчитывается при смене статуса, поиск
+# просроченных — по индексу, периодическая проверка уведомляет один раз.
+import json
+from datetime import datetime
+
+import sqlalchemy as sa
+
+from app import jobs, sla
+from app.extensions import db
+from app.models import Job, Notification, Ticket
+
+
+def _deadline(client, tid):
+    value = client.get(f"/tickets/{tid}").get_json()["deadline"]
+    return datetime.fromisoformat(value) if value else None
+
+
+def test_deadline_follows_status(app, client, login):
+    login(client, "admin", "adminpass")
+    tid = client.post("/tickets", json={"title": "t"}).get_json()["id"]
+
+    opened = _deadline(client, tid)
+    assert 4 * 3600 - 60 < (opened - datetime.utcnow()).total_seconds() <= 4 * 3600
+
+    # Тот же статус ещё раз — срок не продлевается.
+    client.put(f"/tickets/{tid}", json={"status": "open", "title": "renamed"})
+    assert _deadline(client, tid) == opened
+
+    client.put(f"/tickets/{tid}", json={"status": "in-progress"})
+    assert (_deadline(client, tid) - opened).total_seconds() > 19 * 3600
+
+    client.put(f"/tickets/{tid}", json={"status": "closed"})
+    assert _deadline(client, tid) is None
+
+
+def test_overdue_endpoint(app, client, login):
+    # Срок открытой заявки уже истёк в момент создания.
+    app.extensions["sla_policies"]["open"] = -60
+    login(client, "bob")
+    for title in ("late", "closed"):
+        client.post("/tickets", json={"title": title})
+    client.put("/tickets/2", json={"status": "closed"})
+    assert client.get("/tickets/overdue").status_code == 403
+
+    login(client, "admin", "adminpass")
+    assert [t["title"] for t in client.get("/tickets/overdue").get_json()] == ["late"]
+
+
+def test_overdue_query_is_index_range(app):
+    with app.app_context():
+        stmt = sla.overdue_statement(Ticket.__table__, datetime.utcnow())
+        sql = str(stmt.compile(db.engine, compile_kwargs={"literal_binds": True}))
+        plan = " ".join(row[-1] for row in db.session.execute(sa.text("EXPLAIN QUERY PLAN " + sql)))
+    assert "ix_ticket_status_deadline" in plan and "deadline<" in plan
+
+
+def test_periodic_check_notifies_once(app, client, login):
+    app.extensions["sla_policies"]["open"] = -1
+    login(client, "bob")
+    client.post("/tickets", json={"title": "forgotten"})
+
+    with app.app_context():
+        sla.ensure_scheduled()
+        sla.ensure_scheduled()
+        assert Job.query.filter_by(name="sla.check").count() == 1
+    jobs.run_pending(app)
+
+    with app.app_context():
+        (n,) = Notification.query.filter_by(kind="sla").all()
+        assert n.user_id == 1 and "«forgotten»" in n.message
+        # Следующая проверка стоит в очереди и начнёт с момента этой.
+        nxt = Job.query.filter_by(name="sla.check", status="queued").one()
+        assert json.loads(nxt.payload)["since"]
+
+        # Повторная проверка уже просроченную заявку не сообщает заново.
+        assert sla.check(json.loads(nxt.payload)["since"]) == 0
@@ -0,0 +1,50 @@
+# Тесты запуска: импорт run.py не трогает базу, редкие модули (экспорт и
+# импорт, очередь задач, prefork) не загружаются при create_app, а прогрев
+# перед fork компилирует шаблоны.
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_python(code, tmp_path):
+    env = dict(os.environ)
+    env["DATABASE_URL"] = "sqlite:///" + str(tmp_path / "startup.db")
+    env["TEMPLATE_CACHE_DIR"] = str(tmp_path / "jinja_cache")
+    env["SESSION_STORE"] = str(tmp_path / "sessions.db")
+    env["INVALIDATION_BUS"] = str(tmp_path / "bus.db")
+    env["RATELIMIT_STORAGE"] = str(tmp_path / "ratelimit.db")
+    env["ATTACHMENTS_DIR"] = str(tmp_path / "attachments")
+    return subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+
+
+def test_importing_run_does_not_touch_database(tmp_path):
+    run_python("import run", tmp_path)
+    assert not (tmp_path / "startup.db").exists()
+
+
+def test_rarely_used_modules_are_not_imported(tmp_path):
+    out = run_python(
+        "import sys\n"
+        "from app import create_app\n"
+        "create_app()\n"
+        "lazy = ['app.transfer', 'app.jobs', 'app.prefork']\n"
+        "print(','.join(m for m in lazy if m in sys.modules))\n",
+        tmp_path,
+    )
+    assert out.strip() == ""
+
+
+def test_prefork_warm_up_compiles_templates(tmp_path):
+    out = run_python(
+        "from app import create_app\n"
+        "from app.prefork import warm_up\n"
+        "app = create_app()\n"
+        "warm_up(app)\n"
+        "print(len(app.jinja_env.cache))\n",
+        tmp_path,
+    )
+    assert int(out) > 0
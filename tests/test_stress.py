@@ -0,0 +1,379 @@
+# Нагрузочные тесты жизненного цикла заявок.
+#
+# Много потоков (через тестовый клиент) и много процессов (через настоящий
+# сервер `python run.py --workers N`) одновременно регистрируются, входят,
+# создают, меняют, комментируют и удаляют заявки в одной файловой базе,
+# администратор тем временем удаляет пользователей. После прогона
+# проверяются инварианты:
+#  - нет потерянных обновлений (If-Match + повтор при 412);
+#  - после delete_user не осталось заявок, комментариев и уведомлений
+#    без владельца;
+#  - счётчики (comment_count, итоги для отчётов) сходятся с данными;
+#  - ни одного ответа 5xx.
+#
+# Последовательность операций каждого потока/процесса задаётся зерном
+# (STRESS_SEED), размер прогона — STRESS_SCALE (по умолчанию 1 — несколько
+# секунд). Пропускная способность и число ошибок блокировки базы
+# печатаются в конце:  python -m pytest -s tests/test_stress.py
+import http.cookiejar
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+
+import pytest
+import sqlalchemy as sa
+from flask import got_request_exception
+
+from app import create_app
+from app.commands import init_db
+from app.extensions import db
+
+SCALE = int(os.getenv("STRESS_SCALE", 1))
+SEED = int(os.getenv("STRESS_SEED", 1))
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Stats:
+    # Ответы по кодам и операциям, ошибки блокировки базы, время прогона.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.statuses = Counter()
+        self.ops = Counter()
+        self.lock_errors = 0
+        self.started = time.perf_counter()
+
+    def record(self, op: str, status: int):
+        with self.lock:
+            self.ops[op] += 1
+            self.statuses[status] += 1
+
+    def merge(self, ops: dict, statuses: dict):
+        with self.lock:
+            self.ops.update(ops)
+            self.statuses.update({int(k): v for k, v in statuses.items()})
+
+    def report(self, name: str) -> str:
+        elapsed = time.perf_counter() - self.started
+        total = sum(self.statuses.values())
+        errors = sum(n for code, n in self.statuses.items() if code >= 500)
+        line = (
+            f"stress[{name}]: {total} запросов за {elapsed:.1f} с "
+            f"({total / elapsed:.0f} в секунду), 5xx: {errors}, "
+            f"блокировки базы: {self.lock_errors}, коды: {dict(sorted(self.statuses.items()))}"
+        )
+        print("\n" + line)
+        return line
+
+
+def _env(monkeypatch, tmp_path, **extra):
+    # Файловая база и общие файлы сессий/шины — как у нескольких воркеров.
+    values = {
+        "DATABASE_URL": f"sqlite:///{tmp_path / 'stress.db'}",
+        "SESSION_STORE": str(tmp_path / "sessions.db"),
+        "INVALIDATION_BUS": str(tmp_path / "bus.db"),
+        "TEMPLATE_CACHE_DIR": str(tmp_path / "jinja_cache"),
+        "ATTACHMENTS_DIR": str(tmp_path / "attachments"),
+        "BCRYPT_LOG_ROUNDS": "4",
+        "RATELIMIT_ENABLED": "0",  # все клиенты с одного адреса
+        **extra,
+    }
+    for key, value in values.items():
+        monkeypatch.setenv(key, value)
+    return values
+
+
+def _check_invariants(app):
+    # Общие проверки по содержимому базы после прогона.
+    with app.app_context():
+        q = lambda sql: db.session.execute(sa.text(sql)).all()  # noqa: E731
+        assert q("SELECT id FROM ticket WHERE author_id NOT IN (SELECT id FROM user)") == []
+        assert q("SELECT id FROM ticket WHERE assignee_id IS NOT NULL "
+                 "AND assignee_id NOT IN (SELECT id FROM user)") == []
+        assert q("SELECT id FROM comment WHERE ticket_id NOT IN (SELECT id FROM ticket)") == []
+        assert q("SELECT id FROM comment WHERE author_id IS NOT NULL "
+                 "AND author_id NOT IN (SELECT id FROM user)") == []
+        assert q("SELECT id FROM notification WHERE user_id NOT IN (SELECT id FROM user)") == []
+        assert q("SELECT t.id FROM ticket t WHERE t.comment_count != "
+                 "(SELECT count(*) FROM comment c WHERE c.ticket_id = t.id)") == []
+        return {
+            "tickets": q("SELECT count(*) FROM ticket")[0][0],
+            "created": q("SELECT coalesce(sum(created), 0) FROM ticket_daily_stats")[0][0],
+        }
+
+
+# ============================================================
+#              ПОТОКИ ЧЕРЕЗ ТЕСТОВЫЙ КЛИЕНТ
+# ============================================================
+
+@pytest.fixture
+def stress_app(monkeypatch, tmp_path):
+    _env(monkeypatch, tmp_path)
+    app = create_app(mode="both")
+    with app.app_context():
+        init_db()
+    return app
+
+
+def test_threads_keep_invariants(stress_app):
+    app = stress_app
+    stats = Stats()
+    users = 8 * SCALE
+    ops = 25 * SCALE
+    doomed = set(range(0, users, 4))  # этих пользователей удалят посреди прогона
+    halfway = threading.Barrier(len(doomed) + 1)
+
+    def on_exception(sender, exception, **extra):
+        if "locked" in str(exception):
+            with stats.lock:
+                stats.lock_errors += 1
+
+    got_request_exception.connect(on_exception, app)
+
+    def call(client, op, method, url, **kwargs):
+        r = client.open(f"/api{url}", method=method, **kwargs)
+        stats.record(op, r.status_code)
+        return r
+
+    def admin_client():
+        c = app.test_client()
+        assert call(c, "login", "POST", "/login", json={"username": "admin", "password": "adminpass"}).status_code == 200
+        return c
+
+    # Общая заявка: администраторы параллельно увеличивают число в описании.
+    # Каждое успешное изменение основано на свежей версии — итог должен
+    # равняться числу успешных PUT (потерянное обновление его уменьшит).
+    admin = admin_client()
+    shared = call(admin, "create", "POST", "/tickets", json={"title": "shared", "description": "0"}).get_json()["id"]
+    increments = Counter()
+
+    def incrementer(n):
+        c = admin_client()
+        done = 0
+        while done < ops // 2:
+            r = call(c, "get", "GET", f"/tickets/{shared}")
+            value = int(r.get_json()["description"])
+            r = call(c, "update", "PUT", f"/tickets/{shared}", json={"description": str(value + 1)},
+                     headers={"If-Match": r.headers["ETag"]})
+            if r.status_code == 200:
+                done += 1
+            else:
+                assert r.status_code == 412
+        increments[n] = done
+
+    live = {}  # пользователь → id его заявок, которые он не удалял
+    created = Counter()
+
+    def user(n):
+        rng = random.Random(SEED * 1000 + n)
+        c = app.test_client()
+        assert call(c, "login", "POST", "/login", json={"username": f"u{n}", "password": "pw"}).status_code == 200
+        mine = live[n] = []
+        for i in range(ops):
+            if n in doomed and i == ops // 2:
+                halfway.wait()
+            roll = rng.random()
+            if roll < 0.4 or not mine:
+                r = call(c, "create", "POST", "/tickets", json={"title": f"u{n}-{i}"})
+                if r.status_code == 201:
+                    mine.append(r.get_json()["id"])
+                    created[n] += 1
+            elif roll < 0.65:
+                tid = rng.choice(mine)
+                r = call(c, "update", "PUT", f"/tickets/{tid}",
+                         json={"status": rng.choice(["open", "in-progress", "closed"])})
+            elif roll < 0.85:
+                tid = rng.choice(mine)
+                r = call(c, "comment", "POST", f"/tickets/{tid}/comments", json={"body": f"c{i}"})
+            elif roll < 0.95:
+                tid = mine.pop(rng.randrange(len(mine)))
+                r = call(c, "delete", "DELETE", f"/tickets/{tid}")
+                if r.status_code != 200:
+                    mine.append(tid)
+            else:
+                r = call(c, "list", "GET", "/tickets")
+            if n in doomed and r.status_code in (400, 401, 404):
+                # Пользователя удалили: сессия отозвана, автора или его
+                # заявок уже нет.
+                return
+            assert r.status_code < 400, (r.status_code, r.get_data(as_text=True))
+
+    def deleter():
+        halfway.wait()
+        c = admin_client()
+        for n in sorted(doomed):
+            uid = n + 2  # admin — 1, пользователи регистрируются по порядку
+            r = c.delete(f"/users/{uid}/delete")
+            stats.record("delete_user", r.status_code)
+            assert r.status_code == 200
+
+    # Пользователи регистрируются по очереди, чтобы id был предсказуем.
+    for n in range(users):
+        app.test_client().post("/api/register", json={"username": f"u{n}", "password": "pw"})
+
+    failures = []
+
+    def guarded(target, *args):
+        # Ошибка в потоке — запоминаем и отпускаем тех, кто ждёт у барьера.
+        def run():
+            try:
+                target(*args)
+            except BaseException as e:  # noqa: BLE001 — доложим в основном потоке
+                failures.append(e)
+                halfway.abort()
+        return threading.Thread(target=run)
+
+    threads = [guarded(user, n) for n in range(users)]
+    threads += [guarded(incrementer, n) for n in range(4)]
+    threads.append(guarded(deleter))
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    got_request_exception.disconnect(on_exception, app)
+    stats.report("threads")
+    if failures:
+        raise failures[0]
+
+    assert all(code < 500 for code in stats.statuses)
+    assert stats.lock_errors == 0
+
+    totals = _check_invariants(app)
+    with app.app_context():
+        shared_row = db.session.execute(
+            sa.text("SELECT description, version FROM ticket WHERE id = :id"), {"id": shared}
+        ).one()
+        assert int(shared_row.description) == sum(increments.values())
+        assert shared_row.version == 1 + sum(increments.values())
+
+        by_author = dict(db.session.execute(sa.text(
+            "SELECT u.username, count(t.id) FROM user u LEFT JOIN ticket t ON t.author_id = u.id GROUP BY u.id"
+        )).all())
+        for n in range(users):
+            if n in doomed:
+                assert f"u{n}" not in by_author
+            else:
+                assert by_author[f"u{n}"] == len(live[n])
+    # Итоги для отчётов учли каждую созданную заявку (и удалённые тоже).
+    assert totals["created"] == sum(created.values()) + 1
+
+
+# ============================================================
+#              ПРОЦЕССЫ ЧЕРЕЗ НАСТОЯЩИЙ СЕРВЕР
+# ============================================================
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _http_worker(base: str, n: int, ops: int, seed: int) -> dict:
+    # Клиент в отдельном процессе: свой cookie-jar, те же операции.
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    rng = random.Random(seed)
+    result = {"ops": Counter(), "statuses": Counter(), "created": [], "deleted": [], "versions": {}}
+
+    def call(op, method, url, body=None, headers=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(base + url, data=data, method=method, headers=headers or {})
+        if data is not None:
+            req.add_header("Content-Type", "application/json")
+        try:
+            with opener.open(req, timeout=30) as r:
+                status, payload, etag = r.status, r.read(), r.headers.get("ETag")
+        except urllib.error.HTTPError as e:
+            status, payload, etag = e.code, e.read(), None
+        result["ops"][op] += 1
+        result["statuses"][status] += 1
+        return status, (json.loads(payload) if payload else None), etag
+
+    call("register", "POST", "/register", {"username": f"p{n}", "password": "pw"})
+    call("login", "POST", "/login", {"username": f"p{n}", "password": "pw"})
+    for i in range(ops):
+        status, body, _ = call("create", "POST", "/tickets", {"title": f"p{n}-{i}"},
+                               {"Idempotency-Key": f"p{n}-{i}"})
+        if status != 201:
+            continue
+        tid = body["id"]
+        result["created"].append(tid)
+        # Повтор "после таймаута" не создаёт вторую заявку.
+        status, again, _ = call("create", "POST", "/tickets", {"title": f"p{n}-{i}"},
+                                {"Idempotency-Key": f"p{n}-{i}"})
+        assert again == body
+        status, _, etag = call("get", "GET", f"/tickets/{tid}")
+        status, _, _ = call("update", "PUT", f"/tickets/{tid}", {"title": f"p{n}-{i}!"}, {"If-Match": etag})
+        call("comment", "POST", f"/tickets/{tid}/comments", {"body": "hi"})
+        if rng.random() < 0.3:
+            call("delete", "DELETE", f"/tickets/{tid}")
+            result["deleted"].append(tid)
+        else:
+            result["versions"][tid] = 2 if status == 200 else 1
+    return result
+
+
+def test_processes_against_real_server(monkeypatch, tmp_path):
+    env = _env(monkeypatch, tmp_path, APP_MODE="api")
+    port = _free_port()
+    log_path = tmp_path / "server.log"
+    log = open(log_path, "wb")
+    server = subprocess.Popen(
+        [sys.executable, "run.py", "--workers", "2", "--port", str(port)],
+        cwd=ROOT,
+        env={**os.environ, **env},
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                urllib.request.urlopen(base + "/tickets", timeout=1)
+            except urllib.error.HTTPError:
+                break  # 401 — сервер отвечает
+            except OSError:
+                assert server.poll() is None, log_path.read_text()
+                assert time.time() < deadline, "сервер не запустился"
+                time.sleep(0.1)
+
+        stats = Stats()
+        processes = 4 * SCALE
+        ctx = multiprocessing.get_context("fork")
+        with ctx.Pool(processes) as pool:
+            results = pool.starmap(
+                _http_worker, [(base, n, 10 * SCALE, SEED * 1000 + n) for n in range(processes)]
+            )
+        for r in results:
+            stats.merge(r["ops"], r["statuses"])
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+        log.close()
+
+    # Ошибки блокировки сервер пишет в лог вместе с трассировкой.
+    stats.lock_errors = log_path.read_text().count("database is locked")
+    stats.report("processes")
+
+    assert all(code < 500 for code in stats.statuses), stats.statuses
+    assert stats.lock_errors == 0
+    app = create_app(mode="api")
+    totals = _check_invariants(app)
+    created = [tid for r in results for tid in r["created"]]
+    deleted = {tid for r in results for tid in r["deleted"]}
+    assert len(created) == len(set(created)) == processes * 10 * SCALE
+    assert totals["tickets"] == len(created) - len(deleted)
+    assert totals["created"] == len(created)
+    with app.app_context():
+        versions = dict(db.session.execute(sa.text("SELECT id, version FROM ticket")).all())
+    assert versions == {tid: v for r in results for tid, v in r["versions"].items()}
@@ -0,0 +1,86 @@
+# Тесты подписанных токенов доступа для API.
+from sqlalchemy import event
+
+from app import tokens
+from app.extensions import db
+
+
+def _token(client, username, password="pw"):
+    r = client.post("/token", json={"username": username, "password": password})
+    assert r.status_code == 200
+    return r.get_json()["access_token"]
+
+
+def _auth(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_bearer_token_works_without_session(app, client):
+    client.post("/register", json={"username": "svc", "password": "pw"})
+    token = _token(client, "svc")
+
+    # Новый клиент без cookie — только токен.
+    api = app.test_client()
+    r = api.post("/tickets", json={"title": "from service"}, headers=_auth(token))
+    assert r.status_code == 201
+
+    # Проверка токена не обращается к таблице user.
+    statements = []
+    with app.app_context():
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            r = api.get("/tickets", headers=_auth(token))
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+    assert r.status_code == 200
+    assert statements
+    assert not any('FROM "user"' in s or "FROM user" in s for s in statements)
+
+
+def test_bad_or_missing_token_is_rejected(app, client):
+    client.post("/register", json={"username": "svc", "password": "pw"})
+    token = _token(client, "svc")
+
+    api = app.test_client()
+    assert api.get("/tickets").status_code == 401
+    assert api.get("/tickets", headers=_auth(token[:-2] + "xx")).status_code == 401
+
+
+def test_malformed_and_non_ascii_tokens_are_rejected(app, client):
+    client.post("/register", json={"username": "svc", "password": "pw"})
+    kid, body, signature = _token(client, "svc").split(".")
+
+    api = app.test_client()
+    for bad in ("default.é.abc", f"{kid}.{body}.{signature[:-1]}é", "a.b", "a.b.c.d", f"{kid}.!!!.{signature}"):
+        assert api.get("/tickets", headers=_auth(bad)).status_code == 401
+    with app.app_context():
+        assert tokens.verify("default.\u0436.abc") is None
+        assert tokens.verify(f"{kid}.{body}.{signature}") is not None
+
+
+def test_key_rotation(app, client):
+    client.post("/register", json={"username": "svc", "password": "pw"})
+    app.extensions["token_keys"] = tokens.parse_keys("old:s1", "")
+    old_token = _token(client, "svc")
+
+    # Новый ключ стал основным, старый оставлен только для проверки.
+    app.extensions["token_keys"] = tokens.parse_keys("new:s2,old:s1", "")
+    assert old_token.startswith("old.")
+    assert _token(client, "svc").startswith("new.")
+    assert app.test_client().get("/tickets", headers=_auth(old_token)).status_code == 200
+
+    # Старый ключ убрали — старые токены больше не принимаются.
+    app.extensions["token_keys"] = tokens.parse_keys("new:s2", "")
+    assert app.test_client().get("/tickets", headers=_auth(old_token)).status_code == 401
+
+
+def test_role_change_revokes_token(app, client, login):
+    r = client.post("/register", json={"username": "svc", "password": "pw"})
+    user_id = r.get_json()["id"]
+    token = _token(client, "svc")
+
+    login(client, "admin", "adminpass")
+    client.put(f"/users/{user_id}", json={"role": "admin"})
+
+    assert app.test_client().get("/tickets", headers=_auth(token)).status_code == 401
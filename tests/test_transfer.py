@@ -0,0 +1,174 @@
+# Тесты экспорта и импорта пользователей и заявок.
+import json
+
+from app import create_app
+from app.extensions import db
+from app.models import User, Ticket
+
+
+def _fresh_app():
+    # Второе "окружение" — пустая база, куда переносим данные.
+    app = create_app(testing=True)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def test_export_ndjson_and_csv(client, login):
+    login(client, "bob")
+    client.post("/tickets", json={"title": "A", "description": "B"})
+    client.post("/logout")
+    login(client, "admin", "adminpass")
+
+    # NDJSON: одна строка — одна запись, читаем маленькими кусками.
+    r = client.get("/admin/export/users?format=ndjson&chunk_size=1")
+    assert r.status_code == 200
+    users = [json.loads(line) for line in r.get_data(as_text=True).splitlines()]
+    assert [u["username"] for u in users] == ["admin", "bob"]
+    assert all(u["password_hash"] for u in users)
+
+    # CSV: заголовок + строки.
+    r = client.get("/admin/export/tickets?format=csv")
+    lines = r.get_data(as_text=True).splitlines()
+    assert lines[0].startswith("id,title,description,status")
+    assert len(lines) == 2
+
+
+def test_export_forbidden_for_user(client, login):
+    login(client, "bob")
+    assert client.get("/admin/export/users").status_code == 403
+
+
+def test_import_keeps_password_hash_and_resumes(client, login):
+    login(client, "carol", "secret")
+    client.post("/tickets", json={"title": "T1"})
+    client.post("/tickets", json={"title": "T2"})
+    client.post("/logout")
+    login(client, "admin", "adminpass")
+    users = client.get("/admin/export/users?format=csv").get_data()
+    tickets = client.get("/admin/export/tickets").get_data()
+
+    target = _fresh_app()
+    tc = target.test_client()
+    with target.app_context():
+        admin = User(username="root", role="admin", password_hash="x")
+        db.session.add(admin)
+        db.session.commit()
+
+    # Входим во второе окружение как администратор (без проверки пароля).
+    with tc.session_transaction() as s:
+        s["_user_id"] = "1"
+
+    # Администратор "admin" (id=1) уже есть под именем root — пропускаем его строку.
+    r = tc.post("/admin/import/users?format=csv&offset=1", data=users)
+    assert r.status_code == 200
+    assert r.get_json() == {"imported": 1, "offset": 2}
+
+    # Первая попытка "оборвалась" после одной заявки: offset=1 в ответе.
+    first_line = tickets.splitlines(keepends=True)[0]
+    r = tc.post("/admin/import/tickets?batch_size=1", data=first_line)
+    assert r.get_json()["offset"] == 1
+
+    # Повторяем с полным файлом и offset — дубликатов нет.
+    r = tc.post("/admin/import/tickets?offset=1", data=tickets)
+    assert r.get_json() == {"imported": 1, "offset": 2}
+
+    with target.app_context():
+        assert Ticket.query.count() == 2
+        # Хеш перенесён без изменений — старый пароль подходит.
+        assert User.query.filter_by(username="carol").first().check_password("secret")
+
+
+def test_cli_import_uses_checkpoint(app, tmp_path):
+    path = tmp_path / "users.ndjson"
+    rows = [
+        {"id": 10 + i, "username": f"u{i}", "password_hash": "h", "role": "user"}
+        for i in range(5)
+    ]
+    path.write_text("".join(json.dumps(r) + "\n" for r in rows), encoding="utf-8")
+
+    # Контрольная точка говорит, что первые 3 строки уже импортированы.
+    checkpoint = tmp_path / "users.ndjson.checkpoint"
+    checkpoint.write_text(json.dumps({"kind": "users", "rows": 3}))
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=["import-data", "users", str(path), "--batch-size", "2"])
+    assert result.exit_code == 0, result.output
+
+    with app.app_context():
+        names = {u.username for u in User.query.all()}
+    assert names == {"admin", "u3", "u4"}
+    assert not checkpoint.exists()
+
+
+def test_cli_import_reports_bad_rows_and_keeps_checkpoint(app, tmp_path):
+    path = tmp_path / "users.ndjson"
+    rows = [json.dumps({"id": 10 + i, "username": f"u{i}", "password_hash": "h", "role": "user"}) for i in range(2)]
+    checkpoint = tmp_path / "users.ndjson.checkpoint"
+    runner = app.test_cli_runner()
+
+    # Испорченный JSON — ошибка с номером строки, а не трассировка;
+    # первая пачка сохранена, контрольная точка указывает на неё.
+    path.write_text(rows[0] + "\n\n{oops\n", encoding="utf-8")
+    result = runner.invoke(args=["import-data", "users", str(path), "--batch-size", "1"])
+    assert result.exit_code == 1 and "line 3" in result.output
+    assert json.loads(checkpoint.read_text())["rows"] == 1
+
+    # Повтор имени — ошибка с номерами строк пачки, точка не сдвинулась.
+    path.write_text(rows[0] + "\n" + rows[1].replace("u1", "u0") + "\n", encoding="utf-8")
+    result = runner.invoke(args=["import-data", "users", str(path), "--batch-size", "1"])
+    assert result.exit_code == 1 and "rows 2-2" in result.output
+    assert json.loads(checkpoint.read_text())["rows"] == 1
+
+    # Исправленный файл догружается с контрольной точки.
+    path.write_text(rows[0] + "\n" + rows[1] + "\n", encoding="utf-8")
+    result = runner.invoke(args=["import-data", "users", str(path)])
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        assert {u.username for u in User.query.all()} == {"admin", "u0", "u1"}
+
+
+def test_ticket_round_trip_keeps_assignment_version_and_sla(client, login):
+    login(client, "bob")
+    closed = client.post("/tickets", json={"title": "closed"}).get_json()["id"]
+    client.put(f"/tickets/{closed}", json={"status": "closed"})
+    client.post("/tickets", json={"title": "claimed"})
+    client.post("/logout")
+    login(client, "admin", "adminpass")
+    client.post("/tickets/claim")
+    users = client.get("/admin/export/users").get_data()
+    tickets = client.get("/admin/export/tickets?format=csv").get_data()
+    source = {t["id"]: t for t in client.get("/tickets").get_json()}
+
+    target = _fresh_app()
+    tc = target.test_client()
+    with tc.session_transaction() as s:
+        s["_user_id"] = "1"
+    with target.app_context():
+        db.session.add(User(id=1, username="root", role="admin", password_hash="x"))
+        db.session.commit()
+    tc.post("/admin/import/users?offset=1", data=users)
+    assert tc.post("/admin/import/tickets?format=csv", data=tickets).status_code == 200
+
+    with target.app_context():
+        for t in Ticket.query.all():
+            src = source[t.id]
+            assert t.assignee_id == src["assignee_id"] and t.version == src["version"]
+            assert (t.closed_at is None) == (src["status"] != "closed")
+            assert t.deadline is not None or src["status"] == "closed"
+        assert Ticket.query.filter(Ticket.assignee_id.is_not(None)).count() == 1
+
+
+def test_import_of_old_ticket_export_fills_new_columns(app, client, login):
+    login(client, "admin", "adminpass")
+    body = (
+        '{"id": 5, "title": "a", "description": "", "status": "open", '
+        '"created_at": "2026-01-01T00:00:00", "updated_at": "2026-01-01T00:00:00", "author_id": 1}\n'
+        '{"id": 6, "title": "b", "description": "", "status": "closed", '
+        '"created_at": "2026-01-01T00:00:00", "updated_at": "2026-01-02T00:00:00", "author_id": 1}\n'
+    )
+    assert client.post("/admin/import/tickets", data=body).status_code == 200
+    with app.app_context():
+        opened, closed = db.session.get(Ticket, 5), db.session.get(Ticket, 6)
+        assert opened.version == 1 and opened.deadline > opened.updated_at and opened.closed_at is None
+        assert closed.deadline is None and closed.closed_at == closed.updated_at
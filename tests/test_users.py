@@ -0,0 +1,83 @@
+# Тесты каталога пользователей: страницы по имени, поиск по началу имени,
+# число заявок одним запросом.
+import sqlalchemy as sa
+
+from app import services
+from app.extensions import db
+from app.models import Ticket, User
+
+
+def _fill(app, n):
+    with app.app_context():
+        db.session.execute(
+            User.__table__.insert(),
+            [{"username": f"user{i:03d}", "password_hash": "x", "role": "user"} for i in range(n)],
+        )
+        ids = dict(db.session.execute(sa.select(User.username, User.id)).all())
+        db.session.execute(
+            Ticket.__table__.insert(),
+            [
+                {"title": "t", "author_id": ids["user007"], "status": status, "version": 1,
+                 "comment_count": 0, "attachment_count": 0}
+                for status in ("open", "open", "closed")
+            ],
+        )
+        db.session.commit()
+
+
+def test_directory_pages_and_prefix_search(app, client, login):
+    _fill(app, 120)
+    login(client, "admin", "adminpass")
+
+    names, url = [], "/users?limit=50"
+    while url:
+        r = client.get(url)
+        names += [u["username"] for u in r.get_json()]
+        link = r.headers.get("Link")
+        url = link[1:link.index(">")] if link else None
+    assert names == sorted(["admin"] + [f"user{i:03d}" for i in range(120)])
+
+    found = client.get("/users?q=user00").get_json()
+    assert [u["username"] for u in found] == [f"user00{i}" for i in range(10)]
+    u7 = found[7]
+    assert (u7["tickets"], u7["open_tickets"]) == (3, 2)
+    assert found[0]["tickets"] == 0
+
+
+def test_directory_is_two_indexed_queries(app, login):
+    _fill(app, 120)
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        admin = User.query.filter_by(username="admin").one()
+        sa.event.listen(db.engine, "before_cursor_execute", record)
+        page, next_after = services.list_users(admin, "user", "user049", limit=20)
+        sa.event.remove(db.engine, "before_cursor_execute", record)
+
+        assert page[0]["username"] == "user050" and next_after == "user069"
+        # Пользователи страницы + один GROUP BY по их заявкам.
+        assert len(statements) == 2 and "GROUP BY" in statements[1]
+
+        # Диапазон по имени читается из уникального индекса username,
+        # уже в нужном порядке — без сортировки.
+        users_plan = " ".join(
+            row[-1]
+            for row in db.session.execute(
+                sa.text(
+                    "EXPLAIN QUERY PLAN SELECT id, username, role FROM user "
+                    "WHERE username >= 'user' AND username < 'user' || char(1114111) "
+                    "AND username > 'user049' ORDER BY username LIMIT 21"
+                )
+            )
+        )
+    assert "INDEX sqlite_autoindex_user_1" in users_plan and "TEMP B-TREE" not in users_plan
+
+
+def test_web_directory(web_client):
+    web_client.post("/web_login", data={"username": "admin", "password": "adminpass"})
+    web_client.post("/tickets", data={"title": "mine"})
+    page = web_client.get("/users?q=adm").get_data(as_text=True)
+    assert "<td>1 (1)</td>" in page and "Следующая страница" not in page
@@ -0,0 +1,85 @@
+# Тесты оптимистичной блокировки заявок.
+from app.extensions import db
+from app.models import Ticket
+
+
+def _create(client, login):
+    login(client, "bob")
+    return client.post("/tickets", json={"title": "T", "description": "D"}).get_json()["id"]
+
+
+def test_get_returns_version_and_etag(client, login):
+    tid = _create(client, login)
+    r = client.get(f"/tickets/{tid}")
+    assert r.get_json()["version"] == 1
+    assert r.headers["ETag"] == '"1"'
+
+
+def test_if_match_conflict_returns_412(client, login):
+    tid = _create(client, login)
+
+    # Первый клиент сохраняет изменения по версии 1.
+    r = client.put(f"/tickets/{tid}", json={"title": "A"}, headers={"If-Match": '"1"'})
+    assert r.status_code == 200
+    assert r.headers["ETag"] == '"2"'
+
+    # Второй клиент тоже видел версию 1 — его изменение отклоняется.
+    r = client.put(f"/tickets/{tid}", json={"title": "B"}, headers={"If-Match": '"1"'})
+    assert r.status_code == 412
+    assert r.get_json()["version"] == 2
+    assert client.get(f"/tickets/{tid}").get_json()["title"] == "A"
+
+
+def test_body_version_conflict_returns_409(client, login):
+    tid = _create(client, login)
+    assert client.put(f"/tickets/{tid}", json={"status": "closed", "version": 1}).status_code == 200
+    assert client.put(f"/tickets/{tid}", json={"status": "open", "version": 1}).status_code == 409
+
+
+def test_update_without_version_still_bumps_it(client, login):
+    tid = _create(client, login)
+    client.put(f"/tickets/{tid}", json={"title": "A"})
+    client.put(f"/tickets/{tid}", json={"title": "B"})
+    assert client.get(f"/tickets/{tid}").get_json()["version"] == 3
+
+
+def test_web_edit_conflict(web_client):
+    web_client.post("/web_login", data={"username": "admin", "password": "adminpass"})
+    web_client.post("/tickets", data={"title": "old"})
+
+    # Две вкладки открыли форму с версией 1.
+    r = web_client.post("/tickets/1/edit", data={"title": "first", "description": "x", "version": "1"})
+    assert r.status_code == 302
+    r = web_client.post("/tickets/1/edit", data={"title": "second", "description": "y", "version": "1"})
+    assert r.status_code == 409
+    page = r.get_data(as_text=True)
+    assert 'value="first"' in page and 'name="version" value="2"' in page
+
+    r = web_client.post("/tickets/1/update", data={"status": "closed", "version": "1"})
+    assert r.status_code == 409
+
+
+def test_web_changes_of_foreign_ticket_are_refused(web_app):
+    admin, bob = web_app.test_client(), web_app.test_client()
+    admin.post("/web_login", data={"username": "admin", "password": "adminpass"})
+    admin.post("/tickets", data={"title": "admin's"})
+    bob.post("/web_register", data={"username": "bob", "password": "pw"})
+    bob.post("/web_login", data={"username": "bob", "password": "pw"})
+
+    # И пустая форма, и форма с изменениями — отказ, как во всём
+    # веб-интерфейсе: сообщение и редирект; заявка не тронута.
+    attempts = [("edit", {"title": "", "description": ""}), ("edit", {"title": "mine", "description": "x"})]
+    attempts += [("update", {}), ("update", {"status": "closed"})]
+    with bob.session_transaction() as s:
+        s.pop("_flashes", None)
+    for action, data in attempts:
+        assert bob.post(f"/tickets/1/{action}", data=data).status_code == 302
+        with bob.session_transaction() as s:
+            messages = [m for _, m in s.pop("_flashes", [])]
+        assert len(messages) == 1 and messages[0].startswith("Нет прав")
+    # Несуществующая заявка — 404 и без статуса в форме.
+    assert bob.post("/tickets/99/update", data={}).status_code == 404
+    assert bob.post("/tickets/99/edit", data={"title": "", "description": ""}).status_code == 404
+    with web_app.app_context():
+        t = db.session.get(Ticket, 1)
+        assert (t.title, t.status, t.version) == ("admin's", "open", 1)